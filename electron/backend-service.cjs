@@ -3,6 +3,12 @@ const { spawn } = require('child_process')
 const path = require('path')
 const { EventEmitter } = require('events')
 
+// 二进制分帧协议: [1 字节类型][4 字节大端长度][payload]
+// 'J' = UTF-8 JSON 消息, 'B' = 原始二进制附件 (例如图片字节)
+const FRAME_JSON = 0x4a
+const FRAME_BLOB = 0x42
+const FRAME_HEADER_SIZE = 5
+
 class BackendService extends EventEmitter {
     constructor(modelPath) {
         super()
@@ -11,7 +17,9 @@ class BackendService extends EventEmitter {
         this.isReady = false
         this.pendingRequests = new Map()
         this.requestId = 0
-        this.responseBuffer = ''
+        this.responseBuffer = Buffer.alloc(0)
+        // 启动时默认使用行协议，后端握手成功后切换为 'framed'
+        this.protocol = 'line'
     }
 
     start() {
@@ -39,6 +47,49 @@ class BackendService extends EventEmitter {
             args.push('--model-dir', this.modelPath)
         }
 
+        // 设置 MANGAREADER_OCR_BACKEND=onnx / onnx-int8 时使用 onnxruntime 推理 OCR
+        if (process.env.MANGAREADER_OCR_BACKEND) {
+            args.push('--ocr-backend', process.env.MANGAREADER_OCR_BACKEND)
+        }
+
+        // 设置 MANGAREADER_TRANSLATOR_WORKERS=N 时使用 N 个翻译子进程并行翻译
+        if (process.env.MANGAREADER_TRANSLATOR_WORKERS) {
+            args.push('--translator-workers', process.env.MANGAREADER_TRANSLATOR_WORKERS)
+        }
+
+        // 空闲多少秒后卸载模型 (0 表示常驻)，以及模型总内存预算 (MB)
+        if (process.env.MANGAREADER_IDLE_UNLOAD) {
+            args.push('--idle-unload', process.env.MANGAREADER_IDLE_UNLOAD)
+        }
+        if (process.env.MANGAREADER_MEMORY_BUDGET) {
+            args.push('--memory-budget', process.env.MANGAREADER_MEMORY_BUDGET)
+        }
+
+        // 日志级别：设置 MANGAREADER_LOG_LEVEL=debug 时输出调试日志 (默认 info)
+        if (process.env.MANGAREADER_LOG_LEVEL) {
+            args.push('--log-level', process.env.MANGAREADER_LOG_LEVEL)
+        }
+        // 设置 MANGAREADER_LOG_CAPTURE=debug 时，stderr 上不显示的调试日志也保留给 logs 命令
+        if (process.env.MANGAREADER_LOG_CAPTURE) {
+            args.push('--log-capture', process.env.MANGAREADER_LOG_CAPTURE)
+        }
+
+        // 设置 MANGAREADER_HF_ENDPOINT 时从镜像站 (或本地测试服务器) 下载模型
+        if (process.env.MANGAREADER_HF_ENDPOINT) {
+            args.push('--hf-endpoint', process.env.MANGAREADER_HF_ENDPOINT)
+        }
+
+        // 请求使用二进制分帧协议；旧版后端会忽略该参数并继续使用行协议
+        args.push('--ipc-protocol', 'framed')
+
+        // 设置 MANGAREADER_PROFILE_STARTUP=1 时记录启动各阶段耗时，报告写在 models 目录下
+        if (process.env.MANGAREADER_PROFILE_STARTUP) {
+            args.push('--profile-startup')
+            if (this.modelPath) {
+                args.push('--profile-output', path.join(path.dirname(this.modelPath), 'startup-metrics.json'))
+            }
+        }
+
         console.log('[INFO] Starting OCR service...')
         console.log('[INFO] Model Path:', this.modelPath)
 
@@ -54,7 +105,7 @@ class BackendService extends EventEmitter {
         })
 
         this.process.stdin.setDefaultEncoding('utf-8')
-        this.process.stdout.setEncoding('utf-8')
+        // stdout 保持 Buffer，以便在握手后解析二进制帧
         this.process.stderr.setEncoding('utf-8')
 
         // 监听日志 (stderr)
@@ -67,21 +118,8 @@ class BackendService extends EventEmitter {
 
         // 监听数据 (stdout)
         this.process.stdout.on('data', (data) => {
-            this.responseBuffer += data
-            const lines = this.responseBuffer.split('\n')
-            this.responseBuffer = lines.pop() || ''
-
-            lines.forEach(line => {
-                line = line.trim()
-                if (!line) return
-                try {
-                    const response = JSON.parse(line)
-                    this._handleResponse(response)
-                } catch (e) {
-                    console.error('[JSON Parse Error]', e, 'Line:', line)
-                    this.emit('log', `[JSON Parse Error] ${e.message} Line: ${line}`)
-                }
-            })
+            this.responseBuffer = Buffer.concat([this.responseBuffer, data])
+            this._drainResponses()
         })
 
         this.process.on('error', (err) => {
@@ -98,6 +136,85 @@ class BackendService extends EventEmitter {
         })
     }
 
+    _drainResponses() {
+        // 行协议：逐行解析，直到收到切换到分帧协议的握手消息
+        while (this.protocol === 'line') {
+            const newline = this.responseBuffer.indexOf(0x0a)
+            if (newline === -1) return
+
+            const line = this.responseBuffer.subarray(0, newline).toString('utf-8').trim()
+            this.responseBuffer = this.responseBuffer.subarray(newline + 1)
+            if (!line) continue
+
+            try {
+                const response = JSON.parse(line)
+                if (response.type === 'protocol' && response.protocol === 'framed') {
+                    console.log('[Backend Service] [INFO] Switched to framed IPC protocol')
+                    this.protocol = 'framed'
+                    continue
+                }
+                this._handleResponse(response)
+            } catch (e) {
+                console.error('[JSON Parse Error]', e, 'Line:', line)
+                this.emit('log', `[JSON Parse Error] ${e.message} Line: ${line}`)
+            }
+        }
+
+        // 分帧协议：按长度前缀切出完整的帧
+        while (this.responseBuffer.length >= FRAME_HEADER_SIZE) {
+            const kind = this.responseBuffer[0]
+            const length = this.responseBuffer.readUInt32BE(1)
+            if (this.responseBuffer.length < FRAME_HEADER_SIZE + length) return
+
+            const payload = this.responseBuffer.subarray(FRAME_HEADER_SIZE, FRAME_HEADER_SIZE + length)
+            this.responseBuffer = this.responseBuffer.subarray(FRAME_HEADER_SIZE + length)
+
+            if (kind !== FRAME_JSON) {
+                console.warn(`[Backend Service] [WARN] Dropping unexpected frame type: ${kind}`)
+                continue
+            }
+            try {
+                this._handleResponse(JSON.parse(payload.toString('utf-8')))
+            } catch (e) {
+                console.error('[JSON Parse Error]', e)
+                this.emit('log', `[JSON Parse Error] ${e.message}`)
+            }
+        }
+    }
+
+    _encodeFrame(kind, payload) {
+        const header = Buffer.alloc(FRAME_HEADER_SIZE)
+        header[0] = kind
+        header.writeUInt32BE(payload.length, 1)
+        return Buffer.concat([header, payload])
+    }
+
+    // Data URL / Base64 -> 原始字节 (分帧协议下图片作为附件单独传输)
+    _imageToBuffer(image) {
+        // 原始像素已经是 Buffer，直接作为附件发送
+        if (Buffer.isBuffer(image)) return image
+        const base64 = image.includes(',') ? image.split(',', 2)[1] : image
+        return Buffer.from(base64, 'base64')
+    }
+
+    _writeRequest(request, attachments) {
+        if (this.protocol === 'framed') {
+            const frames = [
+                this._encodeFrame(FRAME_JSON, Buffer.from(JSON.stringify({ ...request, attachments: attachments.length }), 'utf-8')),
+                ...attachments.map(blob => this._encodeFrame(FRAME_BLOB, blob))
+            ]
+            this.process.stdin.write(Buffer.concat(frames))
+            return
+        }
+
+        // [Fix Encoding] 使用 Base64 传输，彻底避免 Windows 管道编码问题
+        const jsonStr = JSON.stringify(request)
+        const base64Str = Buffer.from(jsonStr, 'utf-8').toString('base64')
+
+        console.log(`[Backend Service] [DEBUG] Writing Base64 payload to stdin (Length: ${base64Str.length})`)
+        this.process.stdin.write(base64Str + '\n')
+    }
+
     _handleResponse(response) {
         // console.log('[Backend Service] [DEBUG] Raw response object:', JSON.stringify(response).substring(0, 100) + '...')
 
@@ -130,7 +247,59 @@ class BackendService extends EventEmitter {
             return
         }
 
-        const { id, success, text, tokens, translation, exists, error } = response
+        if (response.type === 'init_metrics') {
+            console.log(`[Backend Service] [INFO] Startup metrics: total ${response.total_ms}ms`)
+            this.emit('init-metrics', response)
+            return
+        }
+
+        // 硬件调优 (tune 命令) 的进度
+        if (response.type === 'tune_progress') {
+            this.emit('tune-progress', { stage: response.stage, message: response.message })
+            return
+        }
+
+        // 各引擎 (ocr / tokenizer) 在后台加载完成或失败
+        if (response.type === 'engine_ready' || response.type === 'engine_error') {
+            this.emit('engine-status', {
+                engine: response.engine,
+                ready: response.type === 'engine_ready',
+                message: response.message
+            })
+            return
+        }
+
+        // 引擎因空闲或内存预算被卸载，下次使用时自动重新加载
+        if (response.type === 'engine_unloaded') {
+            this.emit('engine-status', {
+                engine: response.engine,
+                ready: false,
+                unloaded: true,
+                message: response.reason
+            })
+            return
+        }
+
+        // 流式翻译的增量结果：交给发起请求时注册的回调，不结束请求
+        if (response.type === 'translation_partial') {
+            const pending = this.pendingRequests.get(response.id)
+            if (pending && pending.onPartial) {
+                pending.onPartial({ delta: response.delta, text: response.text })
+            }
+            return
+        }
+
+        // 整页分析中某个区域完成了一个阶段 (ocr / tokenize / translate)
+        if (response.type === 'page_region') {
+            const pending = this.pendingRequests.get(response.id)
+            if (pending && pending.onPartial) {
+                const { id, type, ...region } = response
+                pending.onPartial(region)
+            }
+            return
+        }
+
+        const { id, success, text, texts, tokens, batch_tokens, translation, translations, regions, profile, stats, entries, exists, error } = response
 
         if (id !== undefined && this.pendingRequests.has(id)) {
             console.log(`[Backend Service] [DEBUG] Resolving request ID: ${id}, Success: ${success}`)
@@ -138,24 +307,43 @@ class BackendService extends EventEmitter {
             this.pendingRequests.delete(id)
 
             if (success) {
-                if (tokens) {
+                if (regions) {
+                    resolve({ regions: regions, width: response.width, height: response.height })
+                } else if (tokens) {
                     resolve({ tokens: tokens })
+                } else if (texts) {
+                    resolve({ texts: texts })
+                } else if (batch_tokens) {
+                    resolve({ batchTokens: batch_tokens })
+                } else if (translations) {
+                    resolve({ translations: translations })
                 } else if (translation) {
                     resolve({ translation: translation })
+                } else if (stats) {
+                    resolve({ stats: stats })
+                } else if (entries) {
+                    resolve({ entries: entries, logging: response.logging })
+                } else if (profile) {
+                    resolve({ profile: profile })
                 } else if (exists !== undefined) {
                     resolve({ exists })
                 } else {
                     resolve(text || true)
                 }
             } else {
-                reject(new Error(error))
+                const err = new Error(error)
+                // 被 cancel 命令或更新的请求取代
+                err.cancelled = response.cancelled === true
+                reject(err)
             }
         } else if (id !== undefined) {
             console.warn(`[Backend Service] [WARN] Received response for unknown ID: ${id}`)
         }
     }
 
-    _sendRequest(payload, timeout = 120000) {
+    // images: 需要发送的图片字段名，分帧协议下会被拆为二进制附件
+    // onPartial: 流式请求的增量回调
+    _sendRequest(payload, timeout = 120000, images = null, onPartial = null) {
         return new Promise((resolve, reject) => {
             if (!this.isReady) {
                 console.warn('[Backend Service] [WARN] Service not ready, rejecting request.')
@@ -164,7 +352,7 @@ class BackendService extends EventEmitter {
             }
 
             const id = this.requestId++
-            this.pendingRequests.set(id, { resolve, reject })
+            this.pendingRequests.set(id, { resolve, reject, onPartial })
 
             // 合并 ID 和 具体的请求数据
             const request = { ...payload, id }
@@ -172,12 +360,13 @@ class BackendService extends EventEmitter {
             console.log(`[Backend Service] [DEBUG] Sending request ID: ${id}, Command: ${payload.command}`)
 
             try {
-                // [Fix Encoding] 使用 Base64 传输，彻底避免 Windows 管道编码问题
-                const jsonStr = JSON.stringify(request)
-                const base64Str = Buffer.from(jsonStr, 'utf-8').toString('base64')
-
-                console.log(`[Backend Service] [DEBUG] Writing Base64 payload to stdin (Length: ${base64Str.length})`)
-                this.process.stdin.write(base64Str + '\n')
+                let attachments = []
+                if (images && this.protocol === 'framed') {
+                    const list = Array.isArray(request[images]) ? request[images] : [request[images]]
+                    attachments = list.map(image => this._imageToBuffer(image))
+                    delete request[images]
+                }
+                this._writeRequest(request, attachments)
             } catch (e) {
                 console.error('[Backend Service] [ERROR] Failed to write to stdin:', e)
                 this.pendingRequests.delete(id)
@@ -199,7 +388,20 @@ class BackendService extends EventEmitter {
     // 1. OCR 识别
     async recognize(imageBase64) {
         // 调用通用方法
-        return this._sendRequest({ command: 'recognize', image: imageBase64 })
+        return this._sendRequest({ command: 'recognize', image: imageBase64 }, 120000, 'image')
+    }
+
+    // 1.1 原始像素 OCR：跳过 PNG 编码 / 解码，pixels 为 Uint8Array (默认 RGBA，如 Canvas ImageData)
+    async recognizeRaw(pixels, width, height, format = 'rgba') {
+        const buffer = Buffer.from(pixels.buffer, pixels.byteOffset, pixels.byteLength)
+        // 行协议只能传文本，退回 Base64
+        const image = this.protocol === 'framed' ? buffer : buffer.toString('base64')
+        return this._sendRequest({ command: 'recognize', image, raw: { width, height, format } }, 120000, 'image')
+    }
+
+    // 1.2 批量 OCR 识别 (一页中的多个气泡一次推理完成)
+    async recognizeBatch(imagesBase64) {
+        return this._sendRequest({ command: 'recognize_batch', images: imagesBase64 }, 120000, 'images')
     }
 
     // 2. 分词
@@ -210,11 +412,38 @@ class BackendService extends EventEmitter {
         return this._sendRequest({ command: 'tokenize', text: text }, 30000)
     }
 
+    // 2.1 批量分词 (一页的 OCR 结果一次完成)
+    async tokenizeBatch(texts) {
+        return this._sendRequest({ command: 'tokenize_batch', texts: texts }, 30000)
+    }
+
     // 3. 翻译
-    async translate(text) {
+    // supersede: 分组名，同组的新请求会自动取消仍在排队或执行中的旧请求
+    async translate(text, supersede = null) {
         console.log(`[Backend Service] [DEBUG] translate() called with text length: ${text.length}`)
         // 超时设长一点，因为第一次要下载模型 (比如 10分钟 = 600000ms)
-        return this._sendRequest({ command: 'translate', text: text }, 600000)
+        return this._sendRequest({ command: 'translate', text: text, supersede }, 600000)
+    }
+
+    // 3.1 流式翻译：onPartial({ delta, text }) 会在每段译文生成时被调用
+    async translateStream(text, onPartial, supersede = null) {
+        return this._sendRequest({ command: 'translate', text: text, stream: true, supersede }, 600000, null, onPartial)
+    }
+
+    // 3.2 批量翻译 (一页中的所有气泡在同一个 prompt 中翻译)
+    async translateBatch(texts, supersede = null) {
+        return this._sendRequest({ command: 'translate_batch', texts: texts, supersede }, 600000)
+    }
+
+    // 4. 整页分析：检测文字区域后依次 OCR、分词、翻译
+    // onRegion({ stage, index, bbox, text, tokens, translation }) 会在每个区域完成一个阶段时被调用
+    async analyzePage(imageBase64, onRegion = null, supersede = null) {
+        return this._sendRequest({ command: 'analyze_page', image: imageBase64, supersede }, 600000, 'image', onRegion)
+    }
+
+    // 取消指定 ID 的请求 (排队中直接丢弃，执行中的翻译会在下一个 token 处中止)
+    async cancel(targetId) {
+        return this._sendRequest({ command: 'cancel', target: targetId }, 10000)
     }
 
     async checkModel() {
@@ -230,6 +459,21 @@ class BackendService extends EventEmitter {
         return this._sendRequest({ command: 'delete_model' }, 20000)
     }
 
+    // 运行时诊断指标 (命令延迟直方图、锁等待、缓存命中率、内存)
+    async stats() {
+        return this._sendRequest({ command: 'stats' }, 10000)
+    }
+
+    // 后端最近的日志 (环形缓冲区)，level 为最低级别 (debug / info / warn / error)
+    async logs(limit = 500, level = 'debug') {
+        return this._sendRequest({ command: 'logs', limit, level }, 10000)
+    }
+
+    // 硬件调优：逐组加载模型测速，可能需要几分钟
+    async tune() {
+        return this._sendRequest({ command: 'tune' }, 1800000)
+    }
+
     stop() {
         if (this.process) this.process.kill()
     }
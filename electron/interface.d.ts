@@ -6,6 +6,24 @@ export interface Token {
     dictionary_form?: string
 }
 
+// 整页分析中的一个文字区域，bbox 为原图坐标 [x0, y0, x1, y1]
+export interface PageRegion {
+    index: number
+    bbox: [number, number, number, number]
+    text: string | null
+    tokens?: Token[]
+    translation?: string
+    error?: string
+}
+
+// 后端日志环形缓冲区中的一条记录
+export interface BackendLogEntry {
+    time: number
+    level: 'DEBUG' | 'INFO' | 'WARN' | 'ERROR'
+    thread: string
+    message: string
+}
+
 // 定义设置对象的接口
 export interface AppSettings {
     enableTranslation: boolean
@@ -27,11 +45,27 @@ export interface IElectronAPI {
         text?: string
         error?: string
     }>
+    // 原始 RGBA 像素 (Canvas ImageData)，省去 PNG 编码与 Base64
+    recognizeRaw: (pixels: Uint8Array | Uint8ClampedArray, width: number, height: number) => Promise<{
+        success: boolean
+        text?: string
+        error?: string
+    }>
+    recognizeBatch: (imagesBase64: string[]) => Promise<{
+        success: boolean
+        texts?: string[]
+        error?: string
+    }>
     tokenize: (text: string) => Promise<{
         success: boolean
         tokens?: Token[]
         error?: string
     }>
+    tokenizeBatch: (texts: string[]) => Promise<{
+        success: boolean
+        batchTokens?: Token[][]
+        error?: string
+    }>
 
     // 窗口控制
     minimizeWindow: () => void
@@ -56,14 +90,27 @@ export interface IElectronAPI {
     checkModel: () => Promise<{ success: boolean; exists?: boolean; error?: string }>
     downloadModel: () => Promise<{ success: boolean; error?: string }>
     deleteModel: () => Promise<{ success: boolean; error?: string }>
-    translate: (text: string) => Promise<{ success: boolean; translation?: string; error?: string }>
+    tune: () => Promise<{ success: boolean; profile?: Record<string, unknown>; error?: string }>
+    translate: (text: string) => Promise<{ success: boolean; translation?: string; error?: string; cancelled?: boolean }>
+    translateBatch: (texts: string[]) => Promise<{ success: boolean; translations?: string[]; error?: string; cancelled?: boolean }>
+    translateStream: (text: string) => Promise<{ success: boolean; translation?: string; error?: string; cancelled?: boolean }>
+    onTranslationPartial: (callback: (partial: { delta: string, text: string }) => void) => () => void
+
+    // 整页分析：检测文字区域后依次 OCR、分词、翻译
+    analyzePage: (imageBase64: string) => Promise<{ success: boolean; regions?: PageRegion[]; width?: number; height?: number; error?: string; cancelled?: boolean }>
+    onPageRegion: (callback: (region: PageRegion & { stage: 'ocr' | 'tokenize' | 'translate' }) => void) => () => void
 
     // 后端状态检查
     checkBackendReady: () => Promise<boolean>
+    getStats: () => Promise<{ success: boolean; stats?: Record<string, unknown>; error?: string }>
+    dumpStats: () => Promise<{ success: boolean; path?: string; error?: string }>
+    getLogs: (limit?: number, level?: 'debug' | 'info' | 'warn' | 'error') => Promise<{ success: boolean; entries?: BackendLogEntry[]; error?: string }>
 
     onDownloadProgress: (callback: (percent: number) => void) => () => void
     onInitStatus: (callback: (msg: string) => void) => () => void
     onInitProgress: (callback: (data: { percent: number, message: string }) => void) => () => void
+    onEngineStatus: (callback: (data: { engine: 'ocr' | 'tokenizer' | 'translator', ready: boolean, unloaded?: boolean, message?: string }) => void) => () => void
+    onTuneProgress: (callback: (data: { stage: 'translator' | 'ocr', message: string }) => void) => () => void
 }
 
 declare global {
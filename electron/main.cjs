@@ -225,6 +225,56 @@ ipcMain.handle('ocr:recognize', async (event, imageBase64) => {
     }
 })
 
+// 原始像素 OCR 请求：渲染进程直接传来 Canvas 的 RGBA 像素，无需 PNG 编码
+ipcMain.handle('ocr:recognize-raw', async (event, pixels, width, height) => {
+    try {
+        if (!backendService || !backendService.isReady) {
+            return {
+                success: false,
+                error: 'OCR service not ready. Please wait...'
+            }
+        }
+
+        const text = await backendService.recognizeRaw(pixels, width, height)
+
+        return {
+            success: true,
+            text: text
+        }
+    } catch (error) {
+        console.error('OCR recognition error:', error)
+        return {
+            success: false,
+            error: error.message
+        }
+    }
+})
+
+// 批量 OCR 识别请求
+ipcMain.handle('ocr:recognize-batch', async (event, imagesBase64) => {
+    try {
+        if (!backendService || !backendService.isReady) {
+            return {
+                success: false,
+                error: 'OCR service not ready. Please wait...'
+            }
+        }
+
+        const result = await backendService.recognizeBatch(imagesBase64)
+
+        return {
+            success: true,
+            texts: result.texts
+        }
+    } catch (error) {
+        console.error('OCR batch recognition error:', error)
+        return {
+            success: false,
+            error: error.message
+        }
+    }
+})
+
 // 分词请求
 ipcMain.handle('ocr:tokenize', async (event, text) => {
     try {
@@ -243,14 +293,67 @@ ipcMain.handle('ocr:tokenize', async (event, text) => {
     }
 })
 
+// 批量分词请求
+ipcMain.handle('ocr:tokenize-batch', async (event, texts) => {
+    try {
+        if (!backendService) return { success: false, error: "Service not ready" }
+        const result = await backendService.tokenizeBatch(texts)
+        return { success: true, batchTokens: result.batchTokens }
+    } catch (e) {
+        return { success: false, error: e.message }
+    }
+})
+
 // 翻译请求
 ipcMain.handle('ocr:translate', async (event, text) => {
     try {
         if (!backendService) return { success: false, error: "Service not ready" }
-        const result = await backendService.translate(text)
+        // 同一窗口的新翻译请求会取代旧请求，避免旧请求占用 CPU
+        const result = await backendService.translate(text, `translate-${event.sender.id}`)
         return { success: true, translation: result.translation }
     } catch (e) {
-        return { success: false, error: e.message }
+        return { success: false, error: e.message, cancelled: e.cancelled === true }
+    }
+})
+
+// 批量翻译请求：结果顺序与 texts 一致
+ipcMain.handle('ocr:translate-batch', async (event, texts) => {
+    try {
+        if (!backendService) return { success: false, error: "Service not ready" }
+        const result = await backendService.translateBatch(texts, `translate-${event.sender.id}`)
+        return { success: true, translations: result.translations }
+    } catch (e) {
+        return { success: false, error: e.message, cancelled: e.cancelled === true }
+    }
+})
+
+// 流式翻译请求：增量结果通过 ocr:translation-partial 推送给渲染进程
+ipcMain.handle('ocr:translate-stream', async (event, text) => {
+    try {
+        if (!backendService) return { success: false, error: "Service not ready" }
+        const result = await backendService.translateStream(text, (partial) => {
+            if (!event.sender.isDestroyed()) {
+                event.sender.send('ocr:translation-partial', partial)
+            }
+        }, `translate-${event.sender.id}`)
+        return { success: true, translation: result.translation }
+    } catch (e) {
+        return { success: false, error: e.message, cancelled: e.cancelled === true }
+    }
+})
+
+// 整页分析：每个区域完成一个阶段时通过 ocr:page-region 推送给渲染进程
+ipcMain.handle('ocr:analyze-page', async (event, imageBase64) => {
+    try {
+        if (!backendService) return { success: false, error: "Service not ready" }
+        const result = await backendService.analyzePage(imageBase64, (region) => {
+            if (!event.sender.isDestroyed()) {
+                event.sender.send('ocr:page-region', region)
+            }
+        }, `analyze-${event.sender.id}`)
+        return { success: true, regions: result.regions, width: result.width, height: result.height }
+    } catch (e) {
+        return { success: false, error: e.message, cancelled: e.cancelled === true }
     }
 })
 
@@ -287,6 +390,17 @@ ipcMain.handle('model:delete', async () => {
     }
 })
 
+// 硬件调优：结果保存在 models/tuning_profile.json，下次启动时自动应用
+ipcMain.handle('model:tune', async () => {
+    try {
+        if (!backendService) return { success: false, error: "Service not ready" }
+        const result = await backendService.tune()
+        return { success: true, profile: result.profile }
+    } catch (e) {
+        return { success: false, error: e.message }
+    }
+})
+
 // 窗口控制 IPC 监听器 监听渲染进程发送的事件
 ipcMain.on('window:minimize', () => {
     if (mainWindow) {
@@ -375,6 +489,20 @@ app.whenReady().then(async () => {
             }
         })
 
+        // 转发各引擎的加载状态
+        backendService.on('engine-status', (data) => {
+            if (mainWindow && !mainWindow.isDestroyed()) {
+                mainWindow.webContents.send('backend:engine-status', data)
+            }
+        })
+
+        // 转发硬件调优进度
+        backendService.on('tune-progress', (data) => {
+            if (mainWindow && !mainWindow.isDestroyed()) {
+                mainWindow.webContents.send('backend:tune-progress', data)
+            }
+        })
+
         // 转发后端日志到前端
         backendService.on('log', (msg) => {
             if (mainWindow && !mainWindow.isDestroyed()) {
@@ -396,6 +524,44 @@ app.whenReady().then(async () => {
             return backendService ? backendService.isReady : false
         })
 
+        // 诊断面板：读取后端运行时指标
+        ipcMain.handle('backend:stats', async () => {
+            try {
+                if (!backendService) return { success: false, error: "Service not ready" }
+                const result = await backendService.stats()
+                return { success: true, stats: result.stats }
+            } catch (e) {
+                return { success: false, error: e.message }
+            }
+        })
+
+        // 后端最近的日志，用于问题报告
+        ipcMain.handle('backend:logs', async (event, limit, level) => {
+            try {
+                if (!backendService) return { success: false, error: "Service not ready" }
+                const result = await backendService.logs(limit, level)
+                return { success: true, entries: result.entries }
+            } catch (e) {
+                return { success: false, error: e.message }
+            }
+        })
+
+        // 把运行时指标与最近的日志写入 userData/diagnostics 下的 JSON 文件，返回文件路径
+        ipcMain.handle('backend:dump-stats', async () => {
+            try {
+                if (!backendService) return { success: false, error: "Service not ready" }
+                const result = await backendService.stats()
+                const logs = await backendService.logs()
+                const dir = path.join(app.getPath('userData'), 'diagnostics')
+                fs.mkdirSync(dir, { recursive: true })
+                const filePath = path.join(dir, `stats-${new Date().toISOString().replace(/[:.]/g, '-')}.json`)
+                fs.writeFileSync(filePath, JSON.stringify({ ...result.stats, logs: logs.entries }, null, 2), 'utf-8')
+                return { success: true, path: filePath }
+            } catch (e) {
+                return { success: false, error: e.message }
+            }
+        })
+
         // 快捷键设置
         ipcMain.handle('settings:set-shortcut', (event, shortcut) => {
             // 1. 无论如何，先清除所有旧的快捷键，防止冲突或残留
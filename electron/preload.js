@@ -17,11 +17,35 @@ contextBridge.exposeInMainWorld('electronAPI', {
         return ipcRenderer.invoke('ocr:recognize', imageBase64)
     },
 
+    // 原始像素 OCR (pixels 为 RGBA 的 Uint8Array / Uint8ClampedArray)
+    recognizeRaw: (pixels, width, height) => ipcRenderer.invoke('ocr:recognize-raw', pixels, width, height),
+
+    // 批量 OCR 识别
+    recognizeBatch: (imagesBase64) => ipcRenderer.invoke('ocr:recognize-batch', imagesBase64),
+
     // 分词识别
     tokenize: (text) => ipcRenderer.invoke('ocr:tokenize', text),
+    tokenizeBatch: (texts) => ipcRenderer.invoke('ocr:tokenize-batch', texts),
 
     // 翻译
     translate: (text) => ipcRenderer.invoke('ocr:translate', text),
+    translateBatch: (texts) => ipcRenderer.invoke('ocr:translate-batch', texts),
+
+    // 流式翻译 (增量结果通过 onTranslationPartial 接收)
+    translateStream: (text) => ipcRenderer.invoke('ocr:translate-stream', text),
+    onTranslationPartial: (callback) => {
+        const handler = (_event, partial) => callback(partial)
+        ipcRenderer.on('ocr:translation-partial', handler)
+        return () => ipcRenderer.removeListener('ocr:translation-partial', handler)
+    },
+
+    // 整页分析 (每个区域的阶段结果通过 onPageRegion 接收)
+    analyzePage: (imageBase64) => ipcRenderer.invoke('ocr:analyze-page', imageBase64),
+    onPageRegion: (callback) => {
+        const handler = (_event, region) => callback(region)
+        ipcRenderer.on('ocr:page-region', handler)
+        return () => ipcRenderer.removeListener('ocr:page-region', handler)
+    },
 
     // 窗口控制 声明给渲染进程
     minimizeWindow: () => ipcRenderer.send('window:minimize'),
@@ -53,8 +77,13 @@ contextBridge.exposeInMainWorld('electronAPI', {
     checkModel: () => ipcRenderer.invoke('model:check'),
     downloadModel: () => ipcRenderer.invoke('model:download'),
     deleteModel: () => ipcRenderer.invoke('model:delete'),
+    tune: () => ipcRenderer.invoke('model:tune'),
     // 检查后端状态
     checkBackendReady: () => ipcRenderer.invoke('backend:check-ready'),
+    // 诊断指标
+    getStats: () => ipcRenderer.invoke('backend:stats'),
+    dumpStats: () => ipcRenderer.invoke('backend:dump-stats'),
+    getLogs: (limit, level) => ipcRenderer.invoke('backend:logs', limit, level),
     // 下载进度
     onDownloadProgress: (callback) => {
         const handler = (_event, percent) => callback(percent)
@@ -79,6 +108,18 @@ contextBridge.exposeInMainWorld('electronAPI', {
         ipcRenderer.on('init-error', handler)
         return () => ipcRenderer.removeListener('init-error', handler)
     },
+    // 监听各引擎 (ocr / tokenizer) 的后台加载状态
+    onEngineStatus: (callback) => {
+        const handler = (_event, data) => callback(data)
+        ipcRenderer.on('backend:engine-status', handler)
+        return () => ipcRenderer.removeListener('backend:engine-status', handler)
+    },
+    // 监听硬件调优进度
+    onTuneProgress: (callback) => {
+        const handler = (_event, data) => callback(data)
+        ipcRenderer.on('backend:tune-progress', handler)
+        return () => ipcRenderer.removeListener('backend:tune-progress', handler)
+    },
     // 监听后端日志
     onBackendLog: (callback) => {
         const handler = (_event, msg) => callback(msg)
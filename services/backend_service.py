@@ -3,9 +3,9 @@ import os
 import sys
 import ctypes
 import io
-import json
 import argparse
-import base64
+import threading
+import multiprocessing
 
 # --- 1. 锁定运行目录 & 强制手动加载 DLL (Fix Error 126 & 1114) ---
 if getattr(sys, "frozen", False):
@@ -17,9 +17,10 @@ if getattr(sys, "frozen", False):
     if os.path.exists(omp_path):
         try:
             ctypes.CDLL(omp_path, winmode=0)
-            print(f"DEBUG: Pre-loaded OpenMP: {omp_path}")
+            # stdout 只用于 IPC (翻译子进程启动时也会执行这里)，调试信息写 stderr
+            print(f"DEBUG: Pre-loaded OpenMP: {omp_path}", file=sys.stderr)
         except Exception as e:
-            print(f"DEBUG: Failed to pre-load OpenMP: {e}")
+            print(f"DEBUG: Failed to pre-load OpenMP: {e}", file=sys.stderr)
 
 # 解决 OpenMP 冲突
 os.environ["KMP_DUPLICATE_LIB_OK"] = "TRUE"
@@ -36,21 +37,155 @@ except AttributeError:
         sys.stderr.buffer, encoding="utf-8", line_buffering=True
     )
 
+# 启动性能分析 (--profile-startup) 必须在导入业务模块之前开启，才能统计导入耗时
+from modules.profiling import profiler
+
+if "--profile-startup" in sys.argv:
+    profiler.enable()
+
 # 导入业务模块
-from modules.utils import log_message, send_response
-from modules.translator import get_translator_engine
+with profiler.phase("import.service_modules"):
+    from modules.utils import log_message, send_response, set_protocol
+    from modules.logger import LEVELS, logger
+    from modules.ipc import (
+        PROTOCOL_LINE,
+        SUPPORTED_PROTOCOLS,
+        open_protocol,
+    )
+    from modules.translator import get_translator_engine
+    from modules.dispatcher import CommandDispatcher
+    from modules.handlers import CommandHandlers
+    from modules.engine_loader import EngineLoader
+    from modules.residency import (
+        MB,
+        ResidencyManager,
+        enforce_unloadable_settings,
+        path_size,
+    )
+    from modules.tuning import PROFILE_FILENAME, load_profile
+    from modules import downloader
+
+
+def report_startup_metrics(loaders, output_path):
+    """等待所有引擎加载结束后发送 init_metrics，并可选写入 JSON 文件"""
+    for loader in loaders:
+        loader.wait()
+    try:
+        report = profiler.finish(output_path)
+        send_response(report)
+        if output_path:
+            log_message(f"[INFO] Startup metrics written to: {output_path}")
+    except Exception as e:
+        log_message(f"[WARN] Failed to report startup metrics: {e}")
 
 
 def main():
     log_message("Starting Backend Service (v2025.12.04-FixEncoding)...")
 
-    # 发送状态 启动中
-    send_response({"type": "init_status", "message": "正在启动后台服务..."})
-
     # 1. 解析参数
     parser = argparse.ArgumentParser()
     parser.add_argument("--model-dir", type=str, help="Path to OCR model")
+    parser.add_argument(
+        "--ocr-backend",
+        type=str,
+        choices=("torch", "onnx", "onnx-int8"),
+        default="torch",
+        help="OCR inference backend: torch (MangaOcr) or onnxruntime (fp32 / int8)",
+    )
+    parser.add_argument(
+        "--ocr-decoding",
+        type=str,
+        choices=("default", "fast"),
+        default="default",
+        help="fast: explicit greedy decoding with a max length scaled to crop size",
+    )
+    parser.add_argument(
+        "--ocr-quantize-decoder",
+        action="store_true",
+        help="Dynamically quantize the torch OCR decoder to int8 (CPU only)",
+    )
+    parser.add_argument(
+        "--ocr-threads",
+        type=int,
+        help="Intra-op thread count for OCR inference (torch / onnxruntime)",
+    )
+    parser.add_argument(
+        "--ipc-protocol",
+        type=str,
+        choices=SUPPORTED_PROTOCOLS,
+        default=PROTOCOL_LINE,
+        help="stdio framing: line (Base64 JSON lines) or framed (binary frames)",
+    )
+    parser.add_argument(
+        "--ocr-cache",
+        type=str,
+        choices=("off", "exact", "perceptual"),
+        default="exact",
+        help="OCR result cache: exact pixel hash or perceptual (dHash) matching",
+    )
+    parser.add_argument(
+        "--translator-workers",
+        type=int,
+        default=1,
+        help="Translate in this many worker processes sharing the mmap'd GGUF",
+    )
+    parser.add_argument(
+        "--idle-unload",
+        type=int,
+        default=0,
+        help="Unload a model after this many idle seconds, reload on demand (0: never)",
+    )
+    parser.add_argument(
+        "--memory-budget",
+        type=int,
+        default=0,
+        help="Total MB for resident models; idle models are evicted first (0: no limit)",
+    )
+    parser.add_argument(
+        "--hf-endpoint",
+        type=str,
+        help="Model hub URL for downloads (mirror or local server, default: HF_ENDPOINT)",
+    )
+    parser.add_argument(
+        "--download-manifest",
+        type=str,
+        help="JSON of pinned sizes/sha256 per repo file, preferred over hub metadata",
+    )
+    parser.add_argument(
+        "--log-level",
+        type=str,
+        choices=tuple(LEVELS),
+        default="info",
+        help="Minimum level written to stderr and kept for the logs command",
+    )
+    parser.add_argument(
+        "--log-capture",
+        type=str,
+        choices=tuple(LEVELS),
+        help="Also keep entries down to this level for the logs command (e.g. debug)",
+    )
+    parser.add_argument(
+        "--profile-startup",
+        action="store_true",
+        help="Record per-phase startup time/RSS and import times (init_metrics)",
+    )
+    parser.add_argument(
+        "--profile-output",
+        type=str,
+        help="Also write the init_metrics report to this JSON file",
+    )
     args, _ = parser.parse_known_args()
+    logger.set_level(args.log_level)
+    if args.log_capture:
+        logger.set_capture_level(args.log_capture)
+
+    # 协商 IPC 协议，必须在发送任何消息之前完成
+    protocol = open_protocol(args.ipc_protocol)
+    set_protocol(protocol)
+    log_message(f"IPC protocol: {protocol.name}")
+
+    # 发送状态 启动中
+    send_response({"type": "init_status", "message": "正在启动后台服务..."})
 
     # 修复：如果未提供 --model-dir，则使用默认路径 (防止 NoneType 错误)
     if args.model_dir:
@@ -66,6 +201,13 @@ def main():
 
     translation_root = os.path.join(models_root, "translation")
 
+    # 模型下载地址与本地校验清单 (默认 models/download-manifest.json)
+    downloader.configure(
+        endpoint=args.hf_endpoint,
+        manifest=args.download_manifest
+        or os.path.join(models_root, "download-manifest.json"),
+    )
+
     if not os.path.exists(translation_root):
         os.makedirs(translation_root, exist_ok=True)
 
@@ -79,177 +221,187 @@ def main():
         # 仅实例化对象，不进行任何底层 C++ 初始化
         # 真正的初始化 (load_model) 会在 check_model_exists() 返回 True 后，
         # 在 translate 命令中按需触发。
-        translator = get_translator_engine("sakura", translation_root)
+        with profiler.phase("translator.create"):
+            translator = get_translator_engine(
+                "sakura", translation_root, workers=args.translator_workers
+            )
 
     except Exception as e:
         log_message(f"[WARNING] Translator Pre-init Failed (Non-fatal): {e}")
 
-    # 初始化OCR
-    send_response(
-        {
-            "type": "init_status",
-            "message": "正在加载 OCR 引擎 (首次运行可能需要下载模型)...",
-        }
-    )
-    try:
-        from modules.ocr_engine import OCREngine
+    # [MODIFIED] Translator is already instantiated above for pre-loading.
+    # We just need to ensure it's assigned to the variable we use later.
+    if translator is None:
+        translator = get_translator_engine(
+            "sakura", translation_root, workers=args.translator_workers
+        )
 
-        # 确保传入有效的 OCR 模型路径
-        if args.model_dir:
-            ocr_model_path = args.model_dir
-        else:
-            ocr_model_path = os.path.join(models_root, "ocr")
+    # 应用上次 tune 命令保存的硬件调优结果 (命令行参数优先)
+    tuning_path = os.path.join(models_root, PROFILE_FILENAME)
+    tuning_profile = load_profile(tuning_path) or {}
+    if tuning_profile.get("translator") and hasattr(translator, "apply_settings"):
+        translator.apply_settings(tuning_profile["translator"]["settings"])
+    ocr_threads = args.ocr_threads
+    if ocr_threads is None and tuning_profile.get("ocr"):
+        ocr_threads = tuning_profile["ocr"]["settings"]["num_threads"]
+
+    # 明确开启空闲卸载或内存预算时，模型可能被卸载，覆盖 mmap / mlock 参数
+    if args.idle_unload > 0 or args.memory_budget > 0:
+        enforce_unloadable_settings(
+            translator, tuning_profile.get("translator", {}).get("settings")
+        )
 
-        ocr_engine = OCREngine(model_dir=ocr_model_path)
-    except Exception as e:
-        log_message(f"[ERROR] OCR Init Failed: {e}")
+    # 确保传入有效的 OCR 模型路径
+    if args.model_dir:
+        ocr_model_path = args.model_dir
+    else:
+        ocr_model_path = os.path.join(models_root, "ocr")
+
+    # OCR 与分词器在后台线程中加载，torch / sudachipy 等重量级依赖推迟到
+    # 各自的加载线程中导入。llama_cpp 已在上面随翻译模块导入，仍然先于 torch。
+    def load_ocr_engine():
         send_response(
             {
-                "type": "init_error",
-                "message": f"OCR 模型加载失败: {str(e)}",
-                "detail": "请检查网络连接，或尝试手动下载模型。",
+                "type": "init_status",
+                "message": "正在加载 OCR 引擎 (首次运行可能需要下载模型)...",
             }
         )
-        sys.exit(1)
-
-    # 初始化分词器
-    send_response({"type": "init_status", "message": "正在加载日语分词组件..."})
-    from modules.tokenizer import JapaneseTokenizer
-
-    tokenizer = JapaneseTokenizer()
+        try:
+            from modules.ocr_engine import OCREngine, OCRResultCache
+
+            # OCR 结果缓存保存在 models/cache 下，重启后仍然有效
+            ocr_cache = None
+            if args.ocr_cache != "off":
+                ocr_cache = OCRResultCache(
+                    os.path.join(models_root, "cache", "ocr_cache.sqlite3"),
+                    perceptual=args.ocr_cache == "perceptual",
+                )
+
+            return OCREngine(
+                model_dir=ocr_model_path,
+                cache=ocr_cache,
+                backend=args.ocr_backend,
+                decoding=args.ocr_decoding,
+                quantize_decoder=args.ocr_quantize_decoder,
+                num_threads=ocr_threads,
+            )
+        except Exception as e:
+            log_message(f"[ERROR] OCR Init Failed: {e}")
+            send_response(
+                {
+                    "type": "init_error",
+                    "message": f"OCR 模型加载失败: {str(e)}",
+                    "detail": "请检查网络连接，或尝试手动下载模型。",
+                }
+            )
+            raise
+
+    def load_tokenizer():
+        from modules.tokenizer import JapaneseTokenizer
+
+        tokenizer = JapaneseTokenizer()
+        if tokenizer.tokenizer is None:
+            raise Exception(tokenizer.init_error)
+        return tokenizer
+
+    # 每个子系统 (OCR / 分词 / 翻译) 各自拥有独立的工作队列，
+    # 慢速翻译不会阻塞排在后面的 OCR 和分词请求
+    dispatcher = CommandDispatcher()
+
+    # 模型常驻管理：空闲超时卸载、总内存预算，卸载后的引擎在下次使用时重新加载
+    residency = ResidencyManager(
+        dispatcher,
+        idle_timeout=args.idle_unload,
+        budget=args.memory_budget * MB,
+    )
+    ocr_loader = EngineLoader("ocr", residency.tracked("ocr", load_ocr_engine))
+    tokenizer_loader = EngineLoader(
+        "tokenizer", residency.tracked("tokenizer", load_tokenizer)
+    )
 
-    # [MODIFIED] Translator is already instantiated above for pre-loading.
-    # We just need to ensure it's assigned to the variable we use later.
-    if translator is None:
-        translator = get_translator_engine("sakura", translation_root)
+    # 加载之前的内存估计：权重文件大小 (torch 优先 safetensors，可直接 mmap 读取)
+    if args.ocr_backend == "torch":
+        ocr_weights = [os.path.join(ocr_model_path, "model.safetensors")]
+        if not os.path.exists(ocr_weights[0]):
+            ocr_weights = [os.path.join(ocr_model_path, "pytorch_model.bin")]
+    else:
+        ocr_weights = [os.path.join(ocr_model_path, args.ocr_backend)]
+    residency.register(
+        "ocr",
+        "ocr",
+        lambda: ocr_loader.is_loaded,
+        ocr_loader.unload,
+        estimate=lambda: path_size(*ocr_weights),
+    )
+    residency.register(
+        "tokenizer",
+        "tokenizer",
+        lambda: tokenizer_loader.is_loaded,
+        tokenizer_loader.unload,
+    )
+    residency.register(
+        "translator",
+        "translator",
+        lambda: translator.is_ready,
+        translator.unload,
+        estimate=lambda: path_size(getattr(translator, "model_file_path", "")),
+    )
 
-    # 准备就绪
-    send_response({"type": "init_status", "message": "资源加载完毕，即将进入..."})
+    # 准备就绪：服务立即可用，各引擎加载完成后单独发送 engine_ready
     send_response({"status": "ready"})
+    ocr_loader.start()
+    tokenizer_loader.start()
+
+    if profiler.enabled:
+        threading.Thread(
+            target=report_startup_metrics,
+            args=([ocr_loader, tokenizer_loader], args.profile_output),
+            name="startup-metrics",
+            daemon=True,
+        ).start()
     log_message("Waiting for commands...")
 
     # 4. 消息循环
-    import base64
+    handlers = CommandHandlers(
+        ocr_loader,
+        tokenizer_loader,
+        translator,
+        tuning_path=tuning_path,
+        residency=residency,
+    )
+    handlers.register_all(dispatcher)
+    residency.start()
 
-    for line in sys.stdin:
+    for request in protocol.read_requests():
         try:
-            line = line.strip()
-            if not line:
-                continue
-
-            # [Fix Encoding] 解码 Base64
-            try:
-                # 1. Base64 -> Bytes (UTF-8)
-                json_bytes = base64.b64decode(line)
-                # 2. Bytes -> String
-                json_str = json_bytes.decode("utf-8")
-                # 3. Parse JSON
-                request = json.loads(json_str)
-            except Exception as e:
-                log_message(f"[CRITICAL] Failed to decode Base64 payload: {e}")
-                # 尝试直接解析（兼容旧模式，虽然现在应该都是 Base64）
-                try:
-                    request = json.loads(line)
-                except:
-                    continue
-
-            req_id = request.get("id")
             command = request.get("command")
 
             # === 路由分发 ===
-
-            # -> OCR 任务
-            if command == "recognize":
-                try:
-                    text = ocr_engine.recognize(request.get("image", ""))
-                    send_response({"id": req_id, "success": True, "text": text})
-                except Exception as e:
-                    send_response({"id": req_id, "success": False, "error": str(e)})
-
-            # -> 分词任务
-            elif command == "tokenize":
-                try:
-                    text = request.get("text", "")
-                    log_message(f"Processing tokenize request for: {repr(text)}")
-                    tokens = tokenizer.tokenize(text)
-                    send_response({"id": req_id, "success": True, "tokens": tokens})
-                except Exception as e:
-                    log_message(f"Tokenize Error: {e}")
-                    send_response({"id": req_id, "success": False, "error": str(e)})
-
-            # --- Translate ---
-            elif command == "translate":
-                try:
-                    text = request.get("text", "")
-                    log_message(
-                        f"[DEBUG] Processing translate request for: {repr(text)[:50]}..."
-                    )
-
-                    # 1. 检查是否已加载
-                    if not translator.is_ready:
-                        log_message(
-                            "[DEBUG] Translator not ready. Checking model existence..."
-                        )
-                        # 2. 检查物理文件是否存在
-                        if translator.check_model_exists():
-                            # 存在则加载
-                            log_message(
-                                "[DEBUG] Model exists. Initializing translator..."
-                            )
-                            translator.initialize()
-                        else:
-                            log_message("[ERROR] Model not found.")
-                            raise Exception("MODEL_NOT_FOUND")
-
-                    # 3. 执行翻译
-                    log_message("[DEBUG] Executing translator.translate()...")
-                    result = translator.translate(text)
-                    log_message(f"[DEBUG] Translation result: {repr(result)[:50]}...")
-                    send_response(
-                        {"id": req_id, "success": True, "translation": result}
-                    )
-
-                except Exception as e:
-                    # 捕获错误 (包括上面的 MODEL_NOT_FOUND)
-                    log_message(f"[ERROR] Translation Error: {e}")
-                    import traceback
-
-                    log_message(f"[ERROR] Traceback: {traceback.format_exc()}")
-                    send_response({"id": req_id, "success": False, "error": str(e)})
-
-            # --- Model Management (New) ---
-
-            # 1. 检查模型状态
-            elif command == "check_model":
-                exists = translator.check_model_exists()
-                send_response({"id": req_id, "success": True, "exists": exists})
-
-            # 2. 下载模型
-            elif command == "download_model":
-                try:
-                    translator.download_model()
-                    # 下载完顺便初始化一下，确保可用
-                    translator.initialize()
-                    send_response({"id": req_id, "success": True})
-                except Exception as e:
-                    send_response({"id": req_id, "success": False, "error": str(e)})
-
-            # 3. 删除模型
-            elif command == "delete_model":
-                success = translator.delete_model()
-                send_response({"id": req_id, "success": success})
-
-            elif command == "ping":
+            # 轻量控制命令直接在主线程处理
+            if command == "ping":
                 send_response({"success": True, "message": "pong"})
 
+            # 取消排队中或执行中的请求
+            elif command == "cancel":
+                found = dispatcher.cancel(request.get("target"))
+                send_response(
+                    {"id": request.get("id"), "success": True, "found": found}
+                )
+
             elif command == "exit":
+                dispatcher.shutdown()
                 sys.exit(0)
 
-        except json.JSONDecodeError:
-            log_message("Received invalid JSON")
+            elif not dispatcher.dispatch(request):
+                log_message(f"[WARN] Unknown command: {command}")
+
         except Exception as e:
             log_message(f"Critical Loop Error: {e}")
 
+    dispatcher.shutdown()
+
 
 if __name__ == "__main__":
+    # 打包后的 exe 启动翻译子进程时需要 (multiprocessing spawn)
+    multiprocessing.freeze_support()
     main()
@@ -0,0 +1,95 @@
+# services/benchmarks/fixtures.py
+"""
+基准测试共用的固定输入：合成的气泡截图与日文句子语料，
+不依赖网络，也不需要额外的数据文件。
+"""
+
+import os
+import sys
+from io import BytesIO
+
+from PIL import Image, ImageDraw, ImageFont
+
+# 未指定 --images 时合成的横排 / 竖排气泡文字
+FIXTURE_TEXTS = [
+    "どうしてこんなところに",
+    "ちょっと待って！",
+    "本当にそれでいいの？",
+    "今日は晴れです",
+    "ありがとう",
+    "逃げるんだ",
+]
+
+CJK_FONTS = [
+    "C:/Windows/Fonts/msgothic.ttc",
+    "C:/Windows/Fonts/YuGothM.ttc",
+    "/System/Library/Fonts/ヒラギノ角ゴシック W3.ttc",
+    "/usr/share/fonts/opentype/noto/NotoSansCJK-Regular.ttc",
+    "/usr/share/fonts/noto-cjk/NotoSansCJK-Regular.ttc",
+]
+
+
+def _load_font(size):
+    for path in CJK_FONTS:
+        if os.path.exists(path):
+            return ImageFont.truetype(path, size)
+    print("[WARNING] No CJK font found, fixtures will not be legible.", file=sys.stderr)
+    return ImageFont.load_default()
+
+
+def render_fixtures():
+    """把 FIXTURE_TEXTS 渲染成 PNG 字节 (横排与竖排各一份)"""
+    font = _load_font(32)
+    fixtures = []
+    for text in FIXTURE_TEXTS:
+        # 横排
+        img = Image.new("RGB", (40 * len(text) + 20, 56), "white")
+        ImageDraw.Draw(img).text((10, 10), text, font=font, fill="black")
+        fixtures.append(img)
+
+        # 竖排：逐字向下绘制
+        img = Image.new("RGB", (56, 40 * len(text) + 20), "white")
+        draw = ImageDraw.Draw(img)
+        for i, ch in enumerate(text):
+            draw.text((10, 10 + i * 40), ch, font=font, fill="black")
+        fixtures.append(img)
+
+    encoded = []
+    for img in fixtures:
+        buf = BytesIO()
+        img.save(buf, format="PNG")
+        encoded.append(buf.getvalue())
+    return encoded
+
+
+def fixture_labels():
+    """render_fixtures() 中每张图像对应的正确文本"""
+    return [text for text in FIXTURE_TEXTS for _ in range(2)]
+
+
+def load_images(images_dir):
+    if not images_dir:
+        return render_fixtures()
+    images = []
+    for name in sorted(os.listdir(images_dir)):
+        if name.lower().endswith((".png", ".jpg", ".jpeg", ".webp")):
+            with open(os.path.join(images_dir, name), "rb") as f:
+                images.append(f.read())
+    return images
+
+
+# 分词 / 翻译用的句子语料：长短不一，包含假名、汉字、标点与拟声词
+CORPUS = [
+    "どうしてこんなところにいるの？",
+    "ちょっと待って！まだ話は終わってない",
+    "ありがとう、助かったよ",
+    "ドキドキ…",
+    "今日は朝から雨が降っていて、学校に行くのが面倒だった。",
+    "お前なんかに負けるわけにはいかないんだ！",
+    "あの時のことを、私はまだ覚えている。",
+    "えっ！？",
+    "明日の試合、絶対に勝とうね",
+    "先輩、これ、受け取ってください！",
+    "魔王を倒すためには、伝説の剣が必要だと言われている。",
+    "ふざけるな！",
+]
@@ -0,0 +1,103 @@
+# services/benchmarks/ipc_protocol.py
+"""
+IPC 协议基准测试：对比行协议 (Base64 JSON) 与二进制分帧协议
+每个请求在管道上传输的字节数以及后端解析耗时。
+
+用法 (在 services 目录下):
+    python -m benchmarks.ipc_protocol
+"""
+
+import os
+import io
+import json
+import time
+import base64
+import argparse
+
+from modules.ipc import (
+    FRAME_BLOB,
+    FRAME_JSON,
+    decode_framed_request,
+    decode_line,
+    encode_frame,
+    read_frame,
+)
+
+# (名称, 图片字节数)：单个气泡截图 / 整屏截图
+PAYLOADS = [
+    ("bubble-40KB", 40 * 1024),
+    ("page-600KB", 600 * 1024),
+    ("screen-4MB", 4 * 1024 * 1024),
+]
+
+SAMPLE_REPLY = {"id": 1, "success": True, "text": "どうしてこんなところに…！？"}
+
+
+def encode_line_request(image_bytes):
+    """与 Electron 行协议一致：图片 Data URL 放进 JSON，整体再 Base64"""
+    data_url = "data:image/png;base64," + base64.b64encode(image_bytes).decode()
+    request = {"command": "recognize", "image": data_url, "id": 1}
+    return base64.b64encode(json.dumps(request).encode("utf-8")) + b"\n"
+
+
+def encode_framed_request(image_bytes):
+    header = json.dumps({"command": "recognize", "attachments": 1, "id": 1})
+    return encode_frame(FRAME_JSON, header.encode("utf-8")) + encode_frame(
+        FRAME_BLOB, image_bytes
+    )
+
+
+def parse_line_request(wire):
+    request = decode_line(wire.strip())
+    # OCREngine 还要再做一次 Base64 解码才能拿到图片字节
+    image = request["image"].split(",", 1)[1]
+    return base64.b64decode(image)
+
+
+def parse_framed_request(wire):
+    stream = io.BytesIO(wire)
+    _, payload = read_frame(stream)
+    return decode_framed_request(payload, stream)["attachments"][0]
+
+
+def measure(fn, wire, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn(wire)
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    line_reply = len(json.dumps(SAMPLE_REPLY, ensure_ascii=True)) + 1
+    framed_reply = len(
+        encode_frame(FRAME_JSON, json.dumps(SAMPLE_REPLY, ensure_ascii=False).encode())
+    )
+
+    print(
+        f"{'payload':<14}{'image':>10}{'line':>12}{'framed':>12}"
+        f"{'line ms':>10}{'framed ms':>11}"
+    )
+    for name, size in PAYLOADS:
+        image = os.urandom(size)
+        line_wire = encode_line_request(image)
+        framed_wire = encode_framed_request(image)
+
+        assert parse_line_request(line_wire) == image
+        assert parse_framed_request(framed_wire) == image
+
+        line_ms = measure(parse_line_request, line_wire, args.repeat)
+        framed_ms = measure(parse_framed_request, framed_wire, args.repeat)
+        print(
+            f"{name:<14}{size:>10}{len(line_wire):>12}{len(framed_wire):>12}"
+            f"{line_ms:>10.3f}{framed_ms:>11.3f}"
+        )
+
+    print(f"reply bytes: line={line_reply} framed={framed_reply}")
+
+
+if __name__ == "__main__":
+    main()
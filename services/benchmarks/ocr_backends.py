@@ -0,0 +1,121 @@
+# services/benchmarks/ocr_backends.py
+"""
+OCR 后端基准测试：对比 torch / onnx / onnx-int8 在同一组图像上的
+识别结果、加载耗时、平均延迟与常驻内存。每个后端在独立的子进程中运行，
+RSS 互不干扰 (onnx 子进程不会导入 torch，首次导出除外)。
+
+用法 (在 services 目录下):
+    python -m benchmarks.ocr_backends --model-dir ../models/ocr
+    python -m benchmarks.ocr_backends --model-dir ../models/ocr --images path/to/crops
+"""
+
+import sys
+import json
+import time
+import argparse
+import subprocess
+
+from benchmarks.fixtures import load_images
+from modules.profiling import current_rss, peak_rss
+
+BACKENDS = ("torch", "onnx", "onnx-int8")
+
+
+def run_worker(args):
+    """子进程：加载一个后端并逐张识别，向 stdout 输出 JSON 结果"""
+    images = load_images(args.images)
+    rss_before = current_rss()
+
+    start = time.perf_counter()
+    from modules.ocr_engine import OCREngine
+
+    engine = OCREngine(model_dir=args.model_dir, backend=args.worker)
+    load_s = time.perf_counter() - start
+
+    # 预热一次，不计入延迟
+    engine.recognize(images[0])
+
+    texts, latencies = [], []
+    for image in images:
+        start = time.perf_counter()
+        texts.append(engine.recognize(image))
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    rss = current_rss()
+    result = {
+        "backend": engine.model.name,
+        "load_s": round(load_s, 2),
+        "mean_ms": round(sum(latencies) / len(latencies), 2),
+        "rss_delta": rss - rss_before if rss and rss_before else None,
+        "peak_rss": peak_rss(),
+        "texts": texts,
+    }
+    print(json.dumps(result, ensure_ascii=False))
+
+
+def run_backend(backend, args):
+    cmd = [
+        sys.executable,
+        "-m",
+        "benchmarks.ocr_backends",
+        "--worker",
+        backend,
+        "--model-dir",
+        args.model_dir,
+    ]
+    if args.images:
+        cmd += ["--images", args.images]
+    proc = subprocess.run(cmd, capture_output=True, text=True, encoding="utf-8")
+    if proc.returncode != 0:
+        print(f"[ERROR] {backend} failed:\n{proc.stderr[-2000:]}", file=sys.stderr)
+        return None
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model-dir", type=str, required=True)
+    parser.add_argument("--images", type=str, help="Directory of bubble crops")
+    parser.add_argument("--backends", nargs="+", choices=BACKENDS, default=BACKENDS)
+    parser.add_argument("--worker", choices=BACKENDS, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args)
+        return
+
+    results = {b: run_backend(b, args) for b in args.backends}
+    reference = results.get("torch")
+
+    mb = 1024 * 1024
+    print(
+        f"{'backend':<12}{'load s':>8}{'mean ms':>10}{'rss MB':>9}"
+        f"{'peak MB':>9}{'match':>9}"
+    )
+    for backend, result in results.items():
+        if result is None:
+            print(f"{backend:<12}{'failed':>8}")
+            continue
+        match = "-"
+        if reference is not None:
+            same = sum(a == b for a, b in zip(result["texts"], reference["texts"]))
+            match = f"{same}/{len(reference['texts'])}"
+        rss = result["rss_delta"] / mb if result["rss_delta"] else 0
+        peak = result["peak_rss"] / mb if result["peak_rss"] else 0
+        print(
+            f"{result['backend']:<12}{result['load_s']:>8.2f}"
+            f"{result['mean_ms']:>10.2f}{rss:>9.1f}{peak:>9.1f}{match:>9}"
+        )
+
+    # 列出与 torch 不一致的结果，便于检查
+    if reference is not None:
+        for backend, result in results.items():
+            if result is None or backend == "torch":
+                continue
+            for i, (a, b) in enumerate(zip(result["texts"], reference["texts"])):
+                if a != b:
+                    print(f"  [{backend}] #{i}: {a!r} != torch {b!r}")
+
+
+if __name__ == "__main__":
+    main()
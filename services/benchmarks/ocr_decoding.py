@@ -0,0 +1,85 @@
+# services/benchmarks/ocr_decoding.py
+"""
+OCR 解码模式基准测试：对比 default (MangaOcr 原始 generate) 与 fast
+(显式贪心 + 按尺寸估算 max_length，可选 int8 decoder) 的延迟与准确率。
+
+准确率以 default 模式的输出为参照；使用内置合成图像时，
+还会与渲染时的正确文本比较。
+
+用法 (在 services 目录下):
+    python -m benchmarks.ocr_decoding --model-dir ../models/ocr
+    python -m benchmarks.ocr_decoding --model-dir ../models/ocr --threads 4
+"""
+
+import time
+import argparse
+
+from benchmarks.fixtures import fixture_labels, load_images
+from modules.ocr_engine import OCREngine
+
+# (名称, OCREngine 参数)
+MODES = [
+    ("default", {"decoding": "default"}),
+    ("fast", {"decoding": "fast"}),
+    ("fast+int8", {"decoding": "fast", "quantize_decoder": True}),
+]
+
+
+def run_mode(images, args, options):
+    engine = OCREngine(
+        model_dir=args.model_dir,
+        backend=args.backend,
+        num_threads=args.threads,
+        **options,
+    )
+    # 预热一次，不计入延迟
+    engine.recognize(images[0])
+
+    texts, latencies = [], []
+    for image in images:
+        start = time.perf_counter()
+        texts.append(engine.recognize(image))
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    engine.recognize_batch(images)
+    batch_ms = (time.perf_counter() - start) * 1000
+    return texts, latencies, batch_ms
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model-dir", type=str, required=True)
+    parser.add_argument("--images", type=str, help="Directory of bubble crops")
+    parser.add_argument(
+        "--backend", choices=("torch", "onnx", "onnx-int8"), default="torch"
+    )
+    parser.add_argument("--threads", type=int, help="Intra-op thread count")
+    args = parser.parse_args()
+
+    images = load_images(args.images)
+    labels = None if args.images else fixture_labels()
+
+    results = {}
+    for name, options in MODES:
+        results[name] = run_mode(images, args, options)
+
+    reference = results["default"][0]
+    print(
+        f"{'mode':<12}{'mean ms':>10}{'max ms':>10}{'batch ms':>10}"
+        f"{'=default':>10}{'correct':>10}"
+    )
+    for name, (texts, latencies, batch_ms) in results.items():
+        same = sum(a == b for a, b in zip(texts, reference))
+        correct = "-"
+        if labels is not None:
+            correct = f"{sum(a == b for a, b in zip(texts, labels))}/{len(labels)}"
+        print(
+            f"{name:<12}{sum(latencies) / len(latencies):>10.2f}"
+            f"{max(latencies):>10.2f}{batch_ms:>10.2f}"
+            f"{f'{same}/{len(texts)}':>10}{correct:>10}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,287 @@
+# services/benchmarks/suite.py
+"""
+离线基准测试套件：通过与 backend_service 相同的 CommandHandlers 执行
+recognize / recognize_batch / tokenize / tokenize_batch / translate / translate_batch，
+统计每个命令的 p50/p95/p99 延迟、吞吐量与峰值 RSS，并可与基线 JSON 比较，
+出现性能回退时以非零状态码退出。
+
+输入全部是固定的：合成气泡截图、日文句子语料，以及本地 GGUF 模型或
+不依赖模型的桩翻译器，运行时不访问网络。
+
+用法 (在 services 目录下):
+    python -m benchmarks.suite --save-baseline benchmarks/baseline.json
+    python -m benchmarks.suite --baseline benchmarks/baseline.json
+    python -m benchmarks.suite --ocr-model-dir ../models/ocr --gguf path/to/model.gguf
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import threading
+
+# 禁止 huggingface_hub / transformers 访问网络 (必须在导入它们之前设置)
+os.environ.setdefault("HF_HUB_OFFLINE", "1")
+os.environ.setdefault("TRANSFORMERS_OFFLINE", "1")
+
+from benchmarks.fixtures import CORPUS, render_fixtures
+from modules.handlers import CommandHandlers
+from modules.profiling import current_rss, peak_rss
+from modules.translator.base import BaseTranslator
+from modules.tuning import machine_signature
+
+BASELINE_VERSION = 1
+
+
+class StubTranslator(BaseTranslator):
+    """
+    不需要模型文件的翻译器：按原文长度模拟生成耗时，
+    用于在没有 GGUF 模型时测量调度与处理函数本身的开销
+    """
+
+    def __init__(self, seconds_per_char=0.001):
+        super().__init__(None)
+        self.seconds_per_char = seconds_per_char
+        self.is_ready = True
+
+    def initialize(self):
+        self.is_ready = True
+
+    def check_model_exists(self):
+        return True
+
+    def translate(self, text, cancel_event=None, lookup=True):
+        time.sleep(len(text) * self.seconds_per_char)
+        return f"[译]{text}"
+
+    def download_model(self, progress_callback=None):
+        raise Exception("StubTranslator has no model to download")
+
+
+def create_translator(gguf_path):
+    if not gguf_path:
+        return StubTranslator()
+
+    from modules.translator.sakura_engine import SakuraEngine
+
+    # 不使用翻译记忆，否则重复的语料会直接命中缓存
+    translator = SakuraEngine(tempfile.mkdtemp(), use_cache=False)
+    translator.filename = os.path.basename(gguf_path)
+    translator.model_file_path = os.path.abspath(gguf_path)
+    translator.initialize()
+    if not translator.is_ready:
+        raise Exception(f"Failed to load GGUF model: {gguf_path}")
+    return translator
+
+
+def create_ocr_engine(model_dir, backend):
+    if not model_dir:
+        return None
+    if not os.path.exists(os.path.join(model_dir, "config.json")):
+        # OCREngine 会尝试下载缺失的模型，离线测试中直接跳过
+        print(f"[WARN] No OCR model at {model_dir}, skipping OCR.", file=sys.stderr)
+        return None
+
+    from modules.ocr_engine import OCREngine
+
+    # 不使用 OCR 结果缓存，测量的是真实推理耗时
+    return OCREngine(model_dir=model_dir, backend=backend)
+
+
+def create_tokenizer():
+    # sudachipy 在 modules.tokenizer 导入时加载，未安装时跳过分词基准
+    try:
+        from modules.tokenizer import JapaneseTokenizer
+    except ImportError as e:
+        print(f"[WARN] Tokenizer unavailable: {e}", file=sys.stderr)
+        return None
+
+    tokenizer = JapaneseTokenizer()
+    if tokenizer.tokenizer is None:
+        print(f"[WARN] Tokenizer unavailable: {tokenizer.init_error}", file=sys.stderr)
+        return None
+    return tokenizer
+
+
+def percentile(values, pct):
+    """最近秩法百分位数"""
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def run_command(handler, requests, items_per_request):
+    """逐个执行请求，返回延迟分布、吞吐量 (条/秒) 与执行期间观测到的最大 RSS"""
+    # 预热一次，不计入统计 (首次推理会初始化线程池、分配缓冲区)
+    handler({**requests[0], "cancel_event": threading.Event()})
+
+    latencies = []
+    rss_peak = current_rss() or 0
+    start = time.perf_counter()
+    for request in requests:
+        request = {**request, "cancel_event": threading.Event()}
+        t0 = time.perf_counter()
+        handler(request)
+        latencies.append((time.perf_counter() - t0) * 1000)
+        rss_peak = max(rss_peak, current_rss() or 0)
+    total_s = time.perf_counter() - start
+
+    return {
+        "requests": len(requests),
+        "p50_ms": round(percentile(latencies, 50), 3),
+        "p95_ms": round(percentile(latencies, 95), 3),
+        "p99_ms": round(percentile(latencies, 99), 3),
+        "throughput": round(len(requests) * items_per_request / total_s, 3),
+        "rss_peak": rss_peak or None,
+    }
+
+
+def build_workload(handlers, iterations):
+    """命令名 -> (处理函数, 请求列表, 每个请求包含的条目数)"""
+    workload = {}
+
+    if handlers.ocr_loader.engine is not None:
+        images = render_fixtures()
+        workload["recognize"] = (
+            handlers.recognize,
+            [{"attachments": [image]} for image in images] * iterations,
+            1,
+        )
+        workload["recognize_batch"] = (
+            handlers.recognize_batch,
+            [{"attachments": images}] * iterations,
+            len(images),
+        )
+
+    if handlers.tokenizer_loader.engine is not None:
+        workload["tokenize"] = (
+            handlers.tokenize,
+            [{"text": text} for text in CORPUS] * iterations,
+            1,
+        )
+        workload["tokenize_batch"] = (
+            handlers.tokenize_batch,
+            [{"texts": CORPUS}] * iterations,
+            len(CORPUS),
+        )
+
+    workload["translate"] = (
+        handlers.translate,
+        [{"text": text} for text in CORPUS] * iterations,
+        1,
+    )
+    workload["translate_batch"] = (
+        handlers.translate_batch,
+        [{"texts": CORPUS}] * iterations,
+        len(CORPUS),
+    )
+    return workload
+
+
+def compare(results, baseline, tolerance, rss_tolerance):
+    """返回性能回退列表：延迟、吞吐量或 RSS 超出基线的容差"""
+    regressions = []
+    for command, current in results["commands"].items():
+        reference = baseline.get("commands", {}).get(command)
+        if reference is None:
+            continue
+        for key in ("p50_ms", "p95_ms", "p99_ms"):
+            if current[key] > reference[key] * (1 + tolerance):
+                regressions.append(
+                    f"{command}.{key}: {current[key]} > baseline {reference[key]}"
+                )
+        if current["throughput"] < reference["throughput"] * (1 - tolerance):
+            regressions.append(
+                f"{command}.throughput: {current['throughput']} "
+                f"< baseline {reference['throughput']}"
+            )
+        if (
+            current["rss_peak"]
+            and reference.get("rss_peak")
+            and current["rss_peak"] > reference["rss_peak"] * (1 + rss_tolerance)
+        ):
+            regressions.append(
+                f"{command}.rss_peak: {current['rss_peak']} "
+                f"> baseline {reference['rss_peak']}"
+            )
+    return regressions
+
+
+def print_table(results):
+    mb = 1024 * 1024
+    print(
+        f"{'command':<18}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+        f"{'items/s':>10}{'rss MB':>9}"
+    )
+    for command, r in results["commands"].items():
+        rss = r["rss_peak"] / mb if r["rss_peak"] else 0
+        print(
+            f"{command:<18}{r['p50_ms']:>10.2f}{r['p95_ms']:>10.2f}"
+            f"{r['p99_ms']:>10.2f}{r['throughput']:>10.2f}{rss:>9.1f}"
+        )
+    if results["peak_rss"]:
+        print(f"process peak RSS: {results['peak_rss'] / mb:.1f} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--ocr-model-dir", type=str, help="Local OCR model (optional)")
+    parser.add_argument(
+        "--ocr-backend", choices=("torch", "onnx", "onnx-int8"), default="torch"
+    )
+    parser.add_argument("--gguf", type=str, help="Local GGUF model (default: stub)")
+    parser.add_argument("--iterations", type=int, default=5)
+    parser.add_argument("--baseline", type=str, help="Compare against this JSON")
+    parser.add_argument("--save-baseline", type=str, help="Write results as baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    parser.add_argument("--rss-tolerance", type=float, default=0.10)
+    args = parser.parse_args()
+
+    # 与 backend_service 相同：llama_cpp 先于 torch 加载
+    translator = create_translator(args.gguf)
+    ocr_engine = create_ocr_engine(args.ocr_model_dir, args.ocr_backend)
+    tokenizer = create_tokenizer()
+    handlers = CommandHandlers(ocr_engine, tokenizer, translator)
+
+    results = {
+        "version": BASELINE_VERSION,
+        "hardware": machine_signature(),
+        "translator": "gguf" if args.gguf else "stub",
+        "ocr_backend": args.ocr_backend if ocr_engine is not None else None,
+        "commands": {},
+    }
+    for command, (handler, requests, items) in build_workload(
+        handlers, args.iterations
+    ).items():
+        print(f"[INFO] Running {command} ({len(requests)} requests)", file=sys.stderr)
+        results["commands"][command] = run_command(handler, requests, items)
+    results["peak_rss"] = peak_rss()
+
+    print_table(results)
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"Baseline saved to {args.save_baseline}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("hardware") != results["hardware"]:
+            print("[WARN] Baseline was recorded on other hardware.", file=sys.stderr)
+        if baseline.get("translator") != results["translator"]:
+            print("[WARN] Baseline used a different translator.", file=sys.stderr)
+
+        regressions = compare(results, baseline, args.tolerance, args.rss_tolerance)
+        if regressions:
+            print("\nPERFORMANCE REGRESSION DETECTED:", file=sys.stderr)
+            for line in regressions:
+                print(f"  {line}", file=sys.stderr)
+            sys.exit(1)
+        print("No regressions against baseline.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+# services/modules/cache.py
+import os
+import json
+import sqlite3
+import threading
+from collections import OrderedDict
+from .utils import log_message
+
+
+class LRUCache:
+    """线程安全的有界 LRU 缓存，记录命中/未命中次数"""
+
+    def __init__(self, capacity=512):
+        self.capacity = capacity
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.capacity:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class PersistentCache:
+    """
+    两级缓存：内存 LRU + SQLite 磁盘存储 (重启后仍然有效)。
+    值必须可以 JSON 序列化。磁盘不可用时自动退化为纯内存缓存。
+    """
+
+    def __init__(self, db_path, table="cache", capacity=512):
+        self.db_path = db_path
+        self.table = table
+        self.memory = LRUCache(capacity)
+        self.disk_hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = None
+
+        try:
+            os.makedirs(os.path.dirname(db_path), exist_ok=True)
+            self._conn = sqlite3.connect(db_path, check_same_thread=False)
+            self._conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {table} "
+                "(key TEXT PRIMARY KEY, value TEXT NOT NULL)"
+            )
+            self._conn.commit()
+        except Exception as e:
+            log_message(f"[WARN] Cache store unavailable ({db_path}): {e}")
+            self._conn = None
+
+    def get(self, key):
+        value = self.memory.get(key)
+        if value is not None:
+            return value
+
+        if self._conn is not None:
+            with self._lock:
+                try:
+                    row = self._conn.execute(
+                        f"SELECT value FROM {self.table} WHERE key = ?", (key,)
+                    ).fetchone()
+                except Exception as e:
+                    log_message(f"[WARN] Cache read failed: {e}")
+                    row = None
+            if row is not None:
+                value = json.loads(row[0])
+                # 提升到内存层
+                self.memory.put(key, value)
+                self.disk_hits += 1
+                return value
+
+        self.misses += 1
+        return None
+
+    def put(self, key, value):
+        self.memory.put(key, value)
+        if self._conn is None:
+            return
+        with self._lock:
+            try:
+                self._conn.execute(
+                    f"INSERT OR REPLACE INTO {self.table} (key, value) VALUES (?, ?)",
+                    (key, json.dumps(value, ensure_ascii=False)),
+                )
+                self._conn.commit()
+            except Exception as e:
+                log_message(f"[WARN] Cache write failed: {e}")
+
+    def clear(self):
+        self.memory.clear()
+        if self._conn is None:
+            return
+        with self._lock:
+            try:
+                self._conn.execute(f"DELETE FROM {self.table}")
+                self._conn.commit()
+            except Exception as e:
+                log_message(f"[WARN] Cache clear failed: {e}")
+
+    def stats(self):
+        hits = self.memory.hits + self.disk_hits
+        lookups = hits + self.misses
+        return {
+            "memory_hits": self.memory.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            "memory_entries": len(self.memory),
+        }
@@ -0,0 +1,223 @@
+# services/modules/dispatcher.py
+import time
+import queue
+import threading
+from concurrent.futures import Future
+from .utils import log_message, send_response, RequestCancelled
+from .metrics import metrics
+
+
+class CommandDispatcher:
+    """
+    按子系统分发命令：每个子系统 (ocr / tokenizer / translator) 拥有独立的
+    任务队列和工作线程。同一子系统内按顺序执行，不同子系统之间并发执行，
+    响应通过请求 id 与 Electron 端的 pendingRequests 匹配。
+
+    每个请求附带一个 cancel_event (threading.Event)：
+    - cancel 命令会设置它，排队中的请求直接丢弃，执行中的请求由引擎在
+      安全点 (例如 llama 每生成一个 token) 检查并中止；
+    - 带有相同 supersede 分组的新请求会自动取消旧请求。
+    被取消的请求统一收到 {"success": False, "cancelled": True} 响应。
+
+    每个请求的排队时间、执行时间与结果都会记录到 metrics，供 stats 命令读取。
+    """
+
+    def __init__(self):
+        # command -> (lane, handler)
+        self._routes = {}
+        # lane -> queue.Queue
+        self._lanes = {}
+        self._workers = {}
+
+        # req_id -> cancel_event (排队中或执行中的请求)
+        self._active = {}
+        # supersede 分组 -> 该分组最新的 req_id
+        self._groups = {}
+        # lane -> 最近一个任务执行完毕的时间 (time.monotonic)，用于判断引擎是否空闲
+        self._last_active = {}
+        # lane -> 正在执行的任务数 (多线程子系统可能同时执行多个)
+        self._running = {}
+        self._lock = threading.Lock()
+
+    def register(self, command, lane, handler, workers=1):
+        """
+        注册命令处理函数。handler(request) 返回要合并进响应的字典。
+        workers: 子系统的工作线程数，只在第一次注册该子系统时生效
+        (例如多进程翻译池可以同时执行多条翻译)
+        """
+        self._routes[command] = (lane, handler)
+        if lane not in self._lanes:
+            q = queue.Queue()
+            self._lanes[lane] = q
+            self._workers[lane] = []
+            self._last_active[lane] = time.monotonic()
+            self._running[lane] = 0
+            for i in range(max(1, workers)):
+                worker = threading.Thread(
+                    target=self._worker_loop,
+                    args=(lane, q),
+                    name=f"dispatch-{lane}" if i == 0 else f"dispatch-{lane}-{i}",
+                    daemon=True,
+                )
+                self._workers[lane].append(worker)
+                worker.start()
+
+    def dispatch(self, request):
+        """将请求放入对应子系统的队列；未知命令返回 False"""
+        route = self._routes.get(request.get("command"))
+        if route is None:
+            return False
+
+        req_id = request.get("id")
+        cancel_event = threading.Event()
+        request["cancel_event"] = cancel_event
+
+        with self._lock:
+            if req_id is not None:
+                self._active[req_id] = cancel_event
+
+            # 同一分组 (例如同一个悬浮窗的翻译) 中，新请求取代旧请求
+            group = request.get("supersede")
+            if group is not None:
+                previous = self._groups.get(group)
+                if previous is not None and previous != req_id:
+                    self._cancel_locked(previous)
+                self._groups[group] = req_id
+
+        lane, handler = route
+        self._lanes[lane].put((request, handler, time.perf_counter()))
+        return True
+
+    def submit(self, lane, fn):
+        """
+        在指定子系统的工作线程中执行内部任务 fn() (不产生响应)。
+        用于跨子系统的流水线，例如 analyze_page 把分词、翻译交给对应队列，
+        保证每个引擎始终只在自己的工作线程中被调用。
+        """
+        self._lanes[lane].put((None, fn, time.perf_counter()))
+
+    def call(self, lane, fn):
+        """
+        submit() 的带结果版本：返回 concurrent.futures.Future，
+        fn() 的返回值或异常通过它交给等待的一方 (例如 tune 在 ocr 队列中调优 OCR)
+        """
+        future = Future()
+
+        def run():
+            # 排队期间已被取消
+            if not future.set_running_or_notify_cancel():
+                return
+            try:
+                future.set_result(fn())
+            except BaseException as e:
+                future.set_exception(e)
+
+        self.submit(lane, run)
+        return future
+
+    def cancel(self, req_id):
+        """取消指定请求；请求已完成或不存在时返回 False"""
+        with self._lock:
+            return self._cancel_locked(req_id)
+
+    def _cancel_locked(self, req_id):
+        cancel_event = self._active.get(req_id)
+        if cancel_event is None:
+            return False
+        cancel_event.set()
+        log_message(f"[INFO] Request {req_id} cancelled.")
+        return True
+
+    def queue_stats(self):
+        """各子系统队列中等待执行的请求数，以及排队或执行中的请求总数"""
+        with self._lock:
+            active = len(self._active)
+        return {
+            "pending": {lane: q.qsize() for lane, q in self._lanes.items()},
+            "active": active,
+        }
+
+    def idle_for(self, lane, exclude=0):
+        """
+        该子系统距离上一个任务执行完毕的秒数；有任务正在执行时为 0。
+        exclude: 不计入的正在执行的任务数 (在该子系统的任务内部调用时传 1，排除自身)
+        """
+        with self._lock:
+            running = self._running.get(lane, 0)
+        if running > exclude:
+            return 0
+        last = self._last_active.get(lane)
+        return time.monotonic() - last if last is not None else None
+
+    def shutdown(self):
+        """通知所有工作线程退出 (不会等待正在执行的任务)"""
+        for lane, q in self._lanes.items():
+            for _ in self._workers[lane]:
+                q.put(None)
+
+    def _worker_loop(self, lane, q):
+        while True:
+            item = q.get()
+            if item is None:
+                break
+
+            request, handler, enqueued = item
+            with self._lock:
+                self._running[lane] += 1
+            try:
+                if request is None:
+                    # submit() 提交的内部任务，不产生响应
+                    handler()
+                else:
+                    self._run(request, handler, time.perf_counter() - enqueued)
+            except Exception as e:
+                # 兜底：单个任务失败不能拖垮整个工作线程
+                log_message(f"[ERROR] Dispatcher lane '{lane}' crashed: {e}")
+            finally:
+                if request is not None:
+                    self._finish(request)
+                # 先记录结束时间再减少计数，idle_for 不会读到执行前的旧时间
+                self._last_active[lane] = time.monotonic()
+                with self._lock:
+                    self._running[lane] -= 1
+                q.task_done()
+
+    def _finish(self, request):
+        req_id = request.get("id")
+        with self._lock:
+            self._active.pop(req_id, None)
+            group = request.get("supersede")
+            if group is not None and self._groups.get(group) == req_id:
+                del self._groups[group]
+
+    def _run(self, request, handler, queue_wait_s=None):
+        req_id = request.get("id")
+        start = time.perf_counter()
+        outcome = "ok"
+        try:
+            # 排队期间已被取消的请求直接丢弃
+            if request["cancel_event"].is_set():
+                raise RequestCancelled()
+            payload = handler(request)
+            response = {"id": req_id, "success": True}
+            if payload:
+                response.update(payload)
+        except RequestCancelled:
+            outcome = "cancelled"
+            response = {
+                "id": req_id,
+                "success": False,
+                "cancelled": True,
+                "error": "cancelled",
+            }
+        except Exception as e:
+            outcome = "error"
+            response = {"id": req_id, "success": False, "error": str(e)}
+
+        metrics.record_command(
+            request.get("command"),
+            outcome,
+            time.perf_counter() - start,
+            queue_wait_s,
+        )
+        send_response(response)
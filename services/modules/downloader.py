@@ -0,0 +1,384 @@
+# services/modules/downloader.py
+import os
+import re
+import json
+import time
+import queue
+import hashlib
+import threading
+from urllib.parse import quote, urljoin
+from urllib.request import Request, HTTPRedirectHandler, build_opener
+from urllib.error import HTTPError
+from .utils import log_message
+from .progress import ProgressSource
+
+DEFAULT_ENDPOINT = "https://huggingface.co"
+MB = 1024 * 1024
+
+# backend_service 通过 configure() 设置 (--hf-endpoint / --download-manifest)
+_config = {"endpoint": None, "manifest": None}
+
+
+def configure(endpoint=None, manifest=None):
+    """
+    endpoint: 模型仓库地址 (镜像站或本地测试服务器)，默认读取 HF_ENDPOINT 环境变量；
+    manifest: 本地清单 JSON {repo_id: {文件名: {"size", "sha256"}}}，
+              其中的哈希优先于仓库返回的元数据
+    """
+    if endpoint:
+        _config["endpoint"] = endpoint
+    if manifest:
+        _config["manifest"] = manifest
+
+
+def _load_manifest(path, repo_id):
+    if not path or not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f).get(repo_id, {})
+    except Exception as e:
+        log_message(f"[WARN] Failed to read download manifest {path}: {e}")
+        return {}
+
+
+class _NoRedirect(HTTPRedirectHandler):
+    """HEAD 请求不自动跳转：LFS 文件的大小与 sha256 在跳转之前的响应头里"""
+
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class _RangeNotSupported(Exception):
+    pass
+
+
+class ModelDownloader:
+    """
+    按字节区间并行下载模型仓库中的文件 (只依赖标准库)：
+    - 文件先写入 <文件>.part，已完成的区间记录在 <文件>.part.json，中断后从断点继续；
+    - 下载完成后校验 sha256 (本地清单或仓库元数据；普通小文件校验 git blob sha1)，
+      通过后才重命名为正式文件名，因此正式文件存在即代表完整；
+    - 服务器不支持 Range 请求时退回单连接顺序下载。
+    仓库地址兼容 HuggingFace Hub 的 /resolve 与 /api/models 接口，可指向镜像或本地测试服务器。
+    """
+
+    chunk_size = 8 * MB
+    workers = 4
+    retries = 3
+    timeout = 30
+    read_size = 256 * 1024
+
+    def __init__(self, repo_id, revision="main", endpoint=None, manifest=None):
+        self.repo_id = repo_id
+        self.revision = revision
+        self.endpoint = (
+            endpoint
+            or _config["endpoint"]
+            or os.environ.get("HF_ENDPOINT")
+            or DEFAULT_ENDPOINT
+        ).rstrip("/")
+        self.manifest = _load_manifest(manifest or _config["manifest"], repo_id)
+        self._opener = build_opener()
+        self._head_opener = build_opener(_NoRedirect)
+        # 已通过 sha256 校验的文件 {文件名: sha256}，写入模型清单时无需重新计算
+        self.verified = {}
+
+    def _request(self, url, method="GET", headers=None):
+        base = {"User-Agent": "MangaReader", "Accept-Encoding": "identity"}
+        base.update(headers or {})
+        return Request(url, method=method, headers=base)
+
+    def _resolve_url(self, filename):
+        return "{}/{}/resolve/{}/{}".format(
+            self.endpoint,
+            self.repo_id,
+            quote(self.revision, safe=""),
+            quote(filename),
+        )
+
+    # --- 元数据 ---
+
+    def list_files(self):
+        """仓库中的所有文件名"""
+        url = "{}/api/models/{}/revision/{}".format(
+            self.endpoint, self.repo_id, quote(self.revision, safe="")
+        )
+        with self._opener.open(self._request(url), timeout=self.timeout) as resp:
+            info = json.load(resp)
+        return [s["rfilename"] for s in info.get("siblings", [])]
+
+    def file_info(self, filename):
+        """
+        HEAD 请求获取 {"url", "size", "hash": (算法, 十六进制)}。
+        LFS 文件由仓库跳转到 CDN，大小与 sha256 在跳转响应的 X-Linked-* 头里；
+        普通文件的 ETag 是 git blob sha1
+        """
+        url = self._resolve_url(filename)
+        for _ in range(5):
+            try:
+                resp = self._head_opener.open(
+                    self._request(url, "HEAD"), timeout=self.timeout
+                )
+                headers, location = resp.headers, url
+                resp.close()
+            except HTTPError as e:
+                if e.code not in (301, 302, 303, 307, 308):
+                    raise
+                headers, location = e.headers, urljoin(url, e.headers["Location"])
+                # 仓库内部的跳转 (改名、分支解析) 没有 X-Linked-*，继续跟随
+                if "X-Linked-Size" not in headers:
+                    url = location
+                    continue
+            break
+        else:
+            raise RuntimeError(f"Too many redirects for {filename}")
+
+        size = headers.get("X-Linked-Size") or headers.get("Content-Length")
+        etag = headers.get("X-Linked-Etag") or headers.get("ETag") or ""
+        etag = etag.strip()
+        if etag.startswith("W/"):
+            etag = etag[2:]
+        etag = etag.strip('"').lower()
+
+        digest = None
+        if re.fullmatch(r"[0-9a-f]{64}", etag):
+            digest = ("sha256", etag)
+        elif re.fullmatch(r"[0-9a-f]{40}", etag):
+            digest = ("git-sha1", etag)
+
+        # 本地清单优先
+        pinned = self.manifest.get(filename)
+        if pinned:
+            if pinned.get("sha256"):
+                digest = ("sha256", pinned["sha256"].lower())
+            if pinned.get("size") is not None:
+                size = pinned["size"]
+
+        if size is None:
+            raise RuntimeError(f"Server did not report the size of {filename}")
+        return {"url": location, "size": int(size), "hash": digest}
+
+    # --- 校验 ---
+
+    @staticmethod
+    def _hash_file(path, digest):
+        algo, _ = digest
+        if algo == "sha256":
+            h = hashlib.sha256()
+        else:
+            # git blob 对象哈希："blob <长度>\0" + 内容
+            h = hashlib.sha1(b"blob %d\0" % os.path.getsize(path))
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(4 * MB), b""):
+                h.update(block)
+        return h.hexdigest()
+
+    def _verify(self, path, info, filename=None):
+        if os.path.getsize(path) != info["size"]:
+            return False
+        if info["hash"] is None:
+            return True
+        if self._hash_file(path, info["hash"]) != info["hash"][1]:
+            return False
+        if filename is not None and info["hash"][0] == "sha256":
+            self.verified[filename] = info["hash"][1]
+        return True
+
+    # --- 下载 ---
+
+    def download(self, filename, dest_dir, progress=None):
+        """
+        下载单个文件到 dest_dir (保留仓库内的相对路径)，返回本地路径；
+        progress: progress_bus.task() 返回的 ProgressTask，为 None 时不报告进度
+        """
+        info = self.file_info(filename)
+        source = progress.source(info["size"]) if progress else ProgressSource()
+        return self._download(filename, info, dest_dir, source)
+
+    def download_snapshot(self, dest_dir, progress=None):
+        """下载仓库中的全部文件，各文件的进度合并为一个整体进度，返回文件名列表"""
+        infos = [(name, self.file_info(name)) for name in self.list_files()]
+        # 先登记所有文件的大小，整体百分比不会随着文件的开始而回退
+        sources = [
+            progress.source(info["size"]) if progress else ProgressSource()
+            for _, info in infos
+        ]
+        for (name, info), source in zip(infos, sources):
+            self._download(name, info, dest_dir, source)
+        return [name for name, _ in infos]
+
+    def _download(self, filename, info, dest_dir, progress):
+        dest = os.path.join(dest_dir, *filename.split("/"))
+        if os.path.exists(dest) and self._verify(dest, info, filename):
+            log_message(f"[INFO] Already up to date: {filename}")
+            progress.add(info["size"])
+            return dest
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+
+        part, state_path = dest + ".part", dest + ".part.json"
+        state = self._load_state(part, state_path, info)
+        started, base = time.monotonic(), progress.done
+        try:
+            self._download_ranges(info, part, state, state_path, progress)
+        except _RangeNotSupported:
+            log_message(
+                "[WARN] Server does not support range requests, "
+                f"downloading {filename} in one stream."
+            )
+            progress.add(base - progress.done)
+            state = self._new_state(part, info)
+            self._download_ranges(
+                info, part, state, state_path, progress, chunk_size=info["size"]
+            )
+
+        if info["hash"] is not None:
+            log_message(f"[INFO] Verifying {filename} ({info['hash'][0]})...")
+        if not self._verify(part, info, filename):
+            # 校验失败的数据不能用来续传
+            for path in (part, state_path):
+                if os.path.exists(path):
+                    os.remove(path)
+            raise RuntimeError(f"Checksum mismatch for {filename}")
+
+        os.replace(part, dest)
+        if os.path.exists(state_path):
+            os.remove(state_path)
+        elapsed = time.monotonic() - started
+        log_message(
+            f"[INFO] Downloaded {filename} ({info['size'] / MB:.1f} MB, {elapsed:.1f}s)"
+        )
+        return dest
+
+    def _new_state(self, part, info):
+        # 预先分配完整大小，各线程按偏移写入
+        with open(part, "wb") as f:
+            f.truncate(info["size"])
+        return {"size": info["size"], "hash": info["hash"], "done": []}
+
+    def _load_state(self, part, state_path, info):
+        """读取断点记录；文件大小或哈希与远端不一致时重新开始"""
+        try:
+            with open(state_path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+            hash_ = tuple(state["hash"]) if state.get("hash") else None
+            if (
+                state["size"] == info["size"]
+                and hash_ == info["hash"]
+                and os.path.getsize(part) == info["size"]
+            ):
+                done = sum(end - start for start, end in state["done"])
+                if done:
+                    log_message(
+                        f"[INFO] Resuming download at {done / MB:.1f} MB "
+                        f"of {info['size'] / MB:.1f} MB"
+                    )
+                return state
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+        return self._new_state(part, info)
+
+    @staticmethod
+    def _save_state(state, state_path):
+        # 合并相邻区间，保持记录简短
+        merged = []
+        for start, end in sorted(state["done"]):
+            if merged and start <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], end)
+            else:
+                merged.append([start, end])
+        state["done"] = merged
+        tmp = state_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(state, f)
+        os.replace(tmp, state_path)
+
+    def _missing_ranges(self, state, chunk_size):
+        """尚未下载的区间，按 chunk_size 切分"""
+        ranges, pos = [], 0
+        for start, end in sorted(state["done"]) + [[state["size"], state["size"]]]:
+            while pos < start:
+                ranges.append((pos, min(start, pos + chunk_size)))
+                pos = ranges[-1][1]
+            pos = max(pos, end)
+        return ranges
+
+    def _download_ranges(
+        self, info, part, state, state_path, progress, chunk_size=None
+    ):
+        pending = queue.Queue()
+        missing = self._missing_ranges(state, chunk_size or self.chunk_size)
+        for item in missing:
+            pending.put(item)
+        progress.add(info["size"] - sum(end - start for start, end in missing))
+
+        errors = []
+        state_lock = threading.Lock()
+
+        def worker():
+            with open(part, "r+b") as f:
+                while not errors:
+                    try:
+                        start, end = pending.get_nowait()
+                    except queue.Empty:
+                        return
+                    try:
+                        self._fetch_range(info, f, start, end, progress)
+                    except Exception as e:
+                        errors.append(e)
+                        return
+                    with state_lock:
+                        state["done"].append([start, end])
+                        self._save_state(state, state_path)
+
+        threads = [
+            threading.Thread(target=worker, name=f"download-{i}", daemon=True)
+            for i in range(min(self.workers, len(missing)))
+        ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        if errors:
+            # 已完成的区间都已记录，下次调用会从断点继续
+            raise errors[0]
+
+    def _fetch_range(self, info, f, start, end, progress):
+        """下载 [start, end) 写入 f 的对应位置；连接中断时从已写入的位置重试"""
+        pos, attempt = start, 0
+        whole = start == 0 and end == info["size"]
+        while pos < end:
+            request = self._request(
+                info["url"], headers={"Range": f"bytes={pos}-{end - 1}"}
+            )
+            try:
+                with self._opener.open(request, timeout=self.timeout) as resp:
+                    if resp.status != 206:
+                        if not whole:
+                            raise _RangeNotSupported()
+                        # 不支持 Range 的服务器总是从头返回整个文件
+                        progress.add(start - pos)
+                        pos = start
+                    f.seek(pos)
+                    while pos < end:
+                        block = resp.read(min(self.read_size, end - pos))
+                        if not block:
+                            break
+                        f.write(block)
+                        pos += len(block)
+                        progress.add(len(block))
+                if pos < end:
+                    raise ConnectionError("Connection closed before range end")
+            except _RangeNotSupported:
+                raise
+            except Exception as e:
+                attempt += 1
+                if attempt > self.retries:
+                    raise
+                log_message(
+                    f"[WARN] Range {pos}-{end - 1} failed ({e}), "
+                    f"retry {attempt}/{self.retries}"
+                )
+                time.sleep(min(2**attempt, 10))
+        f.flush()
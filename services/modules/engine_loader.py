@@ -0,0 +1,93 @@
+# services/modules/engine_loader.py
+import time
+import threading
+from .utils import log_message, send_response
+from .profiling import profiler
+
+
+class EngineLoader:
+    """
+    在后台线程中加载引擎 (OCR / 分词器)，让服务可以立即报告 ready。
+    加载完成后发送 {"type": "engine_ready", "engine": name}，失败时发送
+    {"type": "engine_error", ...}；在此之前到达的请求只会等待自己需要的引擎。
+    unload() 之后的第一次 get() 会重新加载。
+    """
+
+    def __init__(self, name, factory):
+        self.name = name
+        self.factory = factory
+        self.engine = None
+        self.error = None
+        self.load_time = None
+        self._done = threading.Event()
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    @classmethod
+    def loaded(cls, name, engine):
+        """包装一个已经加载好的引擎 (基准测试等场景直接传入引擎时使用)"""
+        loader = cls(name, None)
+        loader.engine = engine
+        loader._done.set()
+        return loader
+
+    @property
+    def is_ready(self):
+        return self._done.is_set() and self.error is None
+
+    @property
+    def is_loaded(self):
+        return self.engine is not None
+
+    def start(self):
+        with self._start_lock:
+            if self._thread is None and not self._done.is_set():
+                self._thread = threading.Thread(
+                    target=self._load, name=f"load-{self.name}", daemon=True
+                )
+                self._thread.start()
+        return self
+
+    def unload(self):
+        """释放引擎，下一次 get() 时重新加载 (直接传入的引擎没有 factory，不能卸载)"""
+        if self.factory is None:
+            raise Exception(f"Engine '{self.name}' cannot be reloaded")
+        with self._start_lock:
+            if not self._done.is_set():
+                # 仍在加载中
+                return
+            self.engine = None
+            self.error = None
+            self._thread = None
+            self._done.clear()
+
+    def _load(self):
+        start = time.perf_counter()
+        try:
+            # 重量级依赖 (torch / transformers / sudachipy) 在 factory 内部导入
+            with profiler.phase(f"{self.name}.load"):
+                self.engine = self.factory()
+            self.load_time = time.perf_counter() - start
+            log_message(f"[INFO] Engine '{self.name}' ready in {self.load_time:.2f}s")
+            send_response({"type": "engine_ready", "engine": self.name})
+        except Exception as e:
+            self.error = e
+            log_message(f"[ERROR] Engine '{self.name}' failed to load: {e}")
+            send_response(
+                {"type": "engine_error", "engine": self.name, "message": str(e)}
+            )
+        finally:
+            self._done.set()
+
+    def wait(self, timeout=None):
+        """等待加载结束 (无论成功与否)"""
+        return self._done.wait(timeout)
+
+    def get(self, timeout=None):
+        """阻塞直到引擎加载完成 (已卸载时先重新加载)；加载失败时抛出异常"""
+        self.start()
+        if not self._done.wait(timeout):
+            raise Exception(f"Engine '{self.name}' is still loading")
+        if self.error is not None:
+            raise Exception(f"Engine '{self.name}' unavailable: {self.error}")
+        return self.engine
@@ -0,0 +1,393 @@
+# services/modules/handlers.py
+import traceback
+from concurrent.futures import TimeoutError as FutureTimeout
+from .utils import log_message, send_response, RequestCancelled
+from .logger import DEBUG, logger, parse_level
+from .engine_loader import EngineLoader
+from .metrics import metrics
+from .profiling import current_rss, peak_rss
+
+
+class CommandHandlers:
+    """
+    命令处理函数集合。每个方法接收已解析的请求字典，返回需要合并进响应的字段；
+    抛出的异常会由调度器转换为 {"success": False, "error": ...}。
+    """
+
+    def __init__(
+        self, ocr_engine, tokenizer, translator, tuning_path=None, residency=None
+    ):
+        # OCR 与分词器可以是 EngineLoader (后台加载中)，也可以是已加载的引擎
+        self.ocr_loader = self._as_loader("ocr", ocr_engine)
+        self.tokenizer_loader = self._as_loader("tokenizer", tokenizer)
+        self.translator = translator
+        # register_all 时记录调度器，stats 命令需要读取队列状态
+        self.dispatcher = None
+        # analyze_page 首次使用时创建 (需要 numpy)
+        self._page_detector = None
+        # 硬件调优结果的保存路径 (models/tuning_profile.json)
+        self.tuning_path = tuning_path
+        # 可选的 ResidencyManager：空闲卸载与内存预算
+        self.residency = residency
+
+    @staticmethod
+    def _as_loader(name, engine):
+        if isinstance(engine, EngineLoader):
+            return engine
+        return EngineLoader.loaded(name, engine)
+
+    # 请求只等待自己需要的引擎加载完成
+    @property
+    def ocr_engine(self):
+        return self.ocr_loader.get()
+
+    @property
+    def tokenizer(self):
+        return self.tokenizer_loader.get()
+
+    def register_all(self, dispatcher):
+        """把所有命令注册到调度器，按所用模型划分子系统"""
+        self.dispatcher = dispatcher
+        dispatcher.register("recognize", "ocr", self.recognize)
+        dispatcher.register("recognize_batch", "ocr", self.recognize_batch)
+        dispatcher.register("cache_stats", "ocr", self.cache_stats)
+        # 整页分析只负责调度与等待，实际的 OCR / 分词 / 翻译在各自的队列中执行
+        dispatcher.register("analyze_page", "page", self.analyze_page)
+        dispatcher.register("tokenize", "tokenizer", self.tokenize)
+        dispatcher.register("tokenize_batch", "tokenizer", self.tokenize_batch)
+        # 多进程翻译池可以同时执行多条翻译 (concurrency 个工作线程)
+        dispatcher.register(
+            "translate",
+            "translator",
+            self.translate,
+            workers=getattr(self.translator, "concurrency", 1),
+        )
+        dispatcher.register("translate_batch", "translator", self.translate_batch)
+        # 模型管理命令与翻译共用同一队列，避免与正在进行的翻译争抢模型
+        dispatcher.register("check_model", "translator", self.check_model)
+        dispatcher.register("download_model", "translator", self.download_model)
+        dispatcher.register("delete_model", "translator", self.delete_model)
+        dispatcher.register("tune", "translator", self.tune)
+        # 诊断命令使用独立队列，不会排在耗时的 OCR / 翻译请求之后
+        dispatcher.register("stats", "diagnostics", self.stats)
+        dispatcher.register("logs", "diagnostics", self.logs)
+
+    # -> OCR 任务
+    @staticmethod
+    def image_inputs(request, key):
+        """
+        请求中的图像列表。分帧协议下图片以二进制附件的形式随请求一起到达；
+        请求带有 raw 描述 ({"width", "height", "format", "stride"}，单个或逐张)
+        时，附件 / Base64 内容是未经编码的原始像素，直接按数组读取
+        """
+        images = request.get("attachments") or request.get(key) or []
+        if not isinstance(images, list):
+            images = [images]
+
+        raw = request.get("raw")
+        if raw:
+            layouts = raw if isinstance(raw, list) else [raw] * len(images)
+            images = [{**layout, "data": data} for layout, data in zip(layouts, images)]
+        return images
+
+    def recognize(self, request):
+        images = self.image_inputs(request, "image")
+        if not images:
+            raise Exception("No image in request")
+        text = self.ocr_engine.recognize(images[0], request.get("cancel_event"))
+        return {"text": text}
+
+    def recognize_batch(self, request):
+        images = self.image_inputs(request, "images")
+        texts = self.ocr_engine.recognize_batch(images, request.get("cancel_event"))
+        return {"texts": texts}
+
+    def analyze_page(self, request):
+        from .page_detector import TextRegionDetector
+        from .page_pipeline import PageAnalysis
+
+        if self._page_detector is None:
+            self._page_detector = TextRegionDetector()
+        return PageAnalysis(self, self._page_detector, request).run()
+
+    def cache_stats(self, request):
+        # 不等待 OCR 引擎加载，未就绪时视为没有缓存
+        ocr_engine = self.ocr_loader.engine
+        ocr_cache = ocr_engine.cache if ocr_engine is not None else None
+        translation_cache = getattr(self.translator, "cache", None)
+        return {
+            "ocr_cache": ocr_cache.stats() if ocr_cache is not None else None,
+            "translation_cache": (
+                translation_cache.stats() if translation_cache is not None else None
+            ),
+        }
+
+    # -> 诊断：命令延迟直方图、锁等待、缓存命中率、内存与模型加载耗时
+    def stats(self, request):
+        caches = self.cache_stats(request)
+        tokenizer = self.tokenizer_loader.engine
+        token_info = getattr(tokenizer, "_token_info", None)
+        if token_info is not None:
+            info = token_info.cache_info()
+            lookups = info.hits + info.misses
+            caches["token_cache"] = {
+                "hits": info.hits,
+                "misses": info.misses,
+                "hit_rate": round(info.hits / lookups, 4) if lookups else 0.0,
+                "entries": info.currsize,
+            }
+
+        load_times = {
+            "ocr": self.ocr_loader.load_time,
+            "tokenizer": self.tokenizer_loader.load_time,
+            "translator": getattr(self.translator, "load_time", None),
+        }
+
+        return {
+            "stats": {
+                **metrics.snapshot(),
+                "queues": self.dispatcher.queue_stats() if self.dispatcher else None,
+                "caches": caches,
+                "rss": current_rss(),
+                "peak_rss": peak_rss(),
+                "residency": self.residency.snapshot() if self.residency else None,
+                "logging": logger.stats(),
+                "translator_workers": (
+                    self.translator.worker_stats()
+                    if hasattr(self.translator, "worker_stats")
+                    else None
+                ),
+                "load_times": {
+                    name: round(value, 3) if value is not None else None
+                    for name, value in load_times.items()
+                },
+            }
+        }
+
+    # -> 诊断：最近的日志 (环形缓冲区)，用于问题报告
+    def logs(self, request):
+        # capture: 开始额外记录到该级别 (例如 "debug")，"off" 恢复为只记录 stderr 输出
+        if "capture" in request:
+            capture = request["capture"]
+            logger.set_capture_level(None if capture in (None, "off") else capture)
+        entries = logger.recent(
+            limit=request.get("limit"),
+            level=parse_level(request.get("level", "debug")),
+        )
+        return {"entries": entries, "logging": logger.stats()}
+
+    # -> 分词任务
+    def tokenize(self, request):
+        try:
+            text = request.get("text", "")
+            log_message("Processing tokenize request for: %.50r", text, level=DEBUG)
+            tokens = self.tokenizer.tokenize(text)
+            return {"tokens": tokens}
+        except Exception as e:
+            log_message(f"Tokenize Error: {e}")
+            raise
+
+    def tokenize_batch(self, request):
+        try:
+            texts = request.get("texts", [])
+            log_message(
+                "Processing tokenize_batch request (%d texts)", len(texts), level=DEBUG
+            )
+            return {"batch_tokens": self.tokenizer.tokenize_batch(texts)}
+        except Exception as e:
+            log_message(f"Tokenize Error: {e}")
+            raise
+
+    # --- Translate ---
+    def translate(self, request):
+        translator = self.translator
+        cancel_event = request.get("cancel_event")
+        try:
+            text = request.get("text", "")
+            log_message("Processing translate request for: %.50r", text, level=DEBUG)
+
+            # 1. 检查是否已加载
+            lookup = True
+            if not translator.is_ready:
+                # 命中翻译记忆时无需加载模型
+                cached = translator.lookup_cached(text)
+                if cached is not None:
+                    log_message("Translation memory hit.", level=DEBUG)
+                    return {"translation": cached}
+
+                self._initialize_translator()
+                # 已经确认未命中，翻译时不再重复查询 (否则未命中会被统计两次)
+                lookup = False
+
+            # 3. 执行翻译
+            if request.get("stream"):
+                result = self._translate_streaming(
+                    request.get("id"), text, cancel_event, lookup
+                )
+            else:
+                result = translator.translate(text, cancel_event, lookup)
+            log_message("Translation result: %.50r", result, level=DEBUG)
+            return {"translation": result}
+
+        except RequestCancelled:
+            log_message("[INFO] Translation cancelled.")
+            raise
+        except Exception as e:
+            # 捕获错误 (包括上面的 MODEL_NOT_FOUND)
+            log_message(f"[ERROR] Translation Error: {e}")
+            log_message(f"[ERROR] Traceback: {traceback.format_exc()}")
+            raise
+
+    def translate_batch(self, request):
+        translator = self.translator
+        try:
+            texts = request.get("texts", [])
+            log_message(
+                "Processing translate_batch request (%d texts)", len(texts), level=DEBUG
+            )
+
+            if translator.is_ready:
+                translations = translator.translate_batch(
+                    texts, request.get("cancel_event")
+                )
+                return {"translations": translations}
+
+            # 全部命中翻译记忆时无需加载模型
+            translations = [translator.lookup_cached(text) for text in texts]
+            if all(t is not None for t in translations):
+                log_message("Translation memory hit.", level=DEBUG)
+                return {"translations": translations}
+            self._initialize_translator()
+
+            # 只翻译未命中的行，并且不再重复查询翻译记忆
+            pending = [i for i, t in enumerate(translations) if t is None]
+            results = translator.translate_batch(
+                [texts[i] for i in pending], request.get("cancel_event"), lookup=False
+            )
+            for i, translation in zip(pending, results):
+                translations[i] = translation
+            return {"translations": translations}
+
+        except RequestCancelled:
+            log_message("[INFO] Translation cancelled.")
+            raise
+        except Exception as e:
+            log_message(f"[ERROR] Translation Error: {e}")
+            log_message(f"[ERROR] Traceback: {traceback.format_exc()}")
+            raise
+
+    def _initialize_translator(self):
+        """按需加载翻译模型；模型文件不存在时抛出 MODEL_NOT_FOUND"""
+        log_message("Translator not ready. Checking model existence...", level=DEBUG)
+        # 检查物理文件是否存在
+        if self.translator.check_model_exists():
+            # 存在则加载
+            log_message("Model exists. Initializing translator...", level=DEBUG)
+            self._load_translator()
+        else:
+            log_message("[ERROR] Model not found.")
+            raise Exception("MODEL_NOT_FOUND")
+
+    def _load_translator(self):
+        """(重新) 加载翻译模型；有常驻管理器时先按内存预算腾出空间"""
+        if self.residency is None:
+            self.translator.initialize()
+            return
+        with self.residency.loading("translator"):
+            self.translator.initialize()
+
+    def _translate_streaming(self, req_id, text, cancel_event=None, lookup=True):
+        """逐段发送 translation_partial 消息，返回完整译文作为最终响应"""
+        translation = ""
+        for delta in self.translator.translate_stream(text, cancel_event, lookup):
+            translation += delta
+            send_response(
+                {
+                    "id": req_id,
+                    "type": "translation_partial",
+                    "delta": delta,
+                    "text": translation,
+                }
+            )
+        return translation.strip()
+
+    # --- Model Management ---
+
+    # 1. 检查模型状态
+    def check_model(self, request):
+        return {"exists": self.translator.check_model_exists()}
+
+    # 2. 下载模型
+    def download_model(self, request):
+        self.translator.download_model()
+        # 下载完顺便初始化一下，确保可用
+        self._load_translator()
+        return {}
+
+    # 3. 删除模型
+    def delete_model(self, request):
+        return {"success": self.translator.delete_model()}
+
+    # 4. 硬件调优：测量几组线程数 / 批大小等参数，保存最快的一组，下次启动时应用
+    def tune(self, request):
+        from .tuning import merge_profile, save_profile, tune_ocr, tune_translator
+        from .residency import enforce_unloadable_settings
+
+        cancel_event = request.get("cancel_event")
+        translator = self.translator
+        profile = {}
+
+        if translator.check_model_exists() and hasattr(
+            translator, "benchmark_settings"
+        ):
+            was_ready = translator.is_ready
+            # 开启了空闲卸载 / 内存预算时不搜索 use_mlock，并在重新加载前强制 mmap
+            resident = self.residency is not None and self.residency.active
+            try:
+                profile["translator"] = tune_translator(
+                    translator, cancel_event, search_mlock=not resident
+                )
+            finally:
+                # 评测会卸载模型，之前已加载的话用最佳参数重新加载
+                if "translator" in profile:
+                    settings = profile["translator"]["settings"]
+                    translator.apply_settings(settings)
+                    if resident:
+                        enforce_unloadable_settings(translator, settings)
+                if was_ready:
+                    self._load_translator()
+        else:
+            log_message("[INFO] Translation model not installed, skipping tuning.")
+
+        # OCR 仍在加载时不等待，只调优已加载的引擎；
+        # 调优在 ocr 队列中执行，不与正在处理的 OCR 请求同时使用模型
+        def run_ocr_tuning():
+            engine = self.ocr_loader.engine
+            if engine is None:
+                return None
+            return tune_ocr(engine, cancel_event)
+
+        if self.ocr_loader.is_ready:
+            ocr_profile = self._call_on_lane("ocr", run_ocr_tuning, cancel_event)
+            if ocr_profile is not None:
+                profile["ocr"] = ocr_profile
+
+        if self.tuning_path:
+            profile = save_profile(
+                self.tuning_path, merge_profile(self.tuning_path, profile)
+            )
+        return {"profile": profile}
+
+    def _call_on_lane(self, lane, fn, cancel_event=None):
+        """在指定子系统的工作线程中执行 fn() 并等待结果 (没有调度器时直接执行)"""
+        if self.dispatcher is None:
+            return fn()
+        future = self.dispatcher.call(lane, fn)
+        while True:
+            try:
+                return future.result(timeout=0.5)
+            except FutureTimeout:
+                # 还在排队时可以直接撤销；已开始执行的任务自行检查 cancel_event
+                if cancel_event is not None and cancel_event.is_set():
+                    if future.cancel():
+                        raise RequestCancelled()
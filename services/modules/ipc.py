@@ -0,0 +1,160 @@
+# services/modules/ipc.py
+import sys
+import json
+import base64
+import struct
+import threading
+from .utils import log_message
+
+# --- 二进制分帧协议 ---
+# 每一帧: [1 字节类型][4 字节大端长度][payload]
+#   J: UTF-8 JSON 消息 (请求或响应)
+#   B: 原始二进制附件 (例如图片字节)，紧跟在声明了 "attachments" 的 J 帧之后
+# 这样图片无需再做 Base64，也不会被 JSON 字符串转义放大
+FRAME_JSON = b"J"
+FRAME_BLOB = b"B"
+FRAME_HEADER = struct.Struct(">cI")
+
+PROTOCOL_LINE = "line"
+PROTOCOL_FRAMED = "framed"
+SUPPORTED_PROTOCOLS = (PROTOCOL_LINE, PROTOCOL_FRAMED)
+
+
+def encode_frame(kind, payload):
+    return FRAME_HEADER.pack(kind, len(payload)) + payload
+
+
+def read_exact(stream, size):
+    """从二进制流中精确读取 size 字节；流结束时返回 None"""
+    chunks = []
+    remaining = size
+    while remaining > 0:
+        chunk = stream.read(remaining)
+        if not chunk:
+            return None
+        chunks.append(chunk)
+        remaining -= len(chunk)
+    return b"".join(chunks)
+
+
+def read_frame(stream):
+    """读取一帧，返回 (kind, payload)；流结束时返回 None"""
+    header = read_exact(stream, FRAME_HEADER.size)
+    if header is None:
+        return None
+    kind, length = FRAME_HEADER.unpack(header)
+    payload = read_exact(stream, length) if length else b""
+    if payload is None:
+        return None
+    return kind, payload
+
+
+def decode_line(line):
+    """解析旧的行协议：Base64(JSON)，兼容直接发送 JSON 的情况"""
+    # [Fix Encoding] 解码 Base64
+    try:
+        # 1. Base64 -> Bytes (UTF-8) -> String -> JSON
+        return json.loads(base64.b64decode(line).decode("utf-8"))
+    except Exception as e:
+        log_message(f"[CRITICAL] Failed to decode Base64 payload: {e}")
+        # 尝试直接解析（兼容旧模式，虽然现在应该都是 Base64）
+        return json.loads(line)
+
+
+def decode_framed_request(payload, stream):
+    """解析一个 J 帧，并读取它声明的附件帧，附件放在 request["attachments"]"""
+    request = json.loads(payload.decode("utf-8"))
+    count = request.get("attachments", 0)
+    attachments = []
+    for _ in range(count):
+        frame = read_frame(stream)
+        if frame is None:
+            raise EOFError("Stream closed while reading attachments")
+        kind, blob = frame
+        if kind != FRAME_BLOB:
+            raise ValueError(f"Expected attachment frame, got {kind!r}")
+        attachments.append(blob)
+    request["attachments"] = attachments
+    return request
+
+
+class LineProtocol:
+    """默认协议：每行一个 Base64(JSON) 请求，每行一个 ASCII JSON 响应"""
+
+    name = PROTOCOL_LINE
+
+    def __init__(self, stdin, stdout):
+        self.stdin = stdin
+        self.stdout = stdout
+        self.lock = threading.Lock()
+
+    def read_requests(self):
+        for line in self.stdin:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield decode_line(line)
+            except Exception:
+                continue
+
+    def send(self, response):
+        # ensure_ascii=True 保证管道上只有 ASCII，避免 Windows 编码问题
+        line = json.dumps(response, ensure_ascii=True)
+        with self.lock:
+            self.stdout.write(line + "\n")
+            self.stdout.flush()
+
+
+class FramedProtocol:
+    """长度前缀的二进制分帧协议，直接读写底层字节流"""
+
+    name = PROTOCOL_FRAMED
+
+    def __init__(self, stdin_buffer, stdout_buffer):
+        self.stdin = stdin_buffer
+        self.stdout = stdout_buffer
+        self.lock = threading.Lock()
+
+    def read_requests(self):
+        while True:
+            frame = read_frame(self.stdin)
+            if frame is None:
+                return
+            kind, payload = frame
+            if kind != FRAME_JSON:
+                log_message(f"[WARN] Dropping unexpected frame type: {kind!r}")
+                continue
+            try:
+                yield decode_framed_request(payload, self.stdin)
+            except EOFError:
+                return
+            except Exception as e:
+                log_message(f"[ERROR] Failed to decode framed request: {e}")
+
+    def send(self, response):
+        payload = json.dumps(response, ensure_ascii=False).encode("utf-8")
+        frame = encode_frame(FRAME_JSON, payload)
+        with self.lock:
+            self.stdout.write(frame)
+            self.stdout.flush()
+
+
+def open_protocol(requested):
+    """
+    根据启动参数选择协议。分帧模式下先用旧的行协议发出一条
+    {"type": "protocol"} 握手消息，之后双方切换到二进制帧；
+    旧版本的 Electron/后端不认识该消息，自然回退到行协议。
+    """
+    if requested != PROTOCOL_FRAMED:
+        return LineProtocol(sys.stdin, sys.stdout)
+
+    stdout_buffer = sys.stdout.buffer
+    handshake = json.dumps({"type": "protocol", "protocol": PROTOCOL_FRAMED})
+    sys.stdout.write(handshake + "\n")
+    sys.stdout.flush()
+
+    # 从此以后 stdout 只承载二进制帧：把误打到 stdout 的 print 转到 stderr，
+    # 防止第三方库的输出破坏帧边界
+    sys.stdout = sys.stderr
+    return FramedProtocol(sys.stdin.buffer, stdout_buffer)
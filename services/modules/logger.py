@@ -0,0 +1,201 @@
+# services/modules/logger.py
+import sys
+import time
+import queue
+import atexit
+import threading
+import collections
+
+DEBUG = 10
+INFO = 20
+WARN = 30
+ERROR = 40
+
+LEVELS = {"debug": DEBUG, "info": INFO, "warn": WARN, "error": ERROR}
+LEVEL_NAMES = {DEBUG: "DEBUG", INFO: "INFO", WARN: "WARN", ERROR: "ERROR"}
+
+# 旧的调用方式把级别写在消息开头："[INFO] ..."
+_TAG_LEVELS = {
+    "[DEBUG]": DEBUG,
+    "[INFO]": INFO,
+    "[WARN]": WARN,
+    "[WARNING]": WARN,
+    "[ERROR]": ERROR,
+    "[CRITICAL]": ERROR,
+}
+
+
+def parse_level(value):
+    """级别名 (debug / info / warn / error) 或数值 -> 级别数值"""
+    if isinstance(value, int):
+        return value
+    try:
+        return LEVELS[str(value).lower()]
+    except KeyError:
+        raise ValueError(f"Unknown log level: {value}")
+
+
+def tagged_level(message):
+    """消息开头的级别标记，没有标记时为 INFO"""
+    if message[:1] == "[":
+        return _TAG_LEVELS.get(message.split("]", 1)[0] + "]", INFO)
+    return INFO
+
+
+class BackendLogger:
+    """
+    非阻塞日志：
+    - 低于 threshold (当前级别与记录级别中较低者) 的日志直接返回，
+      不读取时间与线程名，模板参数不会被格式化；
+    - 其余日志以 (时间, 级别, 线程, 模板, 参数) 记入最近 capacity 条的环形缓冲区，
+      供 logs 命令导出到问题报告中，模板参数在导出时才格式化。默认只记录写入 stderr
+      的日志；需要 stderr 上不显示的 DEBUG 时用 set_capture_level 开启 (--log-capture
+      或 logs 命令的 capture 参数)；
+    - 不低于当前级别 (level) 的日志同时放入有界队列，由后台线程格式化、
+      写入 stderr (批量合并为一次写入)；
+    - 队列满时丢弃新日志 (只影响 stderr 输出) 并计数，不会阻塞请求处理。
+    """
+
+    prefix = "[Backend Service]"
+
+    def __init__(self, level=INFO, queue_size=4096, capacity=500, capture_level=None):
+        self.level = level
+        # 环形缓冲区额外记录的最低级别；None 表示与 level 相同
+        self.capture_level = capture_level
+        self.threshold = self._threshold()
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._recent = collections.deque(maxlen=capacity)
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def _threshold(self):
+        if self.capture_level is None:
+            return self.level
+        return min(self.level, self.capture_level)
+
+    def set_level(self, level):
+        self.level = parse_level(level)
+        self.threshold = self._threshold()
+
+    def set_capture_level(self, level):
+        """level 为 None 时不额外记录 (只保留写入 stderr 的日志)"""
+        self.capture_level = None if level is None else parse_level(level)
+        self.threshold = self._threshold()
+
+    def enabled(self, level):
+        return level >= self.level
+
+    def log(self, level, message, *args, tag=False):
+        """tag=True 时输出前补上 "[级别] " 标记 (消息本身不带标记时)"""
+        if level < self.threshold:
+            return
+        thread = threading.current_thread().name
+        entry = (time.time(), level, thread, message, args, tag)
+        # deque.append 与 list(deque) 在持有 GIL 时一次完成，不需要额外加锁
+        self._recent.append(entry)
+        if level < self.level:
+            return
+        if self._thread is None:
+            self._start()
+        try:
+            self._queue.put_nowait(entry)
+        except queue.Full:
+            self.dropped += 1
+
+    def flush(self, timeout=2.0):
+        """等待队列中已有的日志写出 (退出前调用)"""
+        if self._thread is None or not self._thread.is_alive():
+            return
+        done = threading.Event()
+        try:
+            self._queue.put(done, timeout=timeout)
+        except queue.Full:
+            return
+        done.wait(timeout)
+
+    def recent(self, limit=None, level=DEBUG):
+        """最近的日志条目 (旧 -> 新)，可按最低级别过滤"""
+        entries = [e for e in list(self._recent) if e[1] >= level]
+        if limit:
+            entries = entries[-limit:]
+        return [
+            {
+                "time": round(created, 3),
+                "level": LEVEL_NAMES.get(entry_level, str(entry_level)),
+                "thread": thread,
+                "message": self._format(message, args, entry_level, tag),
+            }
+            for created, entry_level, thread, message, args, tag in entries
+        ]
+
+    def stats(self):
+        return {
+            "level": LEVEL_NAMES.get(self.level, self.level),
+            "capture": LEVEL_NAMES.get(self.threshold, self.threshold),
+            "queued": self._queue.qsize(),
+            "dropped": self.dropped,
+        }
+
+    def _start(self):
+        with self._start_lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(
+                target=self._writer_loop, name="logger", daemon=True
+            )
+            self._thread.start()
+            atexit.register(self.flush)
+
+    @staticmethod
+    def _format(message, args, level, tag):
+        text = message
+        if args:
+            try:
+                text = message % args
+            except (TypeError, ValueError):
+                text = " ".join([message, *map(repr, args)])
+        if tag:
+            text = f"[{LEVEL_NAMES.get(level, level)}] {text}"
+        return text
+
+    def _writer_loop(self):
+        reported_drops = 0
+        while True:
+            batch = [self._queue.get()]
+            # 一次取出已经排队的全部日志，合并为一次写入与 flush
+            while len(batch) < 256:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            lines, waiters = [], []
+            for item in batch:
+                if isinstance(item, threading.Event):
+                    waiters.append(item)
+                    continue
+                _, level, _, message, args, tag = item
+                text = self._format(message, args, level, tag)
+                lines.append(f"{self.prefix} {text}\n")
+
+            if self.dropped != reported_drops:
+                lines.append(
+                    f"{self.prefix} [WARN] Log queue full, "
+                    f"{self.dropped - reported_drops} message(s) dropped.\n"
+                )
+                reported_drops = self.dropped
+
+            if lines:
+                try:
+                    # 每次写入时读取 sys.stderr：启动时会重新配置其编码
+                    sys.stderr.write("".join(lines))
+                    sys.stderr.flush()
+                except Exception:
+                    pass
+            for waiter in waiters:
+                waiter.set()
+
+
+# 全局日志实例
+logger = BackendLogger()
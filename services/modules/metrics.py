@@ -0,0 +1,136 @@
+# services/modules/metrics.py
+import time
+import bisect
+import threading
+import contextlib
+
+# 延迟直方图的桶上界 (毫秒)，最后一个桶收集所有更慢的请求
+LATENCY_BUCKETS_MS = (
+    1, 2, 5, 10, 20, 50, 100, 200, 500,
+    1000, 2000, 5000, 10000, 30000, 60000,
+)  # fmt: skip
+
+
+class LatencyHistogram:
+    """固定桶的延迟直方图：记录开销为一次二分查找，内存占用固定"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS_MS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def record(self, ms):
+        self.counts[bisect.bisect_left(self.buckets, ms)] += 1
+        self.count += 1
+        self.total_ms += ms
+        if ms > self.max_ms:
+            self.max_ms = ms
+
+    def percentile(self, pct):
+        """按桶估算百分位数 (所在桶的上界，不超过实际最大值)"""
+        if not self.count:
+            return None
+        rank = pct / 100 * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank and n:
+                bound = self.buckets[i] if i < len(self.buckets) else self.max_ms
+                return round(min(bound, self.max_ms), 2)
+        return self.max_ms
+
+    def snapshot(self):
+        return {
+            "count": self.count,
+            "mean_ms": round(self.total_ms / self.count, 2) if self.count else None,
+            "max_ms": round(self.max_ms, 2),
+            "p50_ms": self.percentile(50),
+            "p95_ms": self.percentile(95),
+            "p99_ms": self.percentile(99),
+            # [上界, 数量]，上界为 None 表示超过最后一个桶
+            "buckets": [
+                [self.buckets[i] if i < len(self.buckets) else None, n]
+                for i, n in enumerate(self.counts)
+                if n
+            ],
+        }
+
+
+class MetricsRegistry:
+    """
+    运行时指标：每个命令的次数、错误数与延迟直方图 (执行耗时与排队耗时)，
+    以及各个锁的等待时间。stats 命令读取 snapshot()。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._started = time.time()
+        # command -> {"ok", "errors", "cancelled", "latency", "queue_wait"}
+        self._commands = {}
+        # 锁名称 -> 等待时间直方图
+        self._lock_waits = {}
+
+    def record_command(self, command, outcome, duration_s, queue_wait_s=None):
+        """outcome: ok / error / cancelled"""
+        with self._lock:
+            entry = self._commands.get(command)
+            if entry is None:
+                entry = {
+                    "ok": 0,
+                    "errors": 0,
+                    "cancelled": 0,
+                    "latency": LatencyHistogram(),
+                    "queue_wait": LatencyHistogram(),
+                }
+                self._commands[command] = entry
+
+            entry["errors" if outcome == "error" else outcome] += 1
+            entry["latency"].record(duration_s * 1000)
+            if queue_wait_s is not None:
+                entry["queue_wait"].record(queue_wait_s * 1000)
+
+    def record_lock_wait(self, name, wait_s):
+        with self._lock:
+            histogram = self._lock_waits.get(name)
+            if histogram is None:
+                histogram = self._lock_waits[name] = LatencyHistogram()
+            histogram.record(wait_s * 1000)
+
+    @contextlib.contextmanager
+    def acquire(self, lock, name):
+        """获取锁并记录等待时间，用法与 `with lock:` 相同"""
+        start = time.perf_counter()
+        with lock:
+            self.record_lock_wait(name, time.perf_counter() - start)
+            yield
+
+    def snapshot(self):
+        with self._lock:
+            commands = {
+                command: {
+                    "count": entry["ok"] + entry["errors"] + entry["cancelled"],
+                    "errors": entry["errors"],
+                    "cancelled": entry["cancelled"],
+                    "latency": entry["latency"].snapshot(),
+                    "queue_wait": entry["queue_wait"].snapshot(),
+                }
+                for command, entry in self._commands.items()
+            }
+            lock_waits = {
+                name: {
+                    **histogram.snapshot(),
+                    "total_ms": round(histogram.total_ms, 2),
+                }
+                for name, histogram in self._lock_waits.items()
+            }
+        return {
+            "uptime_s": round(time.time() - self._started, 1),
+            "commands": commands,
+            "lock_waits": lock_waits,
+        }
+
+
+# 全局实例：调度器与各引擎共用
+metrics = MetricsRegistry()
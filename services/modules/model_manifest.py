@@ -0,0 +1,185 @@
+# services/modules/model_manifest.py
+import os
+import json
+import struct
+import hashlib
+import zipfile
+import threading
+from .utils import log_message
+
+MANIFEST_FILENAME = ".manifest.json"
+MB = 1024 * 1024
+
+# check() 的结果
+MANIFEST_MISSING = "missing"  # 还没有清单 (旧版本下载的模型)，需要按旧方式检查
+MANIFEST_OK = "ok"  # 所有文件的大小与修改时间都与清单一致
+MANIFEST_CHANGED = "changed"  # 大小一致但修改时间变了，需要在后台重新计算哈希
+MANIFEST_CORRUPT = "corrupt"  # 文件缺失、大小不符或哈希校验失败
+
+
+def sha256_file(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(4 * MB), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def safetensors_truncated(path):
+    """
+    safetensors 结构检查 (只读文件头)：8 字节头长度 + JSON 头，
+    最大的 data_offsets 终点加上头部长度必须等于文件大小
+    """
+    try:
+        size = os.path.getsize(path)
+        with open(path, "rb") as f:
+            (header_len,) = struct.unpack("<Q", f.read(8))
+            if 8 + header_len > size:
+                return True
+            header = json.loads(f.read(header_len))
+        end = max(
+            (t["data_offsets"][1] for k, t in header.items() if k != "__metadata__"),
+            default=0,
+        )
+        return 8 + header_len + end != size
+    except (OSError, ValueError, KeyError, TypeError, struct.error):
+        return True
+
+
+def torch_bin_truncated(path):
+    """
+    pytorch_model.bin 截断检查：zip 格式 (torch >= 1.6) 的目录在文件末尾，
+    截断后 is_zipfile 失败；旧版 pickle 格式没有可校验的结构，只检查非空
+    """
+    try:
+        with open(path, "rb") as f:
+            magic = f.read(4)
+        if not magic:
+            return True
+        return magic == b"PK\x03\x04" and not zipfile.is_zipfile(path)
+    except OSError:
+        return True
+
+
+class ModelManifest:
+    """
+    模型目录下的文件清单 (.manifest.json)：{相对路径: {"size", "mtime_ns", "sha256"}}。
+    下载完成或首次加载成功后写入；之后启动时只需比较 stat 结果，
+    只有修改时间变化的文件才在后台重新计算哈希，大小不符的文件直接判定为损坏。
+    """
+
+    def __init__(self, model_dir):
+        self.model_dir = model_dir
+        self.path = os.path.join(model_dir, MANIFEST_FILENAME)
+        self._lock = threading.Lock()
+
+    def _load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _save(self, manifest):
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(tmp, self.path)
+
+    @staticmethod
+    def _stat(path):
+        st = os.stat(path)
+        return st.st_size, st.st_mtime_ns
+
+    def check(self):
+        """
+        只做 stat 比较，返回 (状态, 需要重新校验的文件列表)，状态为 MANIFEST_* 之一
+        """
+        manifest = self._load()
+        if not manifest or not manifest.get("files"):
+            return MANIFEST_MISSING, []
+        if manifest.get("corrupt"):
+            return MANIFEST_CORRUPT, list(manifest["corrupt"])
+
+        changed = []
+        for name, entry in manifest["files"].items():
+            try:
+                size, mtime_ns = self._stat(os.path.join(self.model_dir, name))
+            except OSError:
+                return MANIFEST_CORRUPT, [name]
+            if size != entry["size"]:
+                return MANIFEST_CORRUPT, [name]
+            if mtime_ns != entry["mtime_ns"]:
+                changed.append(name)
+        return (MANIFEST_CHANGED if changed else MANIFEST_OK), changed
+
+    def record(self, files, hashes=None):
+        """
+        为 files 写入清单；hashes 中已有的 sha256 (下载时已校验) 直接使用，
+        其余文件在这里计算 (大文件可能需要数秒，调用方应放在后台线程)
+        """
+        hashes = hashes or {}
+        entries = {}
+        for name in files:
+            path = os.path.join(self.model_dir, name)
+            before = self._stat(path)
+            digest = hashes.get(name) or sha256_file(path)
+            # 计算哈希期间文件被改动则放弃本次记录
+            if self._stat(path) != before:
+                log_message(f"[WARN] {name} changed while hashing, manifest skipped.")
+                return False
+            entries[name] = {
+                "size": before[0],
+                "mtime_ns": before[1],
+                "sha256": digest,
+            }
+        with self._lock:
+            self._save({"version": 1, "files": entries})
+        log_message(f"[INFO] Model manifest written: {self.path}")
+        return True
+
+    def verify(self, names):
+        """
+        重新计算 names 的哈希：一致则更新清单中的修改时间，
+        不一致则在清单中标记为损坏 (下次启动时视为模型不完整)。返回损坏的文件列表
+        """
+        manifest = self._load()
+        if not manifest:
+            return []
+        corrupt = []
+        for name in names:
+            entry = manifest["files"].get(name)
+            if entry is None:
+                continue
+            path = os.path.join(self.model_dir, name)
+            try:
+                size, mtime_ns = self._stat(path)
+                ok = size == entry["size"] and sha256_file(path) == entry["sha256"]
+            except OSError:
+                ok = False
+            if ok:
+                entry["mtime_ns"] = mtime_ns
+            else:
+                corrupt.append(name)
+
+        if corrupt:
+            manifest["corrupt"] = corrupt
+            log_message(f"[ERROR] Model files failed hash verification: {corrupt}")
+        else:
+            log_message(f"[INFO] Re-verified {len(names)} changed model file(s).")
+        with self._lock:
+            self._save(manifest)
+        return corrupt
+
+    def in_background(self, fn, *args):
+        """在后台线程中执行 record() / verify()，不拖慢模型加载"""
+
+        def run():
+            try:
+                fn(*args)
+            except Exception as e:
+                log_message(f"[WARN] Model manifest update failed: {e}")
+
+        thread = threading.Thread(target=run, name="model-manifest", daemon=True)
+        thread.start()
+        return thread
@@ -1,19 +1,109 @@
 # services/modules/ocr_engine.py
 import os
-import base64
+import hashlib
 import sys
 import json
 import contextlib
-from io import BytesIO
+import numpy as np
 from PIL import Image
-from manga_ocr import MangaOcr
-from huggingface_hub import snapshot_download
-from .utils import log_message, patch_tqdm
+from .utils import log_message, RequestCancelled
+from .cache import PersistentCache
+from .profiling import profiler
+from .ocr_preprocess import PIXEL_FORMATS, open_pixels, prepare
+from .downloader import ModelDownloader
+from .progress import progress_bus
+from .model_manifest import (
+    MANIFEST_CHANGED,
+    MANIFEST_CORRUPT,
+    MANIFEST_MISSING,
+    ModelManifest,
+    safetensors_truncated,
+    torch_bin_truncated,
+)
+
+
+class OCRResultCache(PersistentCache):
+    """
+    OCR 结果缓存，键为解码并归一化 (加白边、灰度化) 之后的像素哈希。
+    perceptual=True 时使用 dHash 感知哈希，截图位置偏移几个像素也能命中。
+    键中包含推理配置 (后端、量化、解码模式)，切换配置后不会返回其他配置的结果。
+    """
+
+    def __init__(self, db_path, perceptual=False, capacity=1024):
+        super().__init__(db_path, table="ocr_results", capacity=capacity)
+        self.perceptual = perceptual
+
+    def key_for(self, gray, variant=""):
+        """
+        gray: 预处理之后 (加白边) 的 (H, W) uint8 灰度数组；
+        variant: 推理配置标识，例如 "onnx-int8/fast"
+        """
+        height, width = gray.shape
+
+        if self.perceptual:
+            # dHash：缩小到 9x8，比较相邻像素的明暗关系得到 64 位指纹
+            small = np.asarray(Image.fromarray(gray).resize((9, 8), Image.BILINEAR))
+            bits = 0
+            for bit in (small[:, :-1] > small[:, 1:]).ravel():
+                bits = (bits << 1) | int(bit)
+            # 尺寸 (长边按 2 的幂分档) 与宽高比 (log2 按 1/4 分档) 也计入键，
+            # 缩小后梯度相同但大小、形状不同的气泡不会互相命中
+            size = max(width, height).bit_length()
+            aspect = round(4 * np.log2(width / height))
+            return f"p:{variant}:{size}:{aspect}:{bits:016x}"
+
+        digest = hashlib.sha1(gray.tobytes()).hexdigest()
+        return f"x:{variant}:{width}x{height}:{digest}"
+
+
+# 可选的推理后端：torch (默认，MangaOcr) / onnx / onnx-int8 (onnxruntime)
+OCR_BACKENDS = ("torch", "onnx", "onnx-int8")
+
+# 解码模式：default 与 MangaOcr 相同 (固定 max_length=300)；
+# fast 使用显式贪心解码，并按气泡尺寸估算 max_length
+OCR_DECODING_MODES = ("default", "fast")
 
 
 class OCREngine:
-    def __init__(self, model_dir=None):
-        self.mocr = None
+    # 单次前向推理允许的最大图像数量
+    max_batch_size = 16
+    # 识别前在截图四周添加的白边 (像素)
+    padding = 20
+    # 长边超过该尺寸的截图先按整数倍缩小 (模型输入为 224x224)
+    max_side = 1024
+
+    repo_id = "kha-white/manga-ocr-base"
+
+    # fast 模式估算 max_length 用的参数：假设字号不小于 min_glyph 像素、
+    # 一个气泡不超过 max_lines 行，再加上少量余量 (特殊 token、标点)
+    max_length = 300
+    min_glyph = 16
+    max_lines = 8
+    length_margin = 8
+
+    def __init__(
+        self,
+        model_dir=None,
+        cache=None,
+        backend="torch",
+        decoding="default",
+        quantize_decoder=False,
+        num_threads=None,
+    ):
+        # 推理后端对象，提供 run_batch(images, max_length, greedy) -> texts
+        self.model = None
+        if backend not in OCR_BACKENDS:
+            raise ValueError(f"Unknown OCR backend: {backend}")
+        if decoding not in OCR_DECODING_MODES:
+            raise ValueError(f"Unknown OCR decoding mode: {decoding}")
+        self.backend = backend
+        self.decoding = decoding
+        # 仅对 torch 后端有效：decoder 的 Linear 层动态量化为 int8
+        self.quantize_decoder = quantize_decoder
+        # 推理线程数 (torch intra-op / onnxruntime intra_op_num_threads)
+        self.num_threads = num_threads
+        # 可选的 OCRResultCache，重复截取同一气泡时直接返回结果
+        self.cache = cache
         # 如果没有传入路径，抛出错误，因为我们现在的策略是必须指定路径
         if not model_dir:
             raise ValueError("Model directory is required for cleaner deployment.")
@@ -77,13 +167,46 @@ class OCREngine:
             )
             return False
 
+        # 4. 权重文件结构检查 (只读文件头 / 尾)，截断的文件在这里就能发现，
+        # 而不是在 MangaOcr(...) 里慢慢失败
+        if has_safetensors and safetensors_truncated(
+            os.path.join(self.model_dir, "model.safetensors")
+        ):
+            log_message("Model weights are truncated: model.safetensors")
+            return False
+        if not has_safetensors and torch_bin_truncated(
+            os.path.join(self.model_dir, "pytorch_model.bin")
+        ):
+            log_message("Model weights are truncated: pytorch_model.bin")
+            return False
+
         return True
 
+    def _model_files(self):
+        """写入清单的文件：模型目录第一层的常规文件 (不含隐藏文件、下载断点、ONNX 导出)"""
+        return sorted(
+            name
+            for name in os.listdir(self.model_dir)
+            if not name.startswith(".")
+            and not name.endswith((".part", ".part.json", ".tmp"))
+            and os.path.isfile(os.path.join(self.model_dir, name))
+        )
+
     def _load_model(self):
-        # 1. 检查本地是否存在且完整
-        if self._check_integrity():
+        # 1. 检查本地是否存在且完整：有清单时只比较 stat，否则按文件逐项检查
+        manifest = ModelManifest(self.model_dir)
+        downloaded = None
+        with profiler.phase("ocr.check_integrity"):
+            status, changed = manifest.check()
+            if status == MANIFEST_MISSING:
+                model_ok = self._check_integrity()
+            else:
+                model_ok = status != MANIFEST_CORRUPT
+        if model_ok:
             log_message(f"[INFO] Found valid model at: {self.model_dir}")
         else:
+            if status == MANIFEST_CORRUPT:
+                log_message(f"[WARN] Model files truncated or corrupt: {changed}")
             # 2. 本地不完整，执行定向下载
             log_message(
                 f"[INFO] Model missing or incomplete. Downloading to {self.model_dir}..."
@@ -91,16 +214,13 @@ class OCREngine:
             log_message("[INFO] This may take a while (approx 400MB)...")
 
             try:
-                #  使用 patch_tqdm 捕获下载进度
-                with patch_tqdm(
-                    msg_type="init_progress",
-                    msg_key="message",
-                    default_msg="正在下载 OCR 模型...",
-                ):
-                    snapshot_download(
-                        repo_id="kha-white/manga-ocr-base",
-                        local_dir=self.model_dir,
-                        local_dir_use_symlinks=False,  # 关键：不使用软链接，确保是真实文件
+                # 分段并行下载整个仓库，支持断点续传，逐个文件校验哈希
+                with profiler.phase("ocr.download"), progress_bus.task(
+                    "init_progress", "message", "正在下载 OCR 模型..."
+                ) as task:
+                    downloader = ModelDownloader(self.repo_id)
+                    downloaded = downloader.download_snapshot(
+                        self.model_dir, progress=task
                     )
                 log_message("[INFO] Download complete!")
             except Exception as e:
@@ -112,40 +232,133 @@ class OCREngine:
         log_message(f"[INFO] Loading OCR Engine from local storage: {abs_model_path}")
 
         try:
-            with patch_tqdm(
-                msg_type="init_progress",
-                msg_key="message",
-                default_msg="正在加载 OCR 引擎...",
+            # 加载过程中 transformers 的 tqdm 进度条计入 init_progress
+            with progress_bus.task(
+                "init_progress",
+                "message",
+                "正在加载 OCR 引擎...",
+                capture_tqdm=True,
             ):
                 # 强制指定 local_files_only=True，因为我们刚才已经确认下载了
-                self.mocr = MangaOcr(pretrained_model_name_or_path=abs_model_path)
-            log_message("MangaOCR Initialized Successfully.")
+                with profiler.phase("ocr.construct_model"):
+                    self.model = self._create_model(abs_model_path)
+            log_message(f"MangaOCR Initialized Successfully ({self.model.name}).")
         except Exception as e:
             log_message(f"[ERROR] MangaOCR Load Failed: {e}")
             raise e
 
-    def recognize(self, image_base64):
-        """执行 OCR"""
-        if not self.mocr:
-            raise Exception("OCR Model not initialized")
+        # 4. 加载成功后在后台更新清单 (下载时已校验的哈希直接使用)
+        if downloaded is not None:
+            manifest.in_background(manifest.record, downloaded, downloader.verified)
+        elif status == MANIFEST_MISSING:
+            manifest.in_background(manifest.record, self._model_files())
+        elif status == MANIFEST_CHANGED:
+            manifest.in_background(manifest.verify, changed)
+
+    def _create_model(self, abs_model_path):
+        """按 backend 创建推理后端；ONNX 不可用时回退到 torch"""
+        # 后端模块按需导入：选择 ONNX 时整个进程都不需要导入 torch
+        if self.backend in ("onnx", "onnx-int8"):
+            try:
+                from .ocr_onnx import OnnxOCRModel
+
+                return OnnxOCRModel(
+                    abs_model_path,
+                    quantized=self.backend == "onnx-int8",
+                    num_threads=self.num_threads,
+                )
+            except Exception as e:
+                log_message(
+                    f"[WARNING] ONNX OCR backend unavailable ({e}), falling back to torch."
+                )
+
+        from .ocr_torch import TorchOCRModel
+
+        return TorchOCRModel(
+            abs_model_path,
+            quantize_decoder=self.quantize_decoder,
+            num_threads=self.num_threads,
+        )
 
-        # 处理 Base64
-        if "," in image_base64:
-            image_base64 = image_base64.split(",", 1)[1]
+    def load_image(self, image):
+        """输入图像 (见 ocr_preprocess.open_pixels) -> RGB PIL 图像 (不加白边)"""
+        if isinstance(image, Image.Image):
+            # analyze_page 从整页中裁剪出的区域
+            return image if image.mode == "RGB" else image.convert("RGB")
 
-        image_data = base64.b64decode(image_base64)
-        img = Image.open(BytesIO(image_data))
+        with open_pixels(image) as (pixels, fmt):
+            if fmt == "gray":
+                return Image.fromarray(pixels).convert("RGB")
+            # 按通道下标取出 R/G/B (同时丢弃 Alpha)，得到连续的新数组
+            return Image.fromarray(pixels[..., list(PIXEL_FORMATS[fmt][1])])
 
+    def _prepare(self, image):
+        """
+        输入图像 -> 带白边的 (H, W) uint8 灰度数组。
+        灰度化、缩小与加白边都是数组运算，原始像素输入不经过任何编解码
+        """
         # [FIX] Add padding to improve OCR accuracy on tight crops
         # MangaOCR works best when there is some white space around the text
-        if img.mode != "RGB":
-            img = img.convert("RGB")
+        return prepare(image, self.padding, self.max_side)
+
+    def _estimate_max_length(self, images):
+        """
+        按截图面积估算需要生成的最大 token 数 (manga-ocr 基本一字一 token)，
+        一个批次取最大值。短小的单词气泡不必按 300 个 token 预留。
+        """
+        estimate = 0
+        for gray in images:
+            height = max(gray.shape[0] - 2 * self.padding, 1)
+            width = max(gray.shape[1] - 2 * self.padding, 1)
+            glyph = max(self.min_glyph, min(width, height) / self.max_lines)
+            estimate = max(estimate, int(width * height / (glyph * glyph)))
+        return min(self.max_length, estimate + self.length_margin)
+
+    def _run_batch(self, images):
+        """对一组预处理之后的灰度数组执行一次批量前向推理"""
+        if self.decoding == "fast":
+            return self.model.run_batch(
+                images, max_length=self._estimate_max_length(images), greedy=True
+            )
+        return self.model.run_batch(images, max_length=self.max_length)
+
+    def recognize_batch(self, images, cancel_event=None):
+        """
+        批量 OCR：一页漫画中的多个气泡在同一次前向推理中完成，
+        结果顺序与输入顺序一致。images 中每一项可以是 Base64 字符串、图片字节、
+        PIL 图像或原始像素描述 (见 ocr_preprocess.open_pixels)
+        """
+        if not self.model:
+            raise Exception("OCR Model not initialized")
+
+        images = [self._prepare(image) for image in images]
+        texts = [None] * len(images)
+
+        # 1. 先查缓存，只对未命中的图像执行推理
+        keys = [None] * len(images)
+        if self.cache is not None:
+            # 实际使用的后端 (ONNX 不可用时回退到 torch) 与解码模式
+            variant = f"{self.model.name}/{self.decoding}"
+            for i, img in enumerate(images):
+                keys[i] = self.cache.key_for(img, variant)
+                texts[i] = self.cache.get(keys[i])
+
+        pending = [i for i, text in enumerate(texts) if text is None]
 
-        padding = 20
-        new_width = img.width + 2 * padding
-        new_height = img.height + 2 * padding
+        # 2. 分块推理，防止一次性塞入过多图像导致内存暴涨
+        for start in range(0, len(pending), self.max_batch_size):
+            # 每个分块之间检查是否被取消
+            if cancel_event is not None and cancel_event.is_set():
+                raise RequestCancelled()
+            chunk = pending[start : start + self.max_batch_size]
+            results = self._run_batch([images[i] for i in chunk])
+            for i, text in zip(chunk, results):
+                texts[i] = text
+                if self.cache is not None:
+                    self.cache.put(keys[i], text)
 
-        new_img = Image.new("RGB", (new_width, new_height), (255, 255, 255))
-        new_img.paste(img, (padding, padding))
+        return texts
 
-        return self.mocr(new_img)
+    def recognize(self, image, cancel_event=None):
+        """执行 OCR (批量大小为 1 的特例)"""
+        return self.recognize_batch([image], cancel_event)[0]
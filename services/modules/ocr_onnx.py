@@ -0,0 +1,196 @@
+# services/modules/ocr_onnx.py
+import os
+import re
+import json
+import numpy as np
+from transformers import AutoTokenizer, ViTImageProcessor
+from .utils import log_message
+from .profiling import profiler
+from .ocr_preprocess import pixel_values
+
+try:
+    import onnxruntime as ort
+except ImportError:
+    ort = None
+
+try:
+    import jaconv
+except ImportError:
+    jaconv = None
+
+# optimum 导出 image-to-text-with-past 任务时生成的三个图
+ONNX_FILES = (
+    "encoder_model.onnx",
+    "decoder_model.onnx",
+    "decoder_with_past_model.onnx",
+)
+
+
+def post_process(text):
+    """与 manga_ocr.ocr.post_process 相同，单独实现以免为此导入 torch"""
+    text = "".join(text.split())
+    text = text.replace("…", "...")
+    text = re.sub("[・.]{2,}", lambda x: (x.end() - x.start()) * ".", text)
+    if jaconv is not None:
+        text = jaconv.h2z(text, ascii=True, digit=True)
+    return text
+
+
+def has_onnx_files(onnx_dir):
+    return all(os.path.exists(os.path.join(onnx_dir, f)) for f in ONNX_FILES)
+
+
+def export_onnx(model_path, onnx_dir):
+    """
+    一次性把 manga-ocr 导出为 ONNX (encoder / decoder / decoder_with_past)。
+    需要 torch 与 optimum，仅在 ONNX 文件不存在时调用。
+    """
+    from optimum.exporters.onnx import main_export
+
+    main_export(
+        model_path,
+        output=onnx_dir,
+        task="image-to-text-with-past",
+        # 保留独立的 decoder 与 decoder_with_past，不合并
+        no_post_process=True,
+    )
+
+
+def quantize_onnx(onnx_dir, int8_dir):
+    """动态 int8 量化 (只量化权重，不需要校准数据)"""
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    os.makedirs(int8_dir, exist_ok=True)
+    for name in ONNX_FILES:
+        quantize_dynamic(
+            os.path.join(onnx_dir, name),
+            os.path.join(int8_dir, name),
+            weight_type=QuantType.QInt8,
+        )
+
+
+class OnnxOCRModel:
+    """
+    ONNX Runtime 版 OCR 后端：encoder 只运行一次，decoder 用 numpy 实现贪心解码，
+    每一步复用上一步的 KV cache (decoder_with_past)，推理过程不需要 torch。
+    """
+
+    def __init__(self, model_path, quantized=False, max_length=300, num_threads=None):
+        if ort is None:
+            raise ImportError("onnxruntime not installed")
+
+        onnx_dir = os.path.join(model_path, "onnx")
+        int8_dir = os.path.join(model_path, "onnx-int8")
+
+        # 1. 首次使用时导出 / 量化，之后直接复用磁盘上的文件
+        if not has_onnx_files(onnx_dir) and not (
+            quantized and has_onnx_files(int8_dir)
+        ):
+            log_message(f"[INFO] Exporting OCR model to ONNX: {onnx_dir}")
+            with profiler.phase("ocr.onnx_export"):
+                export_onnx(model_path, onnx_dir)
+        if quantized and not has_onnx_files(int8_dir):
+            log_message(f"[INFO] Quantizing OCR model to int8: {int8_dir}")
+            with profiler.phase("ocr.onnx_quantize"):
+                quantize_onnx(onnx_dir, int8_dir)
+
+        self.name = "onnx-int8" if quantized else "onnx"
+        session_dir = int8_dir if quantized else onnx_dir
+
+        # 2. 创建推理会话 (仅使用 CPU)
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+
+        def load(name):
+            return ort.InferenceSession(
+                os.path.join(session_dir, name),
+                options,
+                providers=["CPUExecutionProvider"],
+            )
+
+        self.encoder = load("encoder_model.onnx")
+        self.decoder = load("decoder_model.onnx")
+        self.decoder_with_past = load("decoder_with_past_model.onnx")
+
+        # 3. 预处理器与分词器与 torch 路径完全一致
+        self.processor = ViTImageProcessor.from_pretrained(model_path)
+        self.tokenizer = AutoTokenizer.from_pretrained(model_path)
+
+        with open(os.path.join(model_path, "config.json"), encoding="utf-8") as f:
+            config = json.load(f)
+        decoder_config = config.get("decoder", {})
+
+        def token_id(key, fallback):
+            value = config.get(key, decoder_config.get(key))
+            return fallback if value is None else value
+
+        self.start_token_id = token_id(
+            "decoder_start_token_id", self.tokenizer.cls_token_id
+        )
+        self.eos_token_id = token_id("eos_token_id", self.tokenizer.sep_token_id)
+        self.pad_token_id = token_id("pad_token_id", self.tokenizer.pad_token_id)
+        self.max_length = max_length
+
+    @staticmethod
+    def _run(session, feeds):
+        """只传入该图需要的输入，返回 {输出名: 数组}"""
+        inputs = {i.name for i in session.get_inputs()}
+        outputs = session.run(None, {k: v for k, v in feeds.items() if k in inputs})
+        return dict(zip((o.name for o in session.get_outputs()), outputs))
+
+    @staticmethod
+    def _update_past(past, outputs):
+        # present.* -> past_key_values.*；decoder_with_past 不再输出交叉注意力的
+        # KV (只依赖 encoder 输出，保持不变)，因此保留第一步的结果
+        for name, value in outputs.items():
+            if name.startswith("present"):
+                past[name.replace("present", "past_key_values", 1)] = value
+
+    def generate(self, pixel_values, max_length=None):
+        """批量贪心解码，返回形如 (N, L) 的 token id 数组"""
+        max_length = max_length or self.max_length
+        batch = pixel_values.shape[0]
+        encoder_hidden = self._run(self.encoder, {"pixel_values": pixel_values})[
+            "last_hidden_state"
+        ]
+
+        input_ids = np.full((batch, 1), self.start_token_id, dtype=np.int64)
+        outputs = self._run(
+            self.decoder,
+            {"input_ids": input_ids, "encoder_hidden_states": encoder_hidden},
+        )
+        past = {}
+        self._update_past(past, outputs)
+
+        generated = [input_ids]
+        finished = np.zeros(batch, dtype=bool)
+        for _ in range(max_length - 1):
+            next_ids = outputs["logits"][:, -1, :].argmax(axis=-1).astype(np.int64)
+            # 已结束的序列只补 pad
+            next_ids = np.where(finished, self.pad_token_id, next_ids)
+            generated.append(next_ids[:, None])
+            finished |= next_ids == self.eos_token_id
+            if finished.all():
+                break
+
+            feeds = {
+                "input_ids": next_ids[:, None],
+                "encoder_hidden_states": encoder_hidden,
+            }
+            feeds.update(past)
+            outputs = self._run(self.decoder_with_past, feeds)
+            self._update_past(past, outputs)
+
+        return np.concatenate(generated, axis=1)
+
+    def run_batch(self, images, max_length=None, greedy=True):
+        # 本后端始终使用贪心解码，greedy 参数仅为与 torch 后端保持接口一致
+        output_ids = self.generate(pixel_values(images, self.processor), max_length)
+
+        texts = []
+        for ids in output_ids:
+            text = self.tokenizer.decode(ids, skip_special_tokens=True)
+            texts.append(post_process(text))
+        return texts
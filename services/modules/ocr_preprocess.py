@@ -0,0 +1,176 @@
+# services/modules/ocr_preprocess.py
+import base64
+import contextlib
+from io import BytesIO
+import numpy as np
+from PIL import Image
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:
+    shared_memory = None
+
+# 原始像素格式 -> (每像素字节数, R/G/B 通道下标)
+PIXEL_FORMATS = {
+    "rgb": (3, (0, 1, 2)),
+    "rgba": (4, (0, 1, 2)),
+    "bgr": (3, (2, 1, 0)),
+    "bgra": (4, (2, 1, 0)),
+    "gray": (1, None),
+}
+
+
+def raw_pixels(buffer, width, height, fmt="rgba", stride=None):
+    """把原始像素缓冲区包装为 (H, W, C) 数组，只建立视图，不复制数据"""
+    if fmt not in PIXEL_FORMATS:
+        raise ValueError(f"Unknown pixel format: {fmt}")
+    channels = PIXEL_FORMATS[fmt][0]
+    # stride: 每行字节数，截图 API 可能在行尾对齐填充
+    stride = stride or width * channels
+    rows = np.frombuffer(buffer, dtype=np.uint8, count=stride * height)
+    rows = rows.reshape(height, stride)[:, : width * channels]
+    return rows.reshape(height, width, channels)
+
+
+def _decode_base64(data):
+    if "," in data:
+        # Data URL: "data:image/png;base64,...."
+        data = data.split(",", 1)[1]
+    return base64.b64decode(data)
+
+
+def _from_pil(img):
+    # RGB / RGBA / L 可以直接按数组读取，其余模式 (P、LA、CMYK...) 先转为 RGB
+    if img.mode not in ("RGB", "RGBA", "L"):
+        img = img.convert("RGB")
+    fmt = {"RGB": "rgb", "RGBA": "rgba", "L": "gray"}[img.mode]
+    return np.asarray(img), fmt
+
+
+@contextlib.contextmanager
+def open_pixels(image):
+    """
+    输入图像 -> (像素数组, 像素格式)。支持：
+    - PIL 图像、(H, W) 灰度或 (H, W, 3) RGB 数组
+    - 编码后的图片 (PNG / JPEG...) 字节、Base64 字符串或 Data URL
+    - 原始像素描述 dict：{"width", "height", "format", "stride"} 加上以下之一
+        "data": 像素字节 (分帧附件) 或其 Base64
+        "shm":  multiprocessing.shared_memory 的名称
+        "path": 临时文件路径 (按 memmap 读取)；没有 width / height 时视为图片文件
+    共享内存与临时文件只在 with 块内有效，由调用方负责创建和删除。
+    """
+    if isinstance(image, Image.Image):
+        yield _from_pil(image)
+        return
+
+    if isinstance(image, np.ndarray):
+        yield image, "gray" if image.ndim == 2 else "rgb"
+        return
+
+    if not isinstance(image, dict):
+        data = image if isinstance(image, (bytes, bytearray, memoryview)) else None
+        if data is None:
+            data = _decode_base64(image)
+        yield _from_pil(Image.open(BytesIO(data)))
+        return
+
+    if "width" not in image:
+        if "path" not in image:
+            raise ValueError("Raw pixel descriptor requires width and height")
+        with Image.open(image["path"]) as img:
+            yield _from_pil(img)
+        return
+
+    fmt = image.get("format", "rgba")
+    layout = (image["width"], image["height"], fmt, image.get("stride"))
+
+    if "shm" in image:
+        if shared_memory is None:
+            raise RuntimeError("shared_memory is not available")
+        segment = shared_memory.SharedMemory(name=image["shm"])
+        try:
+            yield raw_pixels(segment.buf, *layout), fmt
+        finally:
+            segment.close()
+    elif "path" in image:
+        yield raw_pixels(np.memmap(image["path"], mode="r"), *layout), fmt
+    else:
+        data = image["data"]
+        if isinstance(data, str):
+            data = _decode_base64(data)
+        yield raw_pixels(data, *layout), fmt
+
+
+def to_gray(pixels, fmt):
+    """
+    灰度化。与 PIL convert("L") 使用同一整数公式 (ITU-R 601-2)，结果逐像素一致，
+    Alpha 通道与 PIL 转 RGB 时一样直接丢弃
+    """
+    if pixels.ndim == 2:
+        return pixels
+    order = PIXEL_FORMATS[fmt][1]
+    if order is None:
+        return pixels[..., 0]
+
+    r, g, b = order
+    gray = np.multiply(pixels[..., r], np.uint32(19595), dtype=np.uint32)
+    tmp = np.multiply(pixels[..., g], np.uint32(38470), dtype=np.uint32)
+    gray += tmp
+    np.multiply(pixels[..., b], np.uint32(7471), out=tmp, dtype=np.uint32)
+    gray += tmp
+    gray += 0x8000
+    gray >>= 16
+    return gray.astype(np.uint8)
+
+
+def downscale(gray, max_side):
+    """长边超过 max_side 时按整数倍做区域平均，模型输入只有 224x224，过大的截图没有意义"""
+    height, width = gray.shape
+    factor = -(-max(height, width) // max_side)
+    if factor <= 1:
+        return gray
+    height, width = height // factor * factor, width // factor * factor
+    blocks = gray[:height, :width].reshape(
+        height // factor, factor, width // factor, factor
+    )
+    return blocks.mean(axis=(1, 3), dtype=np.float32).round().astype(np.uint8)
+
+
+def prepare(image, padding, max_side):
+    """输入图像 -> 缩小、加白边之后的 (H, W) uint8 灰度数组"""
+    with open_pixels(image) as (pixels, fmt):
+        gray = downscale(to_gray(pixels, fmt), max_side)
+        # np.pad 总是返回新数组；释放指向共享内存的视图后才能关闭它
+        padded = np.pad(gray, padding, constant_values=255)
+        del pixels, gray
+    return padded
+
+
+def pixel_values(grays, processor):
+    """
+    灰度数组 -> (N, 3, H, W) float32 模型输入，
+    等价于 processor([img.convert("L").convert("RGB"), ...]).pixel_values：
+    resize / rescale / normalize 只在单通道上计算一次，最后才展开为三个通道
+    """
+    size = processor.size
+    if isinstance(size, dict):
+        height, width = size["height"], size["width"]
+    else:
+        height = width = size
+
+    batch = np.empty((len(grays), height, width), dtype=np.float32)
+    for i, gray in enumerate(grays):
+        if gray.shape != (height, width):
+            gray = Image.fromarray(gray).resize((width, height), processor.resample)
+        batch[i] = gray
+
+    if getattr(processor, "do_rescale", True):
+        batch *= getattr(processor, "rescale_factor", 1 / 255)
+
+    out = np.empty((len(grays), 3, height, width), dtype=np.float32)
+    for c in range(3):
+        out[:, c] = batch
+        if processor.do_normalize:
+            out[:, c] -= processor.image_mean[c]
+            out[:, c] /= processor.image_std[c]
+    return out
@@ -0,0 +1,83 @@
+# services/modules/ocr_torch.py
+import torch
+from manga_ocr import MangaOcr
+from manga_ocr.ocr import post_process
+from .utils import log_message
+from .ocr_preprocess import pixel_values
+
+
+class TorchOCRModel:
+    """默认 OCR 后端：PyTorch 版 MangaOcr"""
+
+    name = "torch"
+
+    def __init__(self, model_path, quantize_decoder=False, num_threads=None):
+        # intra-op 线程数是进程级设置，需要在第一次推理之前设定
+        if num_threads:
+            torch.set_num_threads(num_threads)
+
+        self.mocr = MangaOcr(pretrained_model_name_or_path=model_path)
+        # manga-ocr 新版本叫 processor，旧版本叫 feature_extractor
+        self.processor = getattr(self.mocr, "processor", None) or getattr(
+            self.mocr, "feature_extractor"
+        )
+        self.tokenizer = self.mocr.tokenizer
+        self.model = self.mocr.model
+
+        if quantize_decoder:
+            self._quantize_decoder()
+
+    def get_num_threads(self):
+        return torch.get_num_threads()
+
+    def set_num_threads(self, num_threads):
+        torch.set_num_threads(num_threads)
+
+    def _quantize_decoder(self):
+        """
+        decoder 的 Linear 层动态量化为 int8 (仅 CPU)。
+        自回归解码的耗时集中在 decoder，encoder 每张图只运行一次，保持 float32。
+        """
+        if self.model.device.type != "cpu":
+            log_message("[WARNING] Decoder quantization requires CPU, skipped.")
+            return
+        self.model.decoder = torch.ao.quantization.quantize_dynamic(
+            self.model.decoder, {torch.nn.Linear}, dtype=torch.qint8
+        )
+        self.name = "torch-int8"
+
+    def _generation_kwargs(self, max_length, greedy):
+        if not greedy:
+            # 与 MangaOcr 相同：其余参数沿用模型 generation_config 的默认值
+            return {"max_length": max_length}
+
+        # 显式贪心解码：单束、不采样、复用 KV cache，所有序列遇到 EOS 即停止
+        config = self.model.config
+        return {
+            "max_length": max_length,
+            "num_beams": 1,
+            "do_sample": False,
+            "use_cache": True,
+            "eos_token_id": config.eos_token_id,
+            "pad_token_id": config.pad_token_id,
+            "decoder_start_token_id": config.decoder_start_token_id,
+        }
+
+    def run_batch(self, images, max_length=300, greedy=False):
+        """
+        对一组灰度数组执行一次批量前向推理 (encoder + generate)。
+        预处理与 MangaOcr.__call__ 等价，但在 numpy 中一次性完成整个批次
+        """
+        inputs = torch.from_numpy(pixel_values(images, self.processor))
+
+        with torch.inference_mode():
+            output_ids = self.model.generate(
+                inputs.to(self.model.device),
+                **self._generation_kwargs(max_length, greedy),
+            )
+
+        texts = []
+        for ids in output_ids.cpu():
+            text = self.tokenizer.decode(ids, skip_special_tokens=True)
+            texts.append(post_process(text))
+        return texts
@@ -0,0 +1,193 @@
+# services/modules/page_pipeline.py
+import time
+import threading
+from .utils import log_message, send_response, RequestCancelled
+
+
+class PageAnalysis:
+    """
+    analyze_page 流水线：检测文字区域 -> 批量 OCR -> 分词 -> 翻译。
+
+    每个阶段都通过 dispatcher.submit() 交给对应子系统的工作线程执行：
+    一批 OCR 完成后立即进入分词队列，分词完成后立即进入翻译队列，
+    因此三个阶段相互重叠，而每个引擎仍然只在自己的线程中被调用。
+    每个区域在每个阶段完成时发送一条 page_region 消息，
+    全部区域完成后由 run() 返回最终结果。
+
+    每个区域恰好完成一次：任何阶段失败 (包括任务无法提交) 时，该区域带着
+    error 字段结束。run() 分段等待，请求被取消或超过 stall_timeout 秒
+    没有任何进展 (例如任务所在的队列已经停止) 时不再等待。
+    """
+
+    # 没有任何区域推进阶段的最长等待时间 (秒)
+    stall_timeout = 300
+    wait_interval = 0.5
+
+    def __init__(self, handlers, detector, request):
+        self.handlers = handlers
+        self.detector = detector
+        self.req_id = request.get("id")
+        self.cancel_event = request.get("cancel_event") or threading.Event()
+        self.do_tokenize = request.get("tokenize", True)
+        self.do_translate = request.get("translate", True)
+
+        images = handlers.image_inputs(request, "image")
+        self.image = images[0] if images else ""
+
+        self.regions = []
+        self._remaining = 0
+        # 已经完成的区域下标，保证重复完成不会提前结束等待
+        self._finished = set()
+        self._last_progress = time.monotonic()
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+
+    def run(self):
+        # 等待 OCR 引擎加载；加载失败时直接返回错误
+        ocr_engine = self.handlers.ocr_engine
+        page = ocr_engine.load_image(self.image)
+
+        boxes = self.detector.detect(page)
+        log_message(f"[INFO] analyze_page: {len(boxes)} text regions detected.")
+        self.regions = [
+            {"index": i, "bbox": list(box), "text": None} for i, box in enumerate(boxes)
+        ]
+        self._remaining = len(self.regions)
+
+        if self.regions:
+            # 按 OCR 的最大批量切分，每一批作为一个任务进入 ocr 队列
+            size = ocr_engine.max_batch_size
+            for start in range(0, len(self.regions), size):
+                chunk = self.regions[start : start + size]
+                self._submit(
+                    "ocr",
+                    lambda c=chunk: self._recognize(ocr_engine, page, c),
+                    chunk,
+                )
+            self._wait()
+
+        if self.cancel_event.is_set():
+            raise RequestCancelled()
+        return {"regions": self.regions, "width": page.width, "height": page.height}
+
+    def _wait(self):
+        while not self._done.wait(self.wait_interval):
+            if self.cancel_event.is_set():
+                return
+            if time.monotonic() - self._last_progress > self.stall_timeout:
+                with self._lock:
+                    pending = len(self.regions) - len(self._finished)
+                log_message(
+                    f"[ERROR] analyze_page stalled, {pending} region(s) unfinished."
+                )
+                raise Exception(f"analyze_page timed out ({pending} regions pending)")
+
+    def _submit(self, lane, fn, regions):
+        """
+        把一个阶段交给 lane 的工作线程；阶段内未处理的异常或提交失败时，
+        regions 中尚未完成的区域标记错误后完成
+        """
+
+        def run():
+            try:
+                fn()
+            except Exception as e:
+                log_message(f"[ERROR] analyze_page {lane} stage failed: {e}")
+                for region in regions:
+                    self._fail(region, e)
+
+        dispatcher = self.handlers.dispatcher
+        try:
+            if dispatcher is None:
+                run()
+            else:
+                dispatcher.submit(lane, run)
+        except Exception as e:
+            log_message(f"[ERROR] analyze_page failed to queue {lane} stage: {e}")
+            for region in regions:
+                self._fail(region, e)
+
+    def _emit(self, region, stage):
+        self._last_progress = time.monotonic()
+        send_response(
+            {"id": self.req_id, "type": "page_region", "stage": stage, **region}
+        )
+
+    def _fail(self, region, error):
+        if region["index"] not in self._finished:
+            region["error"] = str(error)
+            self._complete(region)
+
+    def _complete(self, region):
+        with self._lock:
+            if region["index"] in self._finished:
+                return
+            self._finished.add(region["index"])
+            self._last_progress = time.monotonic()
+            self._remaining -= 1
+            if self._remaining <= 0:
+                self._done.set()
+
+    # --- 阶段 1：OCR (ocr 队列) ---
+    def _recognize(self, ocr_engine, page, chunk):
+        if self.cancel_event.is_set():
+            for region in chunk:
+                self._complete(region)
+            return
+
+        try:
+            crops = [page.crop(tuple(region["bbox"])) for region in chunk]
+            texts = ocr_engine.recognize_batch(crops, self.cancel_event)
+        except Exception as e:
+            if not isinstance(e, RequestCancelled):
+                log_message(f"[ERROR] analyze_page OCR failed: {e}")
+            for region in chunk:
+                self._fail(region, e)
+            return
+
+        for region, text in zip(chunk, texts):
+            region["text"] = text
+            self._emit(region, "ocr")
+            if not text.strip():
+                self._complete(region)
+            elif self.do_tokenize:
+                self._submit("tokenizer", lambda r=region: self._tokenize(r), [region])
+            else:
+                self._schedule_translate(region)
+
+    # --- 阶段 2：分词 (tokenizer 队列) ---
+    def _tokenize(self, region):
+        try:
+            if not self.cancel_event.is_set():
+                result = self.handlers.tokenize({"text": region["text"]})
+                region["tokens"] = result["tokens"]
+                self._emit(region, "tokenize")
+        except Exception as e:
+            region["error"] = str(e)
+        finally:
+            self._schedule_translate(region)
+
+    # --- 阶段 3：翻译 (translator 队列) ---
+    def _schedule_translate(self, region):
+        if self.do_translate and not self.cancel_event.is_set():
+            self._submit("translator", lambda: self._translate(region), [region])
+        else:
+            self._complete(region)
+
+    def _translate(self, region):
+        try:
+            if self.do_translate and not self.cancel_event.is_set():
+                result = self.handlers.translate(
+                    {"text": region["text"], "cancel_event": self.cancel_event}
+                )
+                region["translation"] = result["translation"]
+                self._emit(region, "translate")
+        except RequestCancelled:
+            pass
+        except Exception as e:
+            region["error"] = str(e)
+            # 没有翻译模型时其余区域不再尝试翻译
+            if str(e) == "MODEL_NOT_FOUND":
+                self.do_translate = False
+        finally:
+            self._complete(region)
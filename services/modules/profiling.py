@@ -0,0 +1,252 @@
+# services/modules/profiling.py
+# 注意：本模块只依赖标准库，需要在导入 torch / llama_cpp 等重量级模块之前启用
+import os
+import sys
+import json
+import time
+import ctypes
+import threading
+import contextlib
+import importlib.abc
+
+
+def _windows_memory_counters():
+    class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+        _fields_ = [
+            ("cb", ctypes.c_ulong),
+            ("PageFaultCount", ctypes.c_ulong),
+            ("PeakWorkingSetSize", ctypes.c_size_t),
+            ("WorkingSetSize", ctypes.c_size_t),
+            ("QuotaPeakPagedPoolUsage", ctypes.c_size_t),
+            ("QuotaPagedPoolUsage", ctypes.c_size_t),
+            ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t),
+            ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+            ("PagefileUsage", ctypes.c_size_t),
+            ("PeakPagefileUsage", ctypes.c_size_t),
+        ]
+
+    counters = PROCESS_MEMORY_COUNTERS()
+    counters.cb = ctypes.sizeof(counters)
+    handle = ctypes.windll.kernel32.GetCurrentProcess()
+    ctypes.windll.psapi.GetProcessMemoryInfo(
+        handle, ctypes.byref(counters), counters.cb
+    )
+    return counters
+
+
+def _ru_maxrss():
+    import resource
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS 单位为字节，Linux 为 KB
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def current_rss():
+    """当前进程常驻内存 (字节)，无法获取时返回 None"""
+    try:
+        if sys.platform == "win32":
+            return _windows_memory_counters().WorkingSetSize
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except Exception:
+        try:
+            return _ru_maxrss()
+        except Exception:
+            return None
+
+
+def peak_rss():
+    """进程生命周期内的峰值常驻内存 (字节)，无法获取时返回 None"""
+    try:
+        if sys.platform == "win32":
+            return _windows_memory_counters().PeakWorkingSetSize
+        return _ru_maxrss()
+    except Exception:
+        return None
+
+
+class _TimedLoader:
+    """包装模块 loader，记录 create_module + exec_module 的耗时"""
+
+    def __init__(self, loader, timer):
+        self._loader = loader
+        self._timer = timer
+
+    # 扩展模块 (.pyd/.so) 的主要开销在 create_module 中，因此从这里开始计时
+    def create_module(self, spec):
+        self._timer._enter(spec.name)
+        try:
+            return self._loader.create_module(spec)
+        except BaseException:
+            self._timer._exit(spec.name)
+            raise
+
+    def exec_module(self, module):
+        try:
+            self._loader.exec_module(module)
+        finally:
+            self._timer._exit(module.__name__)
+            # 还原真实的 loader，避免影响之后依赖 __loader__ 的代码
+            module.__loader__ = self._loader
+            if getattr(module, "__spec__", None) is not None:
+                module.__spec__.loader = self._loader
+
+    def __getattr__(self, name):
+        return getattr(self._loader, name)
+
+
+class ImportTimer(importlib.abc.MetaPathFinder):
+    """
+    插在 sys.meta_path 最前面的查找器：委托其他查找器找到模块，
+    再包装其 loader 以统计每个模块的累计耗时与自身耗时 (不含子模块导入)
+    """
+
+    def __init__(self):
+        self.records = {}
+        self._local = threading.local()
+        self._finding = threading.local()
+
+    def install(self):
+        if self not in sys.meta_path:
+            sys.meta_path.insert(0, self)
+
+    def uninstall(self):
+        if self in sys.meta_path:
+            sys.meta_path.remove(self)
+
+    def find_spec(self, fullname, path=None, target=None):
+        # 防止在委托查找时递归进入自身
+        if getattr(self._finding, "active", False):
+            return None
+        self._finding.active = True
+        try:
+            for finder in sys.meta_path:
+                if finder is self or not hasattr(finder, "find_spec"):
+                    continue
+                spec = finder.find_spec(fullname, path, target)
+                if spec is not None:
+                    loader = spec.loader
+                    if loader is not None and hasattr(loader, "exec_module"):
+                        spec.loader = _TimedLoader(loader, self)
+                    return spec
+            return None
+        finally:
+            self._finding.active = False
+
+    def _stack(self):
+        if not hasattr(self._local, "stack"):
+            self._local.stack = []
+        return self._local.stack
+
+    def _enter(self, name):
+        # [模块名, 开始时间, 子模块耗时]
+        self._stack().append([name, time.perf_counter(), 0.0])
+
+    def _exit(self, name):
+        stack = self._stack()
+        _, start, children = stack.pop()
+        cumulative = time.perf_counter() - start
+        self.records[name] = {
+            "module": name,
+            "cumulative_ms": round(cumulative * 1000, 2),
+            "self_ms": round((cumulative - children) * 1000, 2),
+        }
+        if stack:
+            stack[-1][2] += cumulative
+
+    def summary(self, limit=40):
+        modules = sorted(
+            self.records.values(), key=lambda r: r["cumulative_ms"], reverse=True
+        )
+        packages = {}
+        for record in self.records.values():
+            top = record["module"].split(".")[0]
+            packages[top] = packages.get(top, 0.0) + record["self_ms"]
+        packages = sorted(
+            ({"package": k, "self_ms": round(v, 2)} for k, v in packages.items()),
+            key=lambda r: r["self_ms"],
+            reverse=True,
+        )
+        return {"modules": modules[:limit], "packages": packages[:limit]}
+
+
+class StartupProfiler:
+    """
+    记录启动各阶段的耗时与 RSS 变化。未启用时 phase() 是空操作。
+    各引擎在不同线程中并行加载，因此 RSS 变化只是近似值。
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.phases = []
+        self.import_timer = None
+        self._origin = time.perf_counter()
+        self._origin_rss = None
+        self._lock = threading.Lock()
+
+    def enable(self):
+        self.enabled = True
+        self._origin = time.perf_counter()
+        self._origin_rss = current_rss()
+        self.import_timer = ImportTimer()
+        self.import_timer.install()
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        if not self.enabled:
+            yield
+            return
+
+        rss_before = current_rss()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            rss_after = current_rss()
+            record = {
+                "phase": name,
+                "thread": threading.current_thread().name,
+                "start_ms": round((start - self._origin) * 1000, 2),
+                "duration_ms": round((end - start) * 1000, 2),
+                "rss_delta": (
+                    rss_after - rss_before
+                    if rss_after is not None and rss_before is not None
+                    else None
+                ),
+            }
+            with self._lock:
+                self.phases.append(record)
+
+    def report(self):
+        rss = current_rss()
+        report = {
+            "type": "init_metrics",
+            "total_ms": round((time.perf_counter() - self._origin) * 1000, 2),
+            "rss": rss,
+            "rss_delta": (
+                rss - self._origin_rss
+                if rss is not None and self._origin_rss is not None
+                else None
+            ),
+            "peak_rss": peak_rss(),
+            "phases": list(self.phases),
+        }
+        if self.import_timer is not None:
+            report["imports"] = self.import_timer.summary()
+        return report
+
+    def finish(self, output_path=None):
+        """停止统计导入耗时，返回 init_metrics 报告并可选写入 JSON 文件"""
+        if self.import_timer is not None:
+            self.import_timer.uninstall()
+        report = self.report()
+        if output_path:
+            with open(output_path, "w", encoding="utf-8") as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+        return report
+
+
+# 全局实例：backend_service 在导入业务模块之前按需启用
+profiler = StartupProfiler()
@@ -0,0 +1,238 @@
+# services/modules/progress.py
+import time
+import threading
+import contextlib
+from .utils import send_response
+
+try:
+    import tqdm
+except ImportError:
+    tqdm = None
+
+
+class ProgressSource:
+    """
+    一个进度来源 (一个下载文件、一个 tqdm 进度条...)，可以在多个线程中同时更新。
+    total 未知 (None) 的来源不参与百分比计算；不属于任何任务时只计数
+    """
+
+    def __init__(self, task=None, total=None):
+        self.task = task
+        self.total = total
+        self.done = 0
+        # 与所属任务共用一把锁，整体进度与各来源的计数总是一致
+        self._lock = task._lock if task is not None else threading.Lock()
+
+    def add(self, n):
+        with self._lock:
+            self.done += n
+            if self.task is not None and self.total:
+                self.task._done += n
+        if self.task is not None:
+            self.task._changed()
+
+    def set(self, done):
+        with self._lock:
+            n = done - self.done
+        self.add(n)
+
+    def set_total(self, total):
+        with self._lock:
+            if self.task is not None:
+                if self.total:
+                    self.task._total -= self.total
+                    self.task._done -= self.done
+                if total:
+                    self.task._total += total
+                    self.task._done += self.done
+            self.total = total
+        if self.task is not None:
+            self.task._changed()
+
+
+class ProgressTask:
+    """
+    一项需要向前端报告进度的工作 (下载模型、加载引擎...)，
+    其下所有来源合并为一个整体百分比，按 {"type": msg_type, "percent", msg_key: label} 发送
+    """
+
+    def __init__(self, bus, msg_type, msg_key, label):
+        self.bus = bus
+        self.msg_type = msg_type
+        self.msg_key = msg_key
+        self.label = label
+        self._lock = threading.Lock()
+        # 保证同一任务的消息按顺序发送 (更新者不需要等待 stdout)
+        self._send_lock = threading.Lock()
+        self._done = 0
+        self._total = 0
+        self._dirty = False
+        self._last_sent = None
+        self._last_time = None
+
+    def source(self, total=None):
+        """新建一个来源；total 计入整体进度的分母"""
+        source = ProgressSource(self, None)
+        if total:
+            source.set_total(total)
+        return source
+
+    @property
+    def percent(self):
+        with self._lock:
+            if not self._total:
+                return None
+            return min(100.0, max(0.0, self._done / self._total * 100))
+
+    def _changed(self):
+        with self._lock:
+            self._dirty = True
+            first = self._last_time is None
+        # 第一次更新立即发送，之后由总线按时间间隔合并发送
+        if first:
+            self.bus._flush(self)
+
+    def _message(self):
+        """有新的更新时返回消息 (同一百分比不重复发送)，否则返回 None"""
+        percent = self.percent
+        with self._lock:
+            if not self._dirty:
+                return None
+            self._dirty = False
+            self._last_time = time.monotonic()
+            if percent is None:
+                return None
+            percent = round(percent, 1)
+            # 新来源加入时分母变大，整体百分比不回退，等待进度追上
+            if self._last_sent is not None and percent <= self._last_sent:
+                return None
+            self._last_sent = percent
+        return {"type": self.msg_type, "percent": percent, self.msg_key: self.label}
+
+
+class _NullWriter:
+    """被接管的 tqdm 进度条的输出目标：丢弃字符画，不占用文件句柄"""
+
+    def write(self, s):
+        return len(s)
+
+    def flush(self):
+        pass
+
+
+class ProgressBus:
+    """
+    进度事件总线：
+    - 每个 task() 作用域内的多个来源合并为一个整体进度；
+    - 来源的更新只记账，由后台线程每 interval 秒统一发送各任务的最新进度 (合并中间值)，
+      多个文件并行下载时也不会刷屏或争抢 stdout；
+    - capture_tqdm=True 时，当前线程中创建的 tqdm 进度条 (模型加载) 也计入该任务。
+    """
+
+    interval = 0.25
+
+    def __init__(self):
+        self._tasks = []
+        self._cond = threading.Condition()
+        self._thread = None
+        self._local = threading.local()
+        self._tqdm_lock = threading.Lock()
+        self._tqdm_installed = False
+
+    @contextlib.contextmanager
+    def task(self, msg_type, msg_key, label, capture_tqdm=False):
+        task = ProgressTask(self, msg_type, msg_key, label)
+        with self._cond:
+            self._tasks.append(task)
+            self._start()
+            self._cond.notify()
+        previous = getattr(self._local, "task", None)
+        if capture_tqdm:
+            self._install_tqdm_bridge()
+            self._local.task = task
+        try:
+            yield task
+        finally:
+            if capture_tqdm:
+                self._local.task = previous
+            with self._cond:
+                self._tasks.remove(task)
+            # 结束时发送最后一次进度 (如果有未发送的更新)
+            self._flush(task)
+
+    def _start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self._flush_loop, name="progress", daemon=True
+            )
+            self._thread.start()
+
+    def _flush(self, task):
+        with task._send_lock:
+            message = task._message()
+            if message is not None:
+                send_response(message)
+
+    def _flush_loop(self):
+        while True:
+            with self._cond:
+                while not self._tasks:
+                    self._cond.wait()
+                tasks = list(self._tasks)
+            for task in tasks:
+                self._flush(task)
+            time.sleep(self.interval)
+
+    # --- tqdm 桥接 ---
+
+    def _install_tqdm_bridge(self):
+        """
+        只安装一次、不再还原：未处于 capture_tqdm 作用域的线程中，tqdm 的行为不变，
+        因此并发的加载任务之间不会互相覆盖
+        """
+        with self._tqdm_lock:
+            if self._tqdm_installed or tqdm is None:
+                return
+            self._patch_tqdm()
+            self._tqdm_installed = True
+
+    def _patch_tqdm(self):
+        local = self._local
+        null_writer = _NullWriter()
+        original_init = tqdm.tqdm.__init__
+        original_update = tqdm.tqdm.update
+        original_close = tqdm.tqdm.close
+
+        def __init__(bar, *args, **kwargs):
+            task = getattr(local, "task", None)
+            if task is not None:
+                # 强制开启计数，字符画写入空设备，避免干扰 stdout 上的 JSON
+                kwargs["disable"] = False
+                kwargs["file"] = null_writer
+            original_init(bar, *args, **kwargs)
+            bar._progress_source = task.source(bar.total) if task else None
+
+        def sync(bar):
+            source = getattr(bar, "_progress_source", None)
+            if source is not None:
+                if bar.total != source.total:
+                    source.set_total(bar.total)
+                source.set(bar.n)
+
+        def update(bar, n=1):
+            result = original_update(bar, n)
+            sync(bar)
+            return result
+
+        def close(bar):
+            # 迭代方式使用的进度条只在刷新显示时调用 update()，结束时补上最终计数
+            sync(bar)
+            return original_close(bar)
+
+        tqdm.tqdm.__init__ = __init__
+        tqdm.tqdm.update = update
+        tqdm.tqdm.close = close
+
+
+# 全局进度总线
+progress_bus = ProgressBus()
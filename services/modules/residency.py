@@ -0,0 +1,240 @@
+# services/modules/residency.py
+import gc
+import os
+import time
+import threading
+import contextlib
+from .utils import log_message, send_response
+from .profiling import current_rss
+
+MB = 1024 * 1024
+
+# 会被卸载 / 按预算换出的 GGUF 必须 mmap 加载 (重新加载只需映射页缓存)，
+# 并且不能 mlock 锁定内存
+UNLOADABLE_LLAMA_SETTINGS = {"use_mmap": True, "use_mlock": False}
+
+
+def path_size(*paths):
+    """文件 / 目录的总字节数，不存在的路径计为 0 (用作模型内存占用的估计值)"""
+    total = 0
+    for path in paths:
+        if os.path.isfile(path):
+            total += os.path.getsize(path)
+        elif os.path.isdir(path):
+            for root, _, files in os.walk(path):
+                total += sum(os.path.getsize(os.path.join(root, f)) for f in files)
+    return total
+
+
+def enforce_unloadable_settings(translator, tuned=None):
+    """
+    在 translator 当前的 llama 参数上强制 UNLOADABLE_LLAMA_SETTINGS，
+    逐项记录被覆盖的值 (tuned: 调优得到的参数，用于在日志中区分来源)。返回被覆盖的部分
+    """
+    if not hasattr(translator, "apply_settings"):
+        return {}
+    current = translator.settings()
+    overridden = {
+        k: v for k, v in UNLOADABLE_LLAMA_SETTINGS.items() if current.get(k) != v
+    }
+    for key, value in overridden.items():
+        source = "tuned" if key in (tuned or {}) else "configured"
+        log_message(
+            f"[INFO] Residency management overrides {source} "
+            f"{key}={current.get(key)} -> {value}."
+        )
+    if overridden:
+        translator.apply_settings(overridden)
+    return overridden
+
+
+class ResidencyManager:
+    """
+    模型常驻管理：记录每个引擎的内存占用，
+    - 所在子系统空闲超过 idle_timeout 秒的引擎会被卸载，下次使用时按需重新加载；
+    - 加载引擎前如果总占用会超过 budget 字节，先卸载其它最久未使用的引擎。
+    卸载通过 dispatcher.submit() 在引擎所属的工作线程中执行，
+    因此不会与正在进行的推理冲突；排在卸载之后的请求会触发重新加载。
+    """
+
+    def __init__(self, dispatcher, idle_timeout=None, budget=None, check_interval=30):
+        self.dispatcher = dispatcher
+        self.idle_timeout = idle_timeout or None
+        self.budget = budget or None
+        self.check_interval = check_interval
+        # name -> 引擎信息，见 register()
+        self._engines = {}
+        self._lock = threading.Lock()
+        # 设置预算时串行加载，避免并发加载的 RSS 增量相互重叠
+        self._load_lock = threading.Lock() if self.budget else None
+        self._thread = None
+
+    @property
+    def active(self):
+        """是否开启了空闲卸载或内存预算 (此时模型可能被卸载)"""
+        return bool(self.idle_timeout or self.budget)
+
+    def register(self, name, lane, is_loaded, unload, estimate=None):
+        """
+        is_loaded() -> bool；unload() 释放模型 (在 lane 的工作线程中调用)；
+        estimate() -> 字节数，首次加载之前用于预算 (之后使用实测值)
+        """
+        with self._lock:
+            self._engines[name] = {
+                "lane": lane,
+                "is_loaded": is_loaded,
+                "unload": unload,
+                "estimate": estimate,
+                # 最近一次加载实测的 RSS 增量
+                "measured": None,
+                "loaded_at": None,
+                "unloading": False,
+                "unloads": 0,
+            }
+
+    def start(self):
+        """启动后台线程，定期卸载空闲的引擎 (未设置 idle_timeout 时不启动)"""
+        if self.idle_timeout and self._thread is None:
+            self.check_interval = min(self.check_interval, self.idle_timeout / 2)
+            self._thread = threading.Thread(
+                target=self._reaper_loop, name="residency", daemon=True
+            )
+            self._thread.start()
+        return self
+
+    def tracked(self, name, factory):
+        """包装 EngineLoader 的 factory，使每次 (重新) 加载都经过 loading()"""
+
+        def load():
+            with self.loading(name):
+                return factory()
+
+        return load
+
+    @contextlib.contextmanager
+    def loading(self, name):
+        """加载引擎前按预算腾出内存，加载后记录实测的 RSS 增量"""
+        with self._load_lock or contextlib.nullcontext():
+            self._reserve(name)
+            before = current_rss()
+            yield
+            after = current_rss()
+        with self._lock:
+            entry = self._engines[name]
+            entry["loaded_at"] = time.monotonic()
+            if before is not None and after is not None and after > before:
+                entry["measured"] = after - before
+
+    def cost(self, name):
+        """引擎的内存占用：实测值与估计值中较大的一个 (mmap 加载时 RSS 会偏低)"""
+        entry = self._engines[name]
+        estimate = 0
+        if entry["estimate"] is not None:
+            try:
+                estimate = entry["estimate"]()
+            except Exception:
+                pass
+        return max(entry["measured"] or 0, estimate)
+
+    def idle_for(self, name, in_lane=False):
+        """
+        引擎空闲的秒数：距离所属子系统上一个任务结束、或引擎加载完成的较短者；
+        子系统中有任务正在执行时为 0。in_lane=True 表示在该子系统的任务中调用 (不计自身)
+        """
+        entry = self._engines[name]
+        idle = self.dispatcher.idle_for(entry["lane"], exclude=1 if in_lane else 0)
+        if entry["loaded_at"] is not None:
+            since_load = time.monotonic() - entry["loaded_at"]
+            idle = since_load if idle is None else min(idle, since_load)
+        return idle or 0
+
+    def _loaded(self, name):
+        try:
+            return bool(self._engines[name]["is_loaded"]())
+        except Exception:
+            return False
+
+    def _reserve(self, name):
+        if not self.budget:
+            return
+        needed = self.cost(name)
+        others = [
+            other
+            for other, entry in self._engines.items()
+            if other != name and not entry["unloading"] and self._loaded(other)
+        ]
+        resident = sum(self.cost(other) for other in others)
+
+        # 按空闲时间从长到短卸载，直到放得下新引擎
+        for other in sorted(others, key=self.idle_for, reverse=True):
+            if resident + needed <= self.budget:
+                break
+            resident -= self.cost(other)
+            self._schedule_unload(other, "budget")
+
+        if resident + needed > self.budget:
+            log_message(
+                f"[WARN] Loading '{name}' ({needed // MB} MB) exceeds the memory "
+                f"budget ({self.budget // MB} MB)."
+            )
+
+    def _reaper_loop(self):
+        while True:
+            time.sleep(self.check_interval)
+            for name, entry in list(self._engines.items()):
+                if entry["unloading"] or not self._loaded(name):
+                    continue
+                if self.idle_for(name) >= self.idle_timeout:
+                    self._schedule_unload(name, "idle")
+
+    def _schedule_unload(self, name, reason):
+        entry = self._engines[name]
+        with self._lock:
+            if entry["unloading"]:
+                return
+            entry["unloading"] = True
+        self.dispatcher.submit(entry["lane"], lambda: self._unload(name, reason))
+
+    def _unload(self, name, reason):
+        entry = self._engines[name]
+        try:
+            # 排队期间可能又被使用过，或同一子系统的其他工作线程仍在执行任务，
+            # 空闲卸载需要重新确认
+            if (
+                reason == "idle"
+                and self.idle_for(name, in_lane=True) < self.idle_timeout
+            ):
+                return
+            if not self._loaded(name):
+                return
+
+            cost = self.cost(name)
+            entry["unload"]()
+            gc.collect()
+            entry["unloads"] += 1
+            log_message(
+                f"[INFO] Engine '{name}' unloaded ({reason}, ~{cost // MB} MB)."
+            )
+            send_response({"type": "engine_unloaded", "engine": name, "reason": reason})
+        except Exception as e:
+            log_message(f"[ERROR] Failed to unload engine '{name}': {e}")
+        finally:
+            entry["unloading"] = False
+
+    def snapshot(self):
+        """stats 命令使用：各引擎是否常驻、内存占用与空闲时间"""
+        engines = {}
+        for name, entry in list(self._engines.items()):
+            loaded = self._loaded(name)
+            engines[name] = {
+                "loaded": loaded,
+                "bytes": self.cost(name),
+                "idle_s": round(self.idle_for(name), 1) if loaded else None,
+                "unloads": entry["unloads"],
+            }
+        return {
+            "idle_timeout_s": self.idle_timeout,
+            "budget": self.budget,
+            "resident_bytes": sum(e["bytes"] for e in engines.values() if e["loaded"]),
+            "engines": engines,
+        }
@@ -1,6 +1,11 @@
 # services/modules/tokenizer.py
+import functools
 from sudachipy import dictionary, SplitMode
 from .utils import log_message
+from .profiling import profiler
+
+# 片假名 (0x30A1 - 0x30F6) -> 平假名 的转换表
+KATAKANA_TO_HIRAGANA = {code: code - 0x60 for code in range(0x30A1, 0x30F7)}
 
 
 class JapaneseTokenizer:
@@ -20,12 +25,23 @@ class JapaneseTokenizer:
         "記号": "other",
     }
 
+    # 单个分词结果的记忆缓存大小 (常见词素直接复用)
+    token_cache_size = 8192
+
     def __init__(self):
+        self.dictionary = None
         self.tokenizer = None
         self.mode = SplitMode.C
+        # 以 (原词, 片假名读音, 词性 id) 为键缓存前端需要的字段，
+        # 同一词素在不同上下文中读音/词性不同时会得到不同的键
+        self._token_info = functools.lru_cache(maxsize=self.token_cache_size)(
+            self._build_token_info
+        )
         try:
             log_message("Initializing Sudachi Tokenizer...")
-            self.tokenizer = dictionary.Dictionary(dict="core").create()
+            with profiler.phase("tokenizer.create_dictionary"):
+                self.dictionary = dictionary.Dictionary(dict="core")
+                self.tokenizer = self.dictionary.create()
             log_message(" Tokenizer Initialized.")
         except Exception as e:
             log_message(f"[ERROR] Tokenizer Init Failed: {e}")
@@ -35,25 +51,29 @@ class JapaneseTokenizer:
     def _katakana_to_hiragana(self, text):
         """
         辅助函数：将片假名转换为平假名
-        利用 Unicode 偏移量：片假名 = 平假名 + 0x60
+        利用 Unicode 偏移量：片假名 = 平假名 + 0x60 (预先构建好的转换表)
         """
-        result = []
-        for char in text:
-            code = ord(char)
-            # 片假名 Unicode 范围 (0x30A1 - 0x30F6)
-            if 0x30A1 <= code <= 0x30F6:
-                result.append(chr(code - 0x60))
-            else:
-                result.append(char)
-        return "".join(result)
+        return text.translate(KATAKANA_TO_HIRAGANA)
+
+    def _build_token_info(self, surface, reading_katakana, pos_id):
+        # 1. 转换为平假名 (如 "たべる" 或 "ながら")
+        reading_hiragana = self._katakana_to_hiragana(reading_katakana)
+
+        # 2. 智能判断是否需要返回读音
+        # 如果原词和平假名读音一样（例如 "ながら" == "ながら"），就设为 None
+        # 或者原词就是片假名且读音也是片假名（例如 "ラーメン"），也设为 None
+        final_reading = None
+        if surface != reading_hiragana and surface != reading_katakana:
+            final_reading = reading_hiragana
+
+        main_pos = self.dictionary.pos_of(pos_id)[0]
+        frontend_type = self.POS_MAPPING.get(main_pos, "other")
+        return final_reading, frontend_type
 
     def tokenize(self, text):
         if not self.tokenizer:
             raise Exception(f"Tokenizer not ready")
 
-        # 调试日志：打印输入文本的 repr，查看是否有乱码
-        log_message(f"Tokenizing text: {repr(text)}")
-
         # 预处理：移除可能导致问题的特殊字符 (如 surrogates)
         # 仅保留基本多文种平面 (BMP) 和常见的扩展平面字符
         # 或者简单地忽略无法编码的字符
@@ -68,30 +88,21 @@ class JapaneseTokenizer:
         for t in results:
             surface = t.surface()  # 原词，例如 "食べる" 或 "ながら"
 
-            # 1. 获取读音 (Sudachi 默认返回片假名，如 "タベル" 或 "ナガラ")
-            reading_katakana = t.reading_form()
-
-            # 2. 转换为平假名 (如 "たべる" 或 "ながら")
-            reading_hiragana = self._katakana_to_hiragana(reading_katakana)
-
-            # 3. 智能判断是否需要返回读音
-            # 如果原词和平假名读音一样（例如 "ながら" == "ながら"），就设为 None
-            # 或者原词就是片假名且读音也是片假名（例如 "ラーメン"），也设为 None
-            final_reading = None
-            if surface != reading_hiragana and surface != reading_katakana:
-                final_reading = reading_hiragana
-
-            pos_list = t.part_of_speech()
-            main_pos = pos_list[0]
-            frontend_type = self.POS_MAPPING.get(main_pos, "other")
+            # 读音 (Sudachi 默认返回片假名，如 "タベル" 或 "ナガラ") 与词性
+            reading, frontend_type = self._token_info(
+                surface, t.reading_form(), t.part_of_speech_id()
+            )
 
             tokens.append(
                 {
                     "word": surface,
-                    "reading": final_reading,  # 新增字段：如果有值则显示，无值则不显示
+                    "reading": reading,  # 新增字段：如果有值则显示，无值则不显示
                     "type": frontend_type,
                 }
             )
 
-        log_message(f"Tokenization complete. Found {len(tokens)} tokens.")
         return tokens
+
+    def tokenize_batch(self, texts):
+        """一次请求处理一整页的 OCR 文本，结果顺序与输入一致"""
+        return [self.tokenize(text) for text in texts]
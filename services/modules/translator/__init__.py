@@ -2,9 +2,14 @@
 from .sakura_engine import SakuraEngine
 
 
-def get_translator_engine(engine_name, model_root_dir):
+def get_translator_engine(engine_name, model_root_dir, workers=1):
+    """workers > 1 时使用多进程翻译池，每个子进程持有一个模型实例"""
     # 现在我们只支持 sakura
     if engine_name == "sakura":
+        if workers > 1:
+            from .pool import TranslatorPool
+
+            return TranslatorPool(model_root_dir, workers=workers)
         return SakuraEngine(model_root_dir)
     else:
         raise ValueError(f"Unknown engine: {engine_name}")
@@ -12,10 +12,29 @@ class BaseTranslator(ABC):
         pass
 
     @abstractmethod
-    def translate(self, text):
-        """执行翻译"""
+    def translate(self, text, cancel_event=None, lookup=True):
+        """
+        执行翻译；cancel_event 被设置时应尽快抛出 RequestCancelled。
+        lookup=False：调用方已经查询过翻译记忆且未命中，不再重复查询
+        """
         pass
 
+    def translate_stream(self, text, cancel_event=None, lookup=True):
+        """流式翻译，逐段 yield 译文 (默认一次性返回完整结果)"""
+        yield self.translate(text, cancel_event, lookup)
+
+    def translate_batch(self, texts, cancel_event=None, lookup=True):
+        """批量翻译，结果顺序与输入一致 (默认逐条调用 translate)"""
+        return [self.translate(text, cancel_event, lookup) for text in texts]
+
+    def unload(self):
+        """释放已加载的模型，下次使用前需要重新 initialize() (默认不支持)"""
+        return False
+
+    def lookup_cached(self, text):
+        """查询翻译缓存，未命中返回 None (默认不缓存)"""
+        return None
+
     @abstractmethod
     def download_model(self, progress_callback=None):
         """下载模型文件"""
@@ -0,0 +1,484 @@
+# services/modules/translator/pool.py
+import os
+import sys
+import time
+import queue
+import threading
+import contextlib
+import multiprocessing
+from .base import BaseTranslator
+from .sakura_engine import SakuraEngine
+from ..utils import log_message, RequestCancelled
+from ..logger import logger
+
+
+def _worker_main(model_root_dir, settings, conn, cancel_event, log_level):
+    """
+    翻译子进程入口：加载自己的 Llama 实例，循环执行主进程发来的任务。
+    GGUF 以 use_mmap 加载，所有子进程映射同一个文件，权重在系统页缓存中只有一份。
+    """
+    # stdout 是与 Electron 通信的管道，子进程的任何输出 (包括 llama.cpp 的日志) 都改写到 stderr
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+    sys.stdout = sys.stderr
+    logger.set_level(log_level)
+
+    engine = SakuraEngine(model_root_dir, use_cache=False, track_manifest=False)
+    engine.apply_settings(settings)
+    engine.initialize()
+    if not engine.is_ready:
+        conn.send(("error", "Failed to load translation model"))
+        return
+    conn.send(("ready", engine.load_time))
+
+    operations = {
+        "translate": engine.translate,
+        "translate_batch": engine.translate_batch,
+    }
+    while True:
+        try:
+            op, payload = conn.recv()
+        except EOFError:
+            break
+        if op == "stop":
+            break
+
+        try:
+            if op == "ping":
+                conn.send(("pong", None))
+            elif op == "translate_stream":
+                for piece in engine.translate_stream(payload, cancel_event):
+                    conn.send(("chunk", piece))
+                conn.send(("result", None))
+            else:
+                conn.send(("result", operations[op](payload, cancel_event)))
+        except RequestCancelled:
+            conn.send(("cancelled", None))
+        except Exception as e:
+            conn.send(("error", str(e)))
+
+
+class _Job:
+    """一个提交给翻译池的任务；子进程的消息经由 events 队列交给调用方"""
+
+    def __init__(self, op, payload, cancel_event=None):
+        self.op = op
+        self.payload = payload
+        self.cancel_event = cancel_event or threading.Event()
+        # 调用方放弃结果 (例如流式读取提前结束)，不影响请求本身的取消状态
+        self.abandoned = threading.Event()
+        # ("chunk", 文本) / ("result", 结果) / ("cancelled", None) / ("error", 信息)
+        self.events = queue.Queue()
+
+    @property
+    def cancelled(self):
+        return self.cancel_event.is_set() or self.abandoned.is_set()
+
+
+class _Gate:
+    """翻译任务可以同时进入；加载 / 卸载 / 删除模型需要独占，等待进行中的翻译结束"""
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._active = 0
+        self._exclusive = False
+
+    @contextlib.contextmanager
+    def shared(self):
+        with self._cond:
+            while self._exclusive:
+                self._cond.wait()
+            self._active += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._active -= 1
+                self._cond.notify_all()
+
+    @contextlib.contextmanager
+    def exclusive(self):
+        with self._cond:
+            while self._exclusive:
+                self._cond.wait()
+            self._exclusive = True
+            while self._active:
+                self._cond.wait()
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._exclusive = False
+                self._cond.notify_all()
+
+
+class _Worker:
+    """一个翻译子进程，以及主进程中为它取任务、转发消息的服务线程"""
+
+    def __init__(self, pool, index):
+        self.pool = pool
+        self.index = index
+        self.process = None
+        self.conn = None
+        self.cancel_event = None
+        self.thread = None
+        self.restarts = 0
+        self.jobs = 0
+
+    def spawn(self):
+        """启动子进程并等待模型加载完成；失败时返回 False"""
+        context = self.pool.context
+        parent_conn, child_conn = context.Pipe()
+        self.cancel_event = context.Event()
+        self.process = context.Process(
+            target=_worker_main,
+            args=(
+                self.pool.model_root_dir,
+                self.pool.worker_settings(),
+                child_conn,
+                self.cancel_event,
+                logger.level,
+            ),
+            name=f"translator-{self.index}",
+            daemon=True,
+        )
+        self.process.start()
+        child_conn.close()
+        self.conn = parent_conn
+
+        kind, value = "error", "timed out while loading"
+        try:
+            if self.conn.poll(self.pool.load_timeout):
+                kind, value = self.conn.recv()
+        except (EOFError, OSError):
+            kind, value = "error", "exited while loading"
+
+        if kind != "ready":
+            log_message(f"[ERROR] Translator worker {self.index} failed: {value}")
+            self.kill()
+            return False
+        log_message(
+            f"[INFO] Translator worker {self.index} ready in {value:.2f}s "
+            f"(pid {self.process.pid})."
+        )
+        return True
+
+    def kill(self):
+        if self.process is not None and self.process.is_alive():
+            self.process.kill()
+            self.process.join(5)
+        if self.conn is not None:
+            self.conn.close()
+        self.process = None
+        self.conn = None
+
+    def stop(self):
+        """正常退出：通知子进程结束，超时则强制终止"""
+        if self.process is not None and self.process.is_alive():
+            try:
+                self.conn.send(("stop", None))
+                self.process.join(5)
+            except (EOFError, OSError):
+                pass
+        self.kill()
+
+    def respawn(self, reason):
+        log_message(f"[WARN] Restarting translator worker {self.index} ({reason}).")
+        self.kill()
+        self.restarts += 1
+        return self.spawn()
+
+    @property
+    def alive(self):
+        return self.process is not None and self.process.is_alive()
+
+    def serve(self):
+        """服务线程：从池的有界队列中取任务；空闲时定期做健康检查"""
+        while True:
+            try:
+                job = self.pool._jobs.get(timeout=self.pool.health_interval)
+            except queue.Empty:
+                if self.alive and not self._healthy():
+                    self.respawn("health check failed")
+                continue
+            if job is None:
+                break
+            self._execute(job)
+        self.stop()
+
+    def _healthy(self):
+        try:
+            self.conn.send(("ping", None))
+            if self.conn.poll(self.pool.health_timeout):
+                return self.conn.recv()[0] == "pong"
+        except (EOFError, OSError):
+            pass
+        return False
+
+    def _execute(self, job):
+        if job.cancelled:
+            job.events.put(("cancelled", None))
+            return
+        # 崩溃后重启失败的子进程，在下一个任务到来时再尝试一次
+        if not self.alive and not self.respawn("not running"):
+            job.events.put(("error", "Translator worker unavailable"))
+            return
+
+        self.jobs += 1
+        self.cancel_event.clear()
+        try:
+            self.conn.send((job.op, job.payload))
+            while True:
+                if self.conn.poll(0.1):
+                    kind, value = self.conn.recv()
+                    job.events.put((kind, value))
+                    if kind != "chunk":
+                        return
+                elif not self.process.is_alive():
+                    raise EOFError()
+                # 把请求的取消转发给子进程 (llama 每生成一个 token 检查一次)
+                if job.cancelled:
+                    self.cancel_event.set()
+        except (EOFError, OSError):
+            log_message(f"[ERROR] Translator worker {self.index} crashed.")
+            job.events.put(("error", "Translator worker crashed"))
+            self.respawn("crashed")
+
+
+class TranslatorPool(BaseTranslator):
+    """
+    多进程翻译池：每个子进程持有一个 Llama 实例，多条翻译 (以及批量翻译的各个分块)
+    可以在不同的 CPU 核心上同时进行；llama.cpp 崩溃只会结束对应的子进程，
+    主进程 (OCR / 分词) 不受影响，子进程会被自动重启。
+
+    主进程中的 SakuraEngine 不加载模型，只负责模型文件管理、翻译记忆与参数。
+    """
+
+    # 每个子进程最多排队的任务数：队列有界，池满时拒绝新任务而不是无限堆积
+    queue_per_worker = 4
+    submit_timeout = 30
+    # 空闲子进程的健康检查间隔与超时 (秒)
+    health_interval = 30
+    health_timeout = 10
+    load_timeout = 300
+
+    def __init__(self, model_root_dir, workers=2, use_cache=True):
+        self.engine = SakuraEngine(model_root_dir, use_cache=use_cache)
+        super().__init__(self.engine.model_dir)
+        self.model_root_dir = model_root_dir
+        self.workers = workers
+        # 可以同时执行的翻译命令数 (调度器据此为翻译队列创建工作线程)
+        self.concurrency = workers
+        self.cache = self.engine.cache
+        self.load_time = None
+        # spawn：子进程不继承主进程中已加载的 torch 等状态，Windows 上也是唯一选择
+        self.context = multiprocessing.get_context("spawn")
+        self._jobs = queue.Queue(maxsize=workers * self.queue_per_worker)
+        self._workers = []
+        self._gate = _Gate()
+
+    # --- 模型文件与参数：交给主进程中的 SakuraEngine ---
+    @property
+    def model_file_path(self):
+        return self.engine.model_file_path
+
+    def check_model_exists(self):
+        return self.engine.check_model_exists()
+
+    def download_model(self, progress_callback=None):
+        return self.engine.download_model(progress_callback)
+
+    def delete_model(self):
+        with self._gate.exclusive():
+            self._stop_workers()
+            return self.engine.delete_model()
+
+    def lookup_cached(self, text):
+        return self.engine.lookup_cached(text)
+
+    def settings(self):
+        return self.engine.settings()
+
+    def apply_settings(self, settings):
+        """新参数在子进程下一次启动 (initialize) 时生效"""
+        self.engine.apply_settings(settings)
+
+    def benchmark_settings(self, settings, texts, max_tokens=32):
+        # 在主进程中临时加载测速，期间停止所有子进程，避免争抢 CPU
+        with self._gate.exclusive():
+            self._stop_workers()
+            return self.engine.benchmark_settings(settings, texts, max_tokens)
+
+    def worker_settings(self):
+        """子进程的 llama 参数：线程数按子进程个数平分 CPU 核心，避免超额订阅"""
+        settings = self.engine.settings()
+        share = max(1, (os.cpu_count() or self.workers) // self.workers)
+        settings["n_threads"] = min(settings.get("n_threads") or share, share)
+        # 多个进程共享同一份权重依赖 mmap
+        settings["use_mmap"] = True
+        settings["use_mlock"] = False
+        return settings
+
+    # --- 子进程生命周期 ---
+    def initialize(self):
+        with self._gate.exclusive():
+            if self.is_ready:
+                return
+            if not self.engine.check_model_exists():
+                log_message("[WARN] Initialize failed. Model not found.")
+                return
+
+            log_message(f"[INFO] Starting {self.workers} translator workers...")
+            start = time.perf_counter()
+            workers = [_Worker(self, i) for i in range(self.workers)]
+            # 并行加载：各进程读取的是同一份页缓存
+            results = [None] * len(workers)
+
+            def spawn(i):
+                results[i] = workers[i].spawn()
+
+            threads = [
+                threading.Thread(target=spawn, args=(i,)) for i in range(len(workers))
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+            if not any(results):
+                log_message("[ERROR] No translator worker could be started.")
+                return
+
+            for worker in workers:
+                worker.thread = threading.Thread(
+                    target=worker.serve,
+                    name=f"translator-pool-{worker.index}",
+                    daemon=True,
+                )
+                worker.thread.start()
+            self._workers = workers
+            self.load_time = time.perf_counter() - start
+            self.is_ready = True
+            self.engine.refresh_manifest()
+
+    def unload(self):
+        with self._gate.exclusive():
+            return self._stop_workers()
+
+    def _stop_workers(self):
+        """调用方需持有独占 gate"""
+        if not self._workers:
+            return False
+        self.is_ready = False
+        for _ in self._workers:
+            self._jobs.put(None)
+        for worker in self._workers:
+            worker.thread.join()
+        self._workers = []
+        log_message("[INFO] Translator workers stopped.")
+        return True
+
+    def worker_stats(self):
+        """stats 命令使用：各子进程的状态、已执行任务数与重启次数"""
+        return [
+            {
+                "index": w.index,
+                "pid": w.process.pid if w.process is not None else None,
+                "alive": w.alive,
+                "jobs": w.jobs,
+                "restarts": w.restarts,
+            }
+            for w in self._workers
+        ]
+
+    # --- 翻译 ---
+    def _submit(self, op, payload, cancel_event=None):
+        if not self.is_ready:
+            raise Exception("Sakura Engine not ready")
+        job = _Job(op, payload, cancel_event)
+        try:
+            self._jobs.put(job, timeout=self.submit_timeout)
+        except queue.Full:
+            raise Exception("Translator pool is busy")
+        return job
+
+    @staticmethod
+    def _events(job):
+        """逐个产出 chunk，最终结果作为生成器的返回值"""
+        while True:
+            kind, value = job.events.get()
+            if kind == "chunk":
+                yield value
+            elif kind == "result":
+                return value
+            elif kind == "cancelled":
+                raise RequestCancelled()
+            else:
+                raise Exception(value)
+
+    def _result(self, job):
+        events = self._events(job)
+        while True:
+            try:
+                next(events)
+            except StopIteration as done:
+                return done.value
+
+    def _remember(self, text, translation):
+        if self.cache is not None and translation:
+            self.cache.put(self.engine._cache_key(text), translation)
+
+    def translate(self, text, cancel_event=None, lookup=True):
+        cached = self.lookup_cached(text) if lookup else None
+        if cached is not None:
+            return cached
+
+        with self._gate.shared():
+            translation = self._result(self._submit("translate", text, cancel_event))
+        self._remember(text, translation)
+        return translation
+
+    def translate_stream(self, text, cancel_event=None, lookup=True):
+        cached = self.lookup_cached(text) if lookup else None
+        if cached is not None:
+            yield cached
+            return
+
+        with self._gate.shared():
+            job = self._submit("translate_stream", text, cancel_event)
+            translation = ""
+            try:
+                for piece in self._events(job):
+                    translation += piece
+                    yield piece
+            finally:
+                # 调用方提前停止读取时让子进程也停止生成
+                job.abandoned.set()
+        self._remember(text, translation.strip())
+
+    def translate_batch(self, texts, cancel_event=None, lookup=True):
+        """未命中翻译记忆的行切分为与子进程数相同的连续分块，并行翻译"""
+        translations = [None] * len(texts)
+        pending = []
+        for i, text in enumerate(texts):
+            cached = self.lookup_cached(text) if lookup else None
+            if cached is not None:
+                translations[i] = cached
+            else:
+                pending.append(i)
+        if not pending:
+            return translations
+
+        with self._gate.shared():
+            size = -(-len(pending) // self.workers)
+            chunks = [pending[s : s + size] for s in range(0, len(pending), size)]
+            jobs = [
+                self._submit("translate_batch", [texts[i] for i in chunk], cancel_event)
+                for chunk in chunks
+            ]
+            for chunk, job in zip(chunks, jobs):
+                for i, translation in zip(chunk, self._result(job)):
+                    translations[i] = translation
+                    # 多行 prompt 的译文依赖上下文，只有单行分块按单句写入翻译记忆
+                    if len(chunk) == 1:
+                        self._remember(texts[i], translation)
+        return translations
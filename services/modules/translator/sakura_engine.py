@@ -1,22 +1,74 @@
 # services/modules/translator/sakura_engine.py
 import os
+import re
+import time
 import threading
 import shutil
 import sys
 import json
+import hashlib
+import unicodedata
 import contextlib
 from .base import BaseTranslator
-from huggingface_hub import hf_hub_download
-from ..utils import log_message, patch_tqdm
+from ..utils import log_message, RequestCancelled
+from ..cache import PersistentCache
+from ..metrics import metrics
+from ..downloader import ModelDownloader
+from ..progress import progress_bus
+from ..model_manifest import (
+    MANIFEST_CHANGED,
+    MANIFEST_CORRUPT,
+    MANIFEST_MISSING,
+    ModelManifest,
+)
 
 try:
-    from llama_cpp import Llama
+    from llama_cpp import Llama, StoppingCriteriaList
 except ImportError:
     Llama = None
+    StoppingCriteriaList = None
 
 
 class SakuraEngine(BaseTranslator):
-    def __init__(self, model_root_dir):
+    # ✅ 关键修正：调整推理参数
+    generation_params = {
+        "max_tokens": 512,
+        # 1. 扩充停止符：
+        #    Added "≒": 日志显示它进入了同义词解释循环
+        #    Added "\n": 只要换行就强制停止（短句翻译通常只需要一行）
+        "stop": ["<|im_end|>", "\n\n", "≒", "\n"],
+        "temperature": 0.1,
+        # 2. 增加重复惩罚 (关键!)
+        #    frequency_penalty > 0 会惩罚已经出现过的词，防止死循环
+        "frequency_penalty": 0.5,
+        "presence_penalty": 0.3,
+        # 3. 限制 top_p 采样，让结果更确定
+        "top_p": 0.9,
+    }
+
+    # 批量翻译：多行原文放在同一个 prompt 中，一行对应一行译文，
+    # 因此去掉换行停止符，由 <|im_end|> 结束生成
+    batch_generation_params = {
+        **generation_params,
+        "stop": ["<|im_end|>", "≒"],
+    }
+
+    system_prompt = "你是一个轻小说翻译模型，可以流畅通顺地以日本轻小说的风格将日文翻译成简体中文，并联系上下文正确使用人称代词，不擅自添加原文中没有的代词。"
+
+    # 上下文长度：批量翻译的 prompt 与译文都需要放进这里
+    n_ctx = 1024
+    # 单个批次中原文最多占用的 token 数 (其余留给 system prompt 与译文)
+    batch_source_tokens = n_ctx // 4
+
+    # 其余 llama 加载参数，可由硬件调优结果 (apply_settings) 覆盖
+    llama_settings = {
+        "n_threads": 4,
+        "n_batch": 512,
+        "use_mmap": True,
+        "use_mlock": False,
+    }
+
+    def __init__(self, model_root_dir, use_cache=True, track_manifest=True):
         path = os.path.join(model_root_dir, "sakura")
         super().__init__(path)
 
@@ -25,30 +77,80 @@ class SakuraEngine(BaseTranslator):
 
         # 为了更准确的判断，我们这里还是用 .gguf 结尾的文件路径
         self.model_file_path = os.path.join(self.model_dir, self.filename)
+        # 文件清单：启动时只比较 stat，大小不符 (截断) 的模型直接视为不存在
+        self.manifest = ModelManifest(self.model_dir)
+        # 翻译子进程不维护清单，由主进程统一更新
+        self.track_manifest = track_manifest
 
         self.llm = None
         self.lock = threading.Lock()
+        # 最近一次加载模型的耗时 (秒)
+        self.load_time = None
+
+        # 固定前缀 (system prompt + 对话模板) 评估后的 llama 状态快照，
+        # KV cache 中已经没有该前缀时恢复，只需对用户文本做 prefill
+        self._prefix_state = None
+        self._prefix_prompt = None
+        self._prefix_tokens = None
+
+        # 翻译记忆：同一句话 (拟声词、人名等) 只需要翻译一次
+        # 放在 sakura 目录之外，删除模型时单独清空
+        self.cache = None
+        if use_cache:
+            self.cache = PersistentCache(
+                os.path.join(model_root_dir, "translation_memory.sqlite3"),
+                table="translations",
+                capacity=2048,
+            )
+
+    def _cache_key(self, text):
+        """缓存键：归一化后的原文 + 模型文件名 + 采样参数"""
+        normalized = re.sub(r"\s+", " ", unicodedata.normalize("NFKC", text)).strip()
+        material = json.dumps(
+            [normalized, self.filename, self.generation_params],
+            ensure_ascii=False,
+            sort_keys=True,
+        )
+        return hashlib.sha1(material.encode("utf-8")).hexdigest()
+
+    def lookup_cached(self, text):
+        if self.cache is None:
+            return None
+        return self.cache.get(self._cache_key(text))
 
     def check_model_exists(self):
         # 检查物理文件是否存在
-        # 注意：使用 hf_hub_download 后，实际文件可能是一个 symlink 指向 .cache
-        # 但 os.path.exists 会自动追踪 symlink，所以逻辑是通用的
+        # 下载器校验通过后才把 .part 重命名为正式文件，存在即代表下载完整
+        # (旧版本用 hf_hub_download 下载的可能是指向 .cache 的 symlink，
+        #  os.path.exists 会自动追踪 symlink，所以逻辑是通用的)
         path = self.model_file_path
         exists = os.path.exists(path)
-        log_message(f"[INFO] [Check] Path: {path}")
-        log_message(f"[INFO] [Check] Exists: {exists}")
+        if exists:
+            status, files = self.manifest.check()
+            if status == MANIFEST_CORRUPT:
+                log_message(f"[WARN] Model file truncated or corrupt: {files}")
+                exists = False
+        log_message(f"[INFO] [Check] {path} exists: {exists}")
         return exists
 
+    def refresh_manifest(self):
+        """
+        模型加载成功后调用：还没有清单时在后台计算哈希并写入，
+        文件修改时间有变化时在后台重新校验 (不一致会标记为损坏，下次启动需要重新下载)
+        """
+        status, changed = self.manifest.check()
+        if status == MANIFEST_MISSING:
+            self.manifest.in_background(self.manifest.record, [self.filename])
+        elif status == MANIFEST_CHANGED:
+            self.manifest.in_background(self.manifest.verify, changed)
+
     def delete_model(self):
+        # 0. 翻译记忆与模型绑定，模型删除后一并清空
+        if self.cache is not None:
+            self.cache.clear()
+
         # 1. 释放内存
-        if self.llm:
-            log_message("[INFO] Unloading model...")
-            try:
-                del self.llm
-                self.llm = None
-                self.is_ready = False
-            except:
-                pass
+        self.unload()
 
         deleted = False
 
@@ -61,6 +163,19 @@ class SakuraEngine(BaseTranslator):
             except Exception as e:
                 log_message(f"[ERROR] Failed to delete model file: {e}")
 
+        # 未完成下载的断点文件
+        for suffix in (".part", ".part.json"):
+            partial = self.model_file_path + suffix
+            if os.path.exists(partial):
+                try:
+                    os.remove(partial)
+                    deleted = True
+                except Exception as e:
+                    log_message(f"[WARN] Failed to remove partial download: {e}")
+
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(self.manifest.path)
+
         # 3.  关键：清理 .cache 缓存
         # HuggingFace 的默认缓存结构通常在 models/translation/sakura/.cache
         # 我们把它整个干掉，这样才是真的“卸载”
@@ -75,23 +190,32 @@ class SakuraEngine(BaseTranslator):
 
         return deleted
 
+    def unload(self):
+        """释放 llama 模型与前缀快照；use_mmap 时权重仍在系统页缓存中，重新加载很快"""
+        with metrics.acquire(self.lock, "translator"):
+            if self.llm is None:
+                return False
+            log_message("[INFO] Unloading model...")
+            self.llm = None
+            self.is_ready = False
+            self._prefix_state = None
+            self._prefix_prompt = None
+            return True
+
     def download_model(self, progress_callback=None):
-        log_message(f"[INFO] Downloading SakuraLLM via HuggingFace Hub...")
+        log_message(f"[INFO] Downloading SakuraLLM...")
         log_message(f"   Repo: {self.repo_id}")
 
         try:
-            #  使用上下文管理器，只在下载期间开启“间谍模式”
-            with patch_tqdm(
-                msg_type="download_progress", msg_key="filename", default_msg="model"
-            ):
-                file_path = hf_hub_download(
-                    repo_id=self.repo_id,
-                    filename=self.filename,
-                    local_dir=self.model_dir,
-                    # 不再需要 local_dir_use_symlinks=False，
-                    # 现在的版本默认行为很智能，保留缓存机制更好
-                    token=False,
-                )
+            # 分段并行下载，中断后从 .part 断点续传，校验 sha256 后才放到正式路径
+            downloader = ModelDownloader(self.repo_id)
+            log_message(f"   Endpoint: {downloader.endpoint}")
+            with progress_bus.task(
+                "download_progress", "filename", self.filename
+            ) as task:
+                downloader.download(self.filename, self.model_dir, progress=task)
+            # 哈希在下载时已经校验过，直接写入清单
+            self.manifest.record([self.filename], hashes=downloader.verified)
 
             log_message("[INFO] SakuraLLM download complete.")
             return True
@@ -107,7 +231,7 @@ class SakuraEngine(BaseTranslator):
 
         model_path = self.model_file_path
 
-        if not os.path.exists(model_path):
+        if not self.check_model_exists():
             log_message(f"[WARN] Initialize failed. Model not found at: {model_path}")
             self.is_ready = False
             return
@@ -126,17 +250,19 @@ class SakuraEngine(BaseTranslator):
         try:
             log_message(f"[INFO] Loading SakuraLLM (CPU Mode) from: {model_path}")
 
-            # Force CPU mode to avoid GPU/driver issues causing access violations
-            self.llm = Llama(
-                model_path=model_path,
-                n_ctx=1024,
-                n_threads=4,
-                verbose=True,
-                n_gpu_layers=0,
-            )
+            start = time.perf_counter()
+            self.llm = self._create_llama(self.settings(), verbose=True)
+
+            # 新模型需要重新评估固定前缀
+            self._prefix_state = None
+            self._prefix_prompt = None
+            self._prepare_prefix()
 
+            self.load_time = time.perf_counter() - start
             self.is_ready = True
             log_message("[INFO] SakuraLLM Engine loaded.")
+            if self.track_manifest:
+                self.refresh_manifest()
         except Exception as e:
             import traceback
 
@@ -144,36 +270,150 @@ class SakuraEngine(BaseTranslator):
             log_message(f"[ERROR] Failed to load Sakura: {e}\nTraceback: {tb}")
             self.is_ready = False
 
-    def translate(self, text):
+    def settings(self):
+        """当前生效的 llama 加载参数 (含 n_ctx)"""
+        return {"n_ctx": self.n_ctx, **self.llama_settings}
+
+    def apply_settings(self, settings):
+        """应用调优得到的参数；已加载的模型需要重新 initialize() 才会生效"""
+        settings = dict(settings)
+        if "n_ctx" in settings:
+            self.n_ctx = int(settings.pop("n_ctx"))
+            self.batch_source_tokens = self.n_ctx // 4
+        known = {k: v for k, v in settings.items() if k in self.llama_settings}
+        self.llama_settings = {**self.llama_settings, **known}
+        log_message(f"[INFO] Translator settings: {self.settings()}")
+
+    def _create_llama(self, settings, verbose=False):
+        # Force CPU mode to avoid GPU/driver issues causing access violations
+        return Llama(
+            model_path=self.model_file_path,
+            verbose=verbose,
+            n_gpu_layers=0,
+            **settings,
+        )
+
+    def benchmark_settings(self, settings, texts, max_tokens=32):
+        """
+        用给定参数临时加载一个模型，依次翻译 texts，返回加载耗时与生成速度。
+        会卸载当前模型，调用方负责之后重新 initialize()。
+        """
+        if Llama is None:
+            raise Exception("llama-cpp-python not installed")
+
+        with metrics.acquire(self.lock, "translator"):
+            self.llm = None
+            self.is_ready = False
+            self._prefix_state = None
+            self._prefix_prompt = None
+
+            start = time.perf_counter()
+            llm = self._create_llama(settings)
+            load_s = time.perf_counter() - start
+
+            params = {**self.generation_params, "max_tokens": max_tokens}
+            # 评测时使用确定性解码，保证各组参数生成的 token 数一致
+            params["temperature"] = 0.0
+
+            tokens = 0
+            start = time.perf_counter()
+            for text in texts:
+                output = llm(self._build_prompt(text), echo=False, **params)
+                tokens += output.get("usage", {}).get("completion_tokens", 0)
+            latency_s = time.perf_counter() - start
+            del llm
+
+        return {
+            "load_s": round(load_s, 3),
+            "latency_s": round(latency_s, 3),
+            "tokens_per_s": round(tokens / latency_s, 2) if latency_s else None,
+        }
+
+    def _prompt_prefix(self):
+        """所有请求共享的固定前缀：system prompt + 对话模板，直到用户文本之前"""
+        return (
+            f"<|im_start|>system\n{self.system_prompt}<|im_end|>\n"
+            f"<|im_start|>user\n将下面的日文文本翻译成中文："
+        )
+
+    def _build_prompt(self, text):
+        return f"{self._prompt_prefix()}{text}<|im_end|>\n<|im_start|>assistant\n"
+
+    def _prepare_prefix(self):
+        """评估固定前缀并保存 llama 状态 (KV cache)；失败时退化为完整 prefill"""
+        prefix = self._prompt_prefix()
+        try:
+            # 与 create_completion 相同的分词方式，保证 token 序列是完整 prompt 的前缀
+            tokens = self.llm.tokenize(prefix.encode("utf-8"), special=True)
+            self.llm.reset()
+            self.llm.eval(tokens)
+            self._prefix_state = self.llm.save_state()
+            self._prefix_prompt = prefix
+            self._prefix_tokens = tokens
+            log_message(f"[INFO] Cached prompt prefix state ({len(tokens)} tokens).")
+        except Exception as e:
+            log_message(f"[WARN] Failed to cache prompt prefix: {e}")
+            self._prefix_state = None
+            self._prefix_prompt = None
+
+    def _restore_prefix(self):
+        """
+        生成之前确保 KV cache 中有固定前缀 (调用方需持有锁)。llama_cpp 会复用与
+        上次评估的 token 序列的最长公共前缀，上一次请求留下的 KV cache 通常已经
+        以该前缀开头，此时不需要复制整个状态；只有前缀被覆盖时才恢复快照。
+        system prompt 变化时重新评估。
+        """
+        if self._prefix_prompt != self._prompt_prefix():
+            self._prepare_prefix()
+        if self._prefix_state is None:
+            return
+        n = len(self._prefix_tokens)
+        if (
+            self.llm.n_tokens >= n
+            and list(self.llm.input_ids[:n]) == self._prefix_tokens
+        ):
+            return
+        self.llm.load_state(self._prefix_state)
+
+    @staticmethod
+    def _pack_line(text):
+        # 每个气泡必须占据恰好一行，才能按行拆分译文
+        return re.sub(r"\s+", " ", text).strip()
+
+    def _count_tokens(self, text):
+        return len(self.llm.tokenize(text.encode("utf-8"), add_bos=False))
+
+    def _check_cancelled(self, cancel_event):
+        if cancel_event is not None and cancel_event.is_set():
+            raise RequestCancelled()
+
+    def _stopping_criteria(self, cancel_event):
+        """llama 每生成一个 token 都会调用，取消后立即停止生成"""
+        if cancel_event is None or StoppingCriteriaList is None:
+            return None
+        return StoppingCriteriaList([lambda input_ids, logits: cancel_event.is_set()])
+
+    def translate(self, text, cancel_event=None, lookup=True):
+        # 先查翻译记忆 (不需要持有模型锁)
+        cached = self.lookup_cached(text) if lookup else None
+        if cached is not None:
+            return cached
+
         if not self.is_ready or not self.llm:
             raise Exception("Sakura Engine not ready")
 
-        with self.lock:
-            system_prompt = "你是一个轻小说翻译模型，可以流畅通顺地以日本轻小说的风格将日文翻译成简体中文，并联系上下文正确使用人称代词，不擅自添加原文中没有的代词。"
+        with metrics.acquire(self.lock, "translator"):
+            # 等锁期间可能已被新的请求取代
+            self._check_cancelled(cancel_event)
 
-            prompt = (
-                f"<|im_start|>system\n{system_prompt}<|im_end|>\n"
-                f"<|im_start|>user\n将下面的日文文本翻译成中文：{text}<|im_end|>\n"
-                f"<|im_start|>assistant\n"
-            )
-
-            # ✅ 关键修正：调整推理参数
+            self._restore_prefix()
             output = self.llm(
-                prompt,
-                max_tokens=512,
-                # 1. 扩充停止符：
-                #    Added "≒": 日志显示它进入了同义词解释循环
-                #    Added "\n": 只要换行就强制停止（短句翻译通常只需要一行）
-                stop=["<|im_end|>", "\n\n", "≒", "\n"],
+                self._build_prompt(text),
                 echo=False,
-                temperature=0.1,
-                # 2. 增加重复惩罚 (关键!)
-                #    frequency_penalty > 0 会惩罚已经出现过的词，防止死循环
-                frequency_penalty=0.5,
-                presence_penalty=0.3,
-                # 3. 限制 top_p 采样，让结果更确定
-                top_p=0.9,
+                stopping_criteria=self._stopping_criteria(cancel_event),
+                **self.generation_params,
             )
+            self._check_cancelled(cancel_event)
 
             try:
                 # 提取结果并再次清洗，防止漏网之鱼
@@ -184,7 +424,162 @@ class SakuraEngine(BaseTranslator):
                 if "\n" in translation:
                     translation = translation.split("\n")[0]
 
+                if self.cache is not None and translation:
+                    self.cache.put(self._cache_key(text), translation)
+
                 return translation
             except Exception as e:
                 log_message(f"Sakura output error: {e}")
                 return text
+
+    def translate_stream(self, text, cancel_event=None, lookup=True):
+        """
+        流式翻译：llama_cpp 每生成一段文本就 yield 一次增量。
+        停止符由 llama_cpp 处理，取第一行的清洗规则与 translate 一致。
+        """
+        cached = self.lookup_cached(text) if lookup else None
+        if cached is not None:
+            yield cached
+            return
+
+        if not self.is_ready or not self.llm:
+            raise Exception("Sakura Engine not ready")
+
+        with metrics.acquire(self.lock, "translator"):
+            self._check_cancelled(cancel_event)
+
+            self._restore_prefix()
+            stream = self.llm(
+                self._build_prompt(text),
+                echo=False,
+                stream=True,
+                **self.generation_params,
+            )
+
+            translation = ""
+            try:
+                for chunk in stream:
+                    self._check_cancelled(cancel_event)
+                    piece = chunk["choices"][0]["text"]
+                    # 去掉开头的空白 (对应 translate 中的 strip)
+                    if not translation:
+                        piece = piece.lstrip()
+
+                    # 只保留第一行
+                    finished = "\n" in piece
+                    if finished:
+                        piece = piece.split("\n")[0]
+
+                    if piece:
+                        translation += piece
+                        yield piece
+
+                    if finished:
+                        break
+            finally:
+                # 提前结束时关闭生成器，确保释放锁之前 llama 不再继续推理
+                stream.close()
+
+            translation = translation.strip()
+            if self.cache is not None and translation:
+                self.cache.put(self._cache_key(text), translation)
+
+    def translate_batch(self, texts, cancel_event=None, lookup=True):
+        """
+        批量翻译 (一页中的所有气泡)：未命中翻译记忆的行按 token 预算分组，
+        每组拼成一个多行 prompt，system prompt 只需计算一次，再按行拆分译文。
+        行数对不上时，该组回退为逐行翻译，保证结果与输入一一对应。
+        只有单独翻译的行 (单行分组、逐行回退) 会写入翻译记忆。
+        """
+        translations = [None] * len(texts)
+        pending = []
+        for i, text in enumerate(texts):
+            line = self._pack_line(text)
+            if not line:
+                translations[i] = ""
+                continue
+            cached = self.lookup_cached(text) if lookup else None
+            if cached is not None:
+                translations[i] = cached
+            else:
+                pending.append((i, line))
+
+        if not pending:
+            return translations
+
+        if not self.is_ready or not self.llm:
+            raise Exception("Sakura Engine not ready")
+
+        with metrics.acquire(self.lock, "translator"):
+            for group in self._group_by_budget(pending):
+                self._check_cancelled(cancel_event)
+                lines = [line for _, line in group]
+                results = self._translate_group(lines, cancel_event)
+                for (i, _), translation in zip(group, results):
+                    translations[i] = translation
+
+        return translations
+
+    def _group_by_budget(self, pending):
+        """按原文 token 数把待翻译的行分组，保证每组的 prompt 与译文能放进 n_ctx"""
+        group, used = [], 0
+        for item in pending:
+            tokens = self._count_tokens(item[1]) + 1
+            if group and used + tokens > self.batch_source_tokens:
+                yield group
+                group, used = [], 0
+            group.append(item)
+            used += tokens
+        if group:
+            yield group
+
+    def _translate_group(self, lines, cancel_event=None):
+        if len(lines) == 1:
+            return [self._translate_uncached(lines[0], cancel_event)]
+
+        prompt = self._build_prompt("\n" + "\n".join(lines))
+        params = dict(self.batch_generation_params)
+        params["max_tokens"] = self.n_ctx - self._count_tokens(prompt)
+
+        self._restore_prefix()
+        output = self.llm(
+            prompt,
+            echo=False,
+            stopping_criteria=self._stopping_criteria(cancel_event),
+            **params,
+        )
+        self._check_cancelled(cancel_event)
+
+        result = [
+            line.strip()
+            for line in output["choices"][0]["text"].strip().split("\n")
+            if line.strip()
+        ]
+        if len(result) == len(lines):
+            return result
+
+        log_message(
+            f"[WARN] Batch translation returned {len(result)} lines for "
+            f"{len(lines)} inputs, falling back to per-line translation."
+        )
+        return [self._translate_uncached(line, cancel_event) for line in lines]
+
+    def _translate_uncached(self, text, cancel_event=None):
+        """
+        逐行回退：与 translate 相同的单行生成 (调用方已持有锁)。
+        只有这里的结果写入翻译记忆：多行 prompt 中的译文带有其他行的上下文，
+        且使用不同的采样参数，不能当作单句翻译返回
+        """
+        self._check_cancelled(cancel_event)
+        self._restore_prefix()
+        output = self.llm(
+            self._build_prompt(text),
+            echo=False,
+            stopping_criteria=self._stopping_criteria(cancel_event),
+            **self.generation_params,
+        )
+        self._check_cancelled(cancel_event)
+        translation = output["choices"][0]["text"].strip().split("\n")[0]
+        if self.cache is not None and translation:
+            self.cache.put(self._cache_key(text), translation)
+        return translation
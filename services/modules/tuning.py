@@ -0,0 +1,206 @@
+# services/modules/tuning.py
+import os
+import json
+import time
+import platform
+from .utils import log_message, send_response, RequestCancelled
+
+PROFILE_VERSION = 1
+# 调优结果保存在 models 目录下
+PROFILE_FILENAME = "tuning_profile.json"
+# 分别调优、分别保存的部分
+PROFILE_SECTIONS = ("translator", "ocr")
+
+# 评测用的短句，长度与常见的漫画气泡相近
+SAMPLE_TEXTS = [
+    "どうしてこんなところにいるの？",
+    "ちょっと待って！まだ話は終わってない",
+    "ありがとう、助かったよ",
+]
+
+# 非默认候选至少要快这么多才会被采用，避免测量噪声导致来回切换
+MIN_IMPROVEMENT = 0.03
+# 更大的上下文只在延迟增加不超过该比例时采用
+CTX_TOLERANCE = 0.05
+
+
+def machine_signature():
+    """调优结果只对同一台机器有效"""
+    return {
+        "cpu_count": os.cpu_count(),
+        "machine": platform.machine(),
+        "system": platform.system(),
+    }
+
+
+def thread_candidates(cpu_count=None):
+    """
+    候选线程数：大多数 x86 CPU 开启了超线程，物理核心约为逻辑核心的一半，
+    llama.cpp / torch 通常在物理核心数附近最快，但也包含逻辑核心数与旧默认值 4
+    """
+    cpu = cpu_count or os.cpu_count() or 4
+    physical = max(1, cpu // 2) if cpu >= 4 else cpu
+    return sorted({max(1, physical // 2), physical, min(4, cpu), cpu})
+
+
+def load_profile(path):
+    """读取调优结果；文件不存在、损坏或来自其他硬件时返回 None"""
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            profile = json.load(f)
+    except Exception as e:
+        log_message(f"[WARN] Failed to read tuning profile: {e}")
+        return None
+
+    if profile.get("version") != PROFILE_VERSION:
+        return None
+    if profile.get("hardware") != machine_signature():
+        log_message("[INFO] Tuning profile was created on other hardware, ignored.")
+        return None
+    return profile
+
+
+def merge_profile(path, profile):
+    """
+    把本次重新测量的部分 (translator / ocr) 合并进已有的调优结果：
+    翻译模型未安装、OCR 仍在加载等原因跳过的部分保留上一次的结果
+    """
+    previous = load_profile(path) or {}
+    sections = {k: v for k, v in previous.items() if k in PROFILE_SECTIONS}
+    return {**sections, **profile}
+
+
+def save_profile(path, profile):
+    profile = {
+        "version": PROFILE_VERSION,
+        "hardware": machine_signature(),
+        "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+        **profile,
+    }
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(profile, f, ensure_ascii=False, indent=2)
+    log_message(f"[INFO] Tuning profile saved to {path}")
+    return profile
+
+
+def _report(stage, message):
+    send_response({"type": "tune_progress", "stage": stage, "message": message})
+
+
+def _check_cancelled(cancel_event):
+    if cancel_event is not None and cancel_event.is_set():
+        raise RequestCancelled()
+
+
+def _pick(options, measure, tolerance=MIN_IMPROVEMENT):
+    """第一个选项为默认值；其他选项必须比它快 tolerance 以上才会胜出"""
+    scores = {option: measure(option) for option in options}
+    best = options[0]
+    for option in options[1:]:
+        if scores[option] < scores[best] * (1 - tolerance):
+            best = option
+    return best
+
+
+def tune_translator(translator, cancel_event=None, search_mlock=True):
+    """
+    依次搜索 n_threads -> n_batch -> use_mlock -> n_ctx (坐标下降)，
+    每组参数都重新加载模型并翻译 SAMPLE_TEXTS。返回最佳参数与全部测量结果。
+    search_mlock=False 时保持当前的 use_mlock (模型可能被卸载时不能锁定内存)
+    """
+    base = translator.settings()
+    results = {}
+
+    def measure(settings):
+        _check_cancelled(cancel_event)
+        key = json.dumps(settings, sort_keys=True)
+        if key not in results:
+            _report("translator", f"Testing {settings}")
+            metrics = translator.benchmark_settings(settings, SAMPLE_TEXTS)
+            results[key] = {"settings": settings, **metrics}
+        return results[key]["latency_s"]
+
+    # 预热：第一次加载需要从磁盘读取模型文件，不参与比较
+    _report("translator", "Warming up...")
+    translator.benchmark_settings(base, SAMPLE_TEXTS[:1])
+
+    # 以当前线程数为默认值排在第一位
+    threads = [base["n_threads"]] + [
+        n for n in thread_candidates() if n != base["n_threads"]
+    ]
+    base["n_threads"] = _pick(threads, lambda n: measure({**base, "n_threads": n}))
+
+    batches = [base["n_batch"]] + [n for n in (128, 512) if n != base["n_batch"]]
+    base["n_batch"] = _pick(batches, lambda n: measure({**base, "n_batch": n}))
+
+    if search_mlock:
+        base["use_mlock"] = _pick(
+            [base["use_mlock"], not base["use_mlock"]],
+            lambda v: measure({**base, "use_mlock": v}),
+        )
+
+    # 更大的上下文允许一次批量翻译更多气泡，只要不明显变慢就采用
+    reference = measure(base)
+    for n_ctx in (4096,):
+        if n_ctx > base["n_ctx"]:
+            if measure({**base, "n_ctx": n_ctx}) <= reference * (1 + CTX_TOLERANCE):
+                base["n_ctx"] = n_ctx
+
+    return {"settings": base, "results": list(results.values())}
+
+
+def _synthetic_crops(count=4):
+    """OCR 调优用的合成图像：只关心耗时，内容是随意的笔画"""
+    from PIL import Image, ImageDraw
+
+    crops = []
+    for i in range(count):
+        img = Image.new("RGB", (64, 160 + 40 * i), "white")
+        draw = ImageDraw.Draw(img)
+        for y in range(10, img.height - 20, 36):
+            draw.line((16, y, 48, y + 24), fill="black", width=4)
+            draw.line((48, y, 16, y + 24), fill="black", width=4)
+        crops.append(img)
+    return crops
+
+
+def tune_ocr(ocr_engine, cancel_event=None, repeat=2, max_length=32):
+    """只调 intra-op 线程数；仅支持运行时修改线程数的后端 (torch)"""
+    model = ocr_engine.model
+    if not hasattr(model, "set_num_threads"):
+        log_message(f"[INFO] OCR backend '{model.name}' does not support tuning.")
+        return None
+
+    from .ocr_preprocess import prepare
+
+    crops = [
+        prepare(img, ocr_engine.padding, ocr_engine.max_side)
+        for img in _synthetic_crops()
+    ]
+    results = []
+
+    def measure(n):
+        _check_cancelled(cancel_event)
+        _report("ocr", f"Testing num_threads={n}")
+        model.set_num_threads(n)
+        # 预热，使线程池按新的线程数创建
+        model.run_batch(crops[:1], max_length=max_length, greedy=True)
+        start = time.perf_counter()
+        for _ in range(repeat):
+            model.run_batch(crops, max_length=max_length, greedy=True)
+        latency_s = round((time.perf_counter() - start) / repeat, 3)
+        results.append({"settings": {"num_threads": n}, "latency_s": latency_s})
+        return latency_s
+
+    current = model.get_num_threads()
+    threads = [current] + [n for n in thread_candidates() if n != current]
+    best = current
+    try:
+        best = _pick(threads, measure)
+    finally:
+        # 取消或出错时恢复原来的线程数，而不是停留在最后一个候选值
+        model.set_num_threads(best)
+    return {"settings": {"num_threads": best}, "results": results}
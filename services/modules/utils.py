@@ -1,23 +1,55 @@
 # services/modules/utils.py
 import sys
 import json
-import os
-import contextlib
-import tqdm
+import threading
+from .logger import logger, tagged_level
 
+# stdout 由多个工作线程共享，写入时必须加锁，防止两条 JSON 交错成一行
+_stdout_lock = threading.Lock()
 
-def log_message(message):
-    """输出日志到 stderr (Electron console 会显示)"""
-    print(f"[Backend Service] {message}", file=sys.stderr, flush=True)
+# 当前使用的 IPC 协议 (见 modules/ipc.py)，为 None 时使用默认的行协议
+_protocol = None
+
+
+def set_protocol(protocol):
+    """切换 send_response 使用的 IPC 协议"""
+    global _protocol
+    _protocol = protocol
+
+
+class RequestCancelled(Exception):
+    """请求被 cancel 命令或更新的请求取消"""
+
+    def __init__(self, message="cancelled"):
+        super().__init__(message)
+
+
+def log_message(message, *args, level=None):
+    """
+    输出日志到 stderr (Electron console 会显示)，由 logger 的后台线程写出。
+    level 为 None 时按消息开头的 "[INFO]" 等标记判断级别；
+    指定 level 时消息可以带 % 格式参数，该级别既不输出也不记录时不做任何处理，
+    否则只在写入 stderr 或导出最近日志时才格式化
+    """
+    if level is None:
+        logger.log(tagged_level(message), message, *args)
+    elif level >= logger.threshold:
+        logger.log(level, message, *args, tag=True)
 
 
 def send_response(response):
     """发送 JSON 响应到 stdout (Electron 通过 stdio 接收)"""
     try:
+        if _protocol is not None:
+            _protocol.send(response)
+            return
+
         # ensure_ascii=True 是最安全的做法，它会将非 ASCII 字符转义为 \uXXXX
         # Electron 的 JSON.parse 可以完美解析这些转义字符，还原为正确文字
         # 这样可以彻底避免 Python 和 Node 之间的编码不一致导致的乱码
-        print(json.dumps(response, ensure_ascii=True), flush=True)
+        line = json.dumps(response, ensure_ascii=True)
+        with _stdout_lock:
+            print(line, flush=True)
     except Exception as e:
         # 如果连报错都发不出去，那就只能写 stderr 了
         print(
@@ -25,68 +57,3 @@ def send_response(response):
             file=sys.stderr,
             flush=True,
         )
-
-
-# --- TQDM Patching for Electron Progress Bar ---
-
-_original_init = tqdm.tqdm.__init__
-_original_update = tqdm.tqdm.update
-
-# Global config for the current patch session
-_tqdm_config = {
-    "type": "progress",
-    "msg_key": "message",
-    "msg_value": "Loading...",
-}
-
-
-def _patched_init(self, *args, **kwargs):
-    # 1. 强制开启进度条
-    kwargs["disable"] = False
-    # 2. 将原始的视觉进度条重定向到空设备 (devnull)
-    # 这样控制台就不会出现 ████▌ 这种字符，避免干扰 JSON 解析
-    kwargs["file"] = open(os.devnull, "w")
-    _original_init(self, *args, **kwargs)
-    self.last_percent = -1
-
-
-def _patched_update(self, n=1):
-    # 调用原始 update 更新内部计数器
-    _original_update(self, n)
-
-    # 计算百分比并输出 JSON
-    if self.total and self.total > 0:
-        percent = (self.n / self.total) * 100
-
-        # 过滤频率：每 0.5% 发送一次
-        if int(percent * 2) > getattr(self, "last_percent", -1):
-            self.last_percent = int(percent * 2)
-
-            msg = {
-                "type": _tqdm_config["type"],
-                "percent": round(percent, 1),
-                _tqdm_config["msg_key"]: self.desc or _tqdm_config["msg_value"],
-            }
-            # 显式写入 stdout 并 flush，确保 Electron 能立即收到
-            sys.stdout.write(json.dumps(msg) + "\n")
-            sys.stdout.flush()
-
-
-@contextlib.contextmanager
-def patch_tqdm(msg_type="progress", msg_key="message", default_msg="Loading..."):
-    """
-    上下文管理器：在代码块执行期间，替换 tqdm 的行为以输出 JSON 格式进度
-    """
-    global _tqdm_config
-    _tqdm_config["type"] = msg_type
-    _tqdm_config["msg_key"] = msg_key
-    _tqdm_config["msg_value"] = default_msg
-
-    tqdm.tqdm.__init__ = _patched_init
-    tqdm.tqdm.update = _patched_update
-    try:
-        yield
-    finally:
-        # 还原方法，避免影响其他模块
-        tqdm.tqdm.__init__ = _original_init
-        tqdm.tqdm.update = _original_update
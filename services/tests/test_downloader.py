@@ -0,0 +1,201 @@
+# services/tests/test_downloader.py
+"""
+ModelDownloader 对本地 HTTP 测试服务器的端到端测试：
+分段并行下载、断点续传、不支持 Range 时的单连接下载、哈希不符时拒绝并清理断点文件。
+
+用法 (在 services 目录下):
+    python -m pytest tests
+    python -m unittest discover -s tests
+"""
+
+import os
+import re
+import sys
+import json
+import shutil
+import hashlib
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from modules.downloader import ModelDownloader  # noqa: E402
+
+REPO = "org/model"
+KB = 1024
+
+
+class _HubHandler(BaseHTTPRequestHandler):
+    """
+    模拟 HuggingFace Hub：/resolve 对 LFS 文件返回 302 + X-Linked-Size / X-Linked-Etag，
+    普通文件直接返回内容 (ETag 为 git blob sha1)；/cdn 提供 LFS 文件内容与 Range 请求
+    """
+
+    def log_message(self, *args):
+        pass
+
+    def do_HEAD(self):
+        self._handle(head=True)
+
+    def do_GET(self):
+        self._handle(head=False)
+
+    def _send(self, status, body=b"", headers=None, head=False):
+        self.send_response(status)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if not head:
+            self.wfile.write(body)
+
+    def _handle(self, head):
+        hub = self.server.hub
+        path = self.path
+
+        if path.startswith("/api/models/"):
+            siblings = [{"rfilename": name} for name in hub.files]
+            return self._send(200, json.dumps({"siblings": siblings}).encode())
+
+        match = re.fullmatch(rf"/{REPO}/resolve/main/(.+)", path)
+        if match:
+            name = match.group(1)
+            data = hub.files[name]
+            if name in hub.lfs:
+                sha256 = hub.etags.get(name) or hashlib.sha256(data).hexdigest()
+                headers = {
+                    "Location": f"/cdn/{name}",
+                    "X-Linked-Size": str(len(data)),
+                    "X-Linked-Etag": f'"{sha256}"',
+                }
+                return self._send(302, headers=headers, head=head)
+            sha1 = hashlib.sha1(b"blob %d\0" % len(data) + data).hexdigest()
+            return self._send(200, data, {"ETag": f'"{sha1}"'}, head=head)
+
+        if path.startswith("/cdn/"):
+            data = hub.files[path[len("/cdn/") :]]
+            header = self.headers.get("Range")
+            if header and hub.ranges:
+                start, end = map(int, header[len("bytes=") :].split("-"))
+                with hub.lock:
+                    hub.requested.append((start, end + 1))
+                headers = {"Content-Range": f"bytes {start}-{end}/{len(data)}"}
+                return self._send(206, data[start : end + 1], headers, head=head)
+            with hub.lock:
+                hub.requested.append((0, len(data)))
+            return self._send(200, data, head=head)
+
+        self._send(404, head=head)
+
+
+class _Hub:
+    def __init__(self):
+        self.files = {}
+        self.lfs = set()
+        # 文件名 -> 仓库报告的 sha256 (默认为真实哈希)
+        self.etags = {}
+        self.ranges = True
+        self.requested = []
+        self.lock = threading.Lock()
+
+
+class DownloaderTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), _HubHandler)
+        cls.thread = threading.Thread(target=cls.server.serve_forever, daemon=True)
+        cls.thread.start()
+        cls.endpoint = f"http://127.0.0.1:{cls.server.server_port}"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        self.hub = self.server.hub = _Hub()
+        self.weights = os.urandom(300 * KB + 123)
+        self.config = b'{"model_type": "test"}\n'
+        self.hub.files = {"model.bin": self.weights, "sub/config.json": self.config}
+        self.hub.lfs = {"model.bin"}
+        self.dest = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dest, ignore_errors=True)
+
+    def downloader(self):
+        downloader = ModelDownloader(REPO, endpoint=self.endpoint)
+        downloader.chunk_size = 64 * KB
+        downloader.retries = 0
+        return downloader
+
+    def read(self, name):
+        with open(os.path.join(self.dest, name), "rb") as f:
+            return f.read()
+
+    def leftovers(self, name):
+        path = os.path.join(self.dest, name)
+        return [p for p in (path + ".part", path + ".part.json") if os.path.exists(p)]
+
+    def test_parallel_ranged_snapshot(self):
+        downloader = self.downloader()
+        files = downloader.download_snapshot(self.dest)
+
+        self.assertEqual(sorted(files), ["model.bin", "sub/config.json"])
+        self.assertEqual(self.read("model.bin"), self.weights)
+        self.assertEqual(self.read("sub/config.json"), self.config)
+        # 5 个 64KB 区间，覆盖整个文件且互不重叠
+        ranges = sorted(self.hub.requested)
+        self.assertEqual(len(ranges), 5)
+        self.assertEqual(ranges[0][0], 0)
+        self.assertEqual(ranges[-1][1], len(self.weights))
+        for (_, end), (start, _) in zip(ranges, ranges[1:]):
+            self.assertEqual(end, start)
+        self.assertEqual(
+            downloader.verified["model.bin"], hashlib.sha256(self.weights).hexdigest()
+        )
+        self.assertEqual(self.leftovers("model.bin"), [])
+
+    def test_resume_from_partial_download(self):
+        downloader = self.downloader()
+        info = downloader.file_info("model.bin")
+        half = 128 * KB
+
+        # 上一次下载完成了前 128KB
+        part = os.path.join(self.dest, "model.bin.part")
+        with open(part, "wb") as f:
+            f.write(self.weights[:half])
+            f.truncate(len(self.weights))
+        with open(part + ".json", "w", encoding="utf-8") as f:
+            state = {"size": info["size"], "hash": info["hash"], "done": [[0, half]]}
+            json.dump(state, f)
+
+        downloader.download("model.bin", self.dest)
+
+        self.assertEqual(self.read("model.bin"), self.weights)
+        self.assertTrue(self.hub.requested)
+        self.assertTrue(all(start >= half for start, _ in self.hub.requested))
+        self.assertEqual(self.leftovers("model.bin"), [])
+
+    def test_single_stream_without_range_support(self):
+        self.hub.ranges = False
+
+        self.downloader().download("model.bin", self.dest)
+
+        self.assertEqual(self.read("model.bin"), self.weights)
+        # 第一个区间请求得到完整的 200 响应后，改为一次下载整个文件
+        self.assertEqual(self.hub.requested[-1], (0, len(self.weights)))
+        self.assertEqual(self.leftovers("model.bin"), [])
+
+    def test_checksum_mismatch_is_rejected(self):
+        self.hub.etags["model.bin"] = "0" * 64
+
+        with self.assertRaisesRegex(RuntimeError, "Checksum mismatch"):
+            self.downloader().download("model.bin", self.dest)
+
+        self.assertFalse(os.path.exists(os.path.join(self.dest, "model.bin")))
+        self.assertEqual(self.leftovers("model.bin"), [])
+
+
+if __name__ == "__main__":
+    unittest.main()